@@ -0,0 +1,28 @@
+"""
+ASGI config for FoodProject project.
+
+It exposes the ASGI callable as a module-level variable named ``application``
+for ASGI servers such as uvicorn, daphne or hypercorn. Django discovers this
+application via the ``ASGI_APPLICATION`` setting.
+
+Under ASGI the read-heavy views (``index``, ``product_list``,
+``product_statistics``, ``recommendations``) run natively as coroutines on
+the async ORM, so a slow page does not hold up other requests.
+
+For more information, visit
+https://docs.djangoproject.com/en/stable/howto/deployment/asgi/
+"""
+
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault(
+    'DJANGO_SETTINGS_MODULE',
+    'FoodProject.settings')
+
+application = get_asgi_application()
+
+# Индекс рецептов строится при старте процесса, а не в первом запросе
+from app.recipes import get_recipe_index  # noqa: E402
+
+get_recipe_index()
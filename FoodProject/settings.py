@@ -14,7 +14,7 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
-    'django.contrib.staticfiles',
+    'app.apps.AssetsConfig',
     'app',
     'crispy_forms',
     'crispy_bootstrap5',
@@ -22,10 +22,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.compression.CompressionMiddleware',
+    'app.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'app.middleware.ReplicaPinMiddleware',
+    'app.middleware.SessionCleanupMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -36,19 +40,31 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'app.context_processors.fragment_cache',
+            ],
+            # Скомпилированные шаблоны хранятся в памяти процесса; с DEBUG
+            # шаблоны перечитываются с диска при каждом рендеринге
+            'loaders': [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ] if DEBUG else [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'FoodProject.wsgi.application'
+ASGI_APPLICATION = 'FoodProject.asgi.application'
 
 DATABASES = {
     'default': {
@@ -57,6 +73,99 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: пути к копиям SQLite через запятую.
+# В тестах реплики смотрят в тестовую основную БД.
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+    filter(None, os.environ.get('FRESHTRACKER_DB_REPLICAS', '').split(',')), 1
+):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+# Шарды продуктов: пути к файлам SQLite через запятую; продукты
+# пользователя хранятся в одном из них по хэшу user_id
+PRODUCT_SHARDS = []
+for number, path in enumerate(
+    filter(None, os.environ.get('FRESHTRACKER_PRODUCT_SHARDS', '').split(',')), 1
+):
+    DATABASES[f'shard{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path.strip(),
+    }
+    PRODUCT_SHARDS.append(f'shard{number}')
+DATABASE_ROUTERS = ['app.routers.ShardRouter', 'app.routers.ReplicaRouter']
+# Сколько секунд после записи клиент читает из основной БД
+REPLICA_LAG = int(os.environ.get('FRESHTRACKER_REPLICA_LAG', 10))
+# Через сколько дней после использования или списания продукт уходит в архив
+ARCHIVE_AFTER_DAYS = int(os.environ.get('FRESHTRACKER_ARCHIVE_AFTER_DAYS', 30))
+# Память процесса (МБ) под снимки активных продуктов пользователей; 0 - без снимков
+INVENTORY_SNAPSHOT_MB = float(os.environ.get('FRESHTRACKER_INVENTORY_SNAPSHOT_MB', 0))
+
+# Очередь задач (manage.py run_jobs): число процессов или потоков воркера,
+# задержка первого повтора упавшей задачи и через сколько секунд задача
+# с молчащим воркером возвращается в очередь (выполняющаяся задача
+# обновляет locked_at раз в треть этого времени)
+JOB_WORKERS = int(os.environ.get('FRESHTRACKER_JOB_WORKERS', 2))
+JOB_RETRY_DELAY = int(os.environ.get('FRESHTRACKER_JOB_RETRY_DELAY', 10))
+JOB_TIMEOUT = int(os.environ.get('FRESHTRACKER_JOB_TIMEOUT', 600))
+
+# Сжатие ответов приложения (br при установленном brotli, иначе gzip):
+# типы содержимого и минимальный размер тела в байтах
+COMPRESS_CONTENT_TYPES = [
+    'text/html', 'text/plain', 'text/css', 'text/javascript', 'application/javascript',
+    'application/json', 'text/calendar', 'image/svg+xml',
+]
+COMPRESS_MIN_SIZE = int(os.environ.get('FRESHTRACKER_COMPRESS_MIN_SIZE', 1024))
+# Схлопывать отступы и пустые строки в HTML-ответах
+HTML_MINIFY = os.environ.get('FRESHTRACKER_HTML_MINIFY', '1') != '0'
+
+# Общий кэш: file - разделяется между воркерами и переживает перезапуск,
+# memory - только внутри процесса
+CACHE_BACKENDS = {
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memory': 'django.core.cache.backends.locmem.LocMemCache',
+}
+CACHE_DIR = BASE_DIR / '.cache'
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[os.environ.get('FRESHTRACKER_CACHE', 'file')],
+        'LOCATION': str(CACHE_DIR / 'default'),
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'sessions': {
+        'BACKEND': CACHE_BACKENDS[os.environ.get('FRESHTRACKER_SESSION_CACHE', 'file')],
+        'LOCATION': str(CACHE_DIR / 'sessions'),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# Хранилище сессий: db, cache, cached_db или signed_cookies
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('FRESHTRACKER_SESSION_ENGINE', 'cached_db')]
+SESSION_CACHE_ALIAS = 'sessions'
+# Как часто (в секундах) удалять просроченные сессии в фоне
+SESSION_CLEANUP_INTERVAL = int(os.environ.get('FRESHTRACKER_SESSION_CLEANUP_INTERVAL', 3600))
+
+# Справочник продуктов для автодополнения (TSV)
+PRODUCT_CATALOG_PATH = os.environ.get(
+    'FRESHTRACKER_PRODUCT_CATALOG', str(BASE_DIR / 'app' / 'data' / 'catalog.tsv')
+)
+# Корпус рецептов для подбора по продуктам (TSV)
+RECIPES_PATH = os.environ.get(
+    'FRESHTRACKER_RECIPES', str(BASE_DIR / 'app' / 'data' / 'recipes.tsv')
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -79,10 +188,12 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_URL = 'static/'
-STATICFILES_DIRS = [
-    BASE_DIR / 'app/static',  
-]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+# collectstatic: имена с хэшем, минификация и копии .gz/.br
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'app.staticfiles.CompressedManifestStaticFilesStorage'},
+}
 
 
 LOGIN_URL = 'login'
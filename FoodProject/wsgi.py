@@ -27,3 +27,8 @@ os.environ.setdefault(
 # file. This includes Django's development server, if the WSGI_APPLICATION
 # setting points here.
 application = get_wsgi_application()
+
+# Индекс рецептов строится при старте процесса, а не в первом запросе
+from app.recipes import get_recipe_index  # noqa: E402
+
+get_recipe_index()
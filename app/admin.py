@@ -1,6 +1,14 @@
+from urllib.parse import parse_qs
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.auth.models import User
 from django.utils.html import format_html
-from .models import Category, Product, RecommendationTemplate
+from .models import (
+    ArchivedProduct, Category, ConsumptionForecast, DailyProductStats, Job, Product, ProductEvent,
+    RecommendationTemplate,
+)
+from .sharding import product_databases
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -9,12 +17,76 @@ class CategoryAdmin(admin.ModelAdmin):
     list_editable = ('default_shelf_life_days', 'icon')
     
     def product_count(self, obj):
-        return obj.product_set.count()
+        return sum(
+            Product.objects.using(database).filter(category_id=obj.pk).count()
+            for database in product_databases()
+        )
     product_count.short_description = 'Количество продуктов'
 
 
+def _selected_shard(request):
+    """Шард из фильтра списка; форма объекта получает его через _changelist_filters."""
+    shard = request.GET.get('shard')
+    if shard is None:
+        preserved = parse_qs(request.GET.get('_changelist_filters', ''))
+        shard = preserved.get('shard', [None])[0]
+    return shard if shard in settings.PRODUCT_SHARDS else settings.PRODUCT_SHARDS[0]
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    title = 'Шард'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(shard, shard) for shard in settings.PRODUCT_SHARDS]
+
+    def value(self):
+        return super().value() or settings.PRODUCT_SHARDS[0]
+
+    def choices(self, changelist):
+        # Пункта "Все" нет: список всегда показывает один шард
+        yield from list(super().choices(changelist))[1:]
+
+    def queryset(self, request, queryset):
+        # Шард уже выбран в ShardedModelAdmin.get_queryset
+        return queryset
+
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    """Список строк одного шарда; без PRODUCT_SHARDS - обычный ModelAdmin."""
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if settings.PRODUCT_SHARDS:
+            queryset = queryset.using(_selected_shard(request))
+        return queryset
+
+    def get_list_filter(self, request):
+        if settings.PRODUCT_SHARDS:
+            return (ShardListFilter,) + self.list_filter
+        return self.list_filter
+
+    def get_list_select_related(self, request):
+        # Таблица пользователей на шарде отсутствует - JOIN только с категориями
+        if settings.PRODUCT_SHARDS:
+            return ('category',)
+        return super().get_list_select_related(request)
+
+    def get_search_fields(self, request):
+        if settings.PRODUCT_SHARDS:
+            return tuple(field for field in self.search_fields if not field.startswith('user__'))
+        return self.search_fields
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if settings.PRODUCT_SHARDS and search_term:
+            user_ids = User.objects.filter(username__icontains=search_term).values_list('pk', flat=True)
+            results |= queryset.filter(user_id__in=list(user_ids))
+        return results, may_have_duplicates
+
+
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ShardedModelAdmin):
     list_display = ('name', 'user', 'category', 'expiration_date', 
                    'days_remaining_display', 'status', 'priority')
     list_filter = ('status', 'category', 'priority', 'storage', 'expiration_date')
@@ -54,6 +126,27 @@ class ProductAdmin(admin.ModelAdmin):
             return format_html('<span style="color: green;">{} дней</span>', days)
     days_remaining_display.short_description = 'Осталось дней'
 
+    def get_readonly_fields(self, request, obj=None):
+        # Смена владельца означала бы перенос строки на другой шард
+        if settings.PRODUCT_SHARDS and obj is not None:
+            return self.readonly_fields + ('user',)
+        return self.readonly_fields
+
+
+@admin.register(ArchivedProduct)
+class ArchivedProductAdmin(ShardedModelAdmin):
+    list_display = ('name', 'user', 'category', 'status', 'expiration_date', 'updated_at', 'archived_at')
+    list_filter = ('status', 'category', 'archived_at')
+    search_fields = ('name', 'user__username', 'notes')
+    date_hierarchy = 'updated_at'
+    list_per_page = 50
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(RecommendationTemplate)
 class RecommendationTemplateAdmin(admin.ModelAdmin):
@@ -69,4 +162,39 @@ class RecommendationTemplateAdmin(admin.ModelAdmin):
         ('Дополнительно', {
             'fields': ('icon', 'action_text', 'is_active')
         }),
-    )
\ No newline at end of file
+    )
+
+@admin.register(ProductEvent)
+class ProductEventAdmin(admin.ModelAdmin):
+    list_display = ('event', 'product_id', 'user', 'category', 'quantity', 'price', 'date')
+    list_filter = ('event', 'category', 'date')
+    search_fields = ('user__username',)
+    date_hierarchy = 'date'
+    list_per_page = 50
+
+
+@admin.register(DailyProductStats)
+class DailyProductStatsAdmin(admin.ModelAdmin):
+    list_display = ('date', 'user', 'category', 'event', 'count', 'quantity', 'price')
+    list_filter = ('event', 'category', 'date')
+    search_fields = ('user__username',)
+    date_hierarchy = 'date'
+    list_per_page = 50
+
+
+@admin.register(ConsumptionForecast)
+class ConsumptionForecastAdmin(admin.ModelAdmin):
+    list_display = ('user', 'category', 'used_count', 'wasted_count',
+                    'avg_days_to_use', 'waste_rate', 'computed_at')
+    list_filter = ('category',)
+    search_fields = ('user__username',)
+    readonly_fields = ('computed_at',)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'priority', 'attempts', 'user', 'run_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'dedup_key', 'user__username')
+    readonly_fields = ('locked_at', 'locked_by', 'result', 'error', 'created_at', 'finished_at')
+    list_per_page = 50
@@ -0,0 +1,51 @@
+"""
+Загрузка продуктов для аналитики без создания экземпляров моделей.
+
+Из БД берутся только нужные столбцы через values_list (название категории -
+через JOIN), кортежи сразу складываются в DataFrame, а дни до истечения срока
+считаются векторно по массиву datetime64.
+"""
+import numpy as np
+import pandas as pd
+from django.utils import timezone
+
+NO_CATEGORY = 'Без категории'
+
+# Столбец DataFrame -> поле для values_list
+COLUMNS = {
+    'name': 'name',
+    'category': 'category__name',
+    'priority': 'priority',
+    'quantity': 'quantity',
+    'expiration_date': 'expiration_date',
+}
+DEFAULT_COLUMNS = ('name', 'category', 'expiration_date')
+
+
+def _lookups(columns):
+    columns = tuple(columns)
+    if 'expiration_date' not in columns:
+        columns += ('expiration_date',)
+    return columns, [COLUMNS[column] for column in columns]
+
+
+def _build_frame(rows, columns, today):
+    df = pd.DataFrame.from_records(rows, columns=columns, nrows=len(rows))
+    if 'category' in df:
+        df['category'] = df['category'].fillna(NO_CATEGORY)
+    expiration = np.array(df['expiration_date'].tolist(), dtype='datetime64[D]')
+    df['days_left'] = (expiration - np.datetime64(today, 'D')).astype(np.int64)
+    return df
+
+
+def products_frame(queryset, columns=DEFAULT_COLUMNS):
+    """DataFrame со столбцами columns и days_left для продуктов queryset."""
+    columns, lookups = _lookups(columns)
+    rows = list(queryset.order_by().values_list(*lookups))
+    return _build_frame(rows, columns, timezone.now().date())
+
+
+async def aproducts_frame(queryset, columns=DEFAULT_COLUMNS):
+    columns, lookups = _lookups(columns)
+    rows = [row async for row in queryset.order_by().values_list(*lookups)]
+    return _build_frame(rows, columns, timezone.now().date())
@@ -0,0 +1,290 @@
+"""
+JSON API продуктов и категорий для мобильных и скриптовых клиентов.
+
+GET api/products/ принимает те же фильтры, что ProductFilterForm
+(category, status, storage, priority, search, sort), fields=name,quantity
+выбирает поля ответа, limit - размер страницы. Страницы выбираются по
+ключу: next в ответе - подписанный курсор последней строки (значение поля
+сортировки и id), следующая страница начинается сразу за ним без OFFSET и
+не сдвигается, когда продукты добавляются или удаляются между запросами.
+Для status=used к продуктам подмешивается архив, как в HTML-списке.
+GET api/categories/ - справочник категорий с теми же fields, limit, cursor.
+
+POST api/products/batch/ - {"operations": [...]}, операции create, update,
+delete и mark_used. Данные create и update проверяются ProductForm; update
+меняет только переданные поля. Операции применяются в одной транзакции:
+если хотя бы одна не прошла проверку, не применяется ни одна, а ответ 400
+перечисляет ошибки по номерам операций.
+
+Вход - сессия, как у HTML-страниц; POST требует CSRF-токен (X-CSRFToken).
+"""
+import heapq
+import json
+from functools import wraps
+
+from django.core import signing
+from django.db import transaction
+from django.db.models import Q
+from django.forms.models import model_to_dict
+from django.http import JsonResponse
+
+from .forms import ProductFilterForm, ProductForm
+from .models import Category, Product
+from .routers import read_from_replica
+from .sharding import PRIMARY, shard_for
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+MAX_OPERATIONS = 500
+OPERATIONS = ('create', 'update', 'delete', 'mark_used')
+CURSOR_SALT = 'app.api.cursor'
+
+# Поле ответа -> (столбец Product, столбец ArchivedProduct)
+PRODUCT_FIELDS = {
+    'id': ('id', 'product_id'),
+    'name': ('name', 'name'),
+    'category': ('category_id', 'category_id'),
+    'expiration_date': ('expiration_date', 'expiration_date'),
+    'purchase_date': ('purchase_date', 'purchase_date'),
+    'quantity': ('quantity', 'quantity'),
+    'unit': ('unit', 'unit'),
+    'storage': ('storage', 'storage'),
+    'priority': ('priority', 'priority'),
+    'estimated_price': ('estimated_price', 'estimated_price'),
+    'notes': ('notes', 'notes'),
+    'status': ('status', 'status'),
+    'notifications': ('notifications', 'notifications'),
+    'created_at': ('created_at', 'created_at'),
+    'updated_at': ('updated_at', 'updated_at'),
+}
+CATEGORY_FIELDS = {
+    name: name for name in ('id', 'name', 'default_shelf_life_days', 'icon')
+}
+
+
+class BatchError(Exception):
+    pass
+
+
+def api_login_required(view):
+    """Как login_required, но вместо перенаправления на вход - 401 в JSON."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return _error('Требуется вход', status=401)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _error(message, status=400, **extra):
+    return JsonResponse({'error': message, **extra}, status=status)
+
+
+def _json_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def _form_errors(form):
+    return {field: list(messages) for field, messages in form.errors.items()}
+
+
+def selected_fields(value, available):
+    """Поля из параметра fields в порядке запроса; пустой - все поля."""
+    if not value:
+        return list(available)
+    fields = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def page_limit(value):
+    if not value:
+        return DEFAULT_LIMIT
+    if not value.isdigit() or not 1 <= int(value) <= MAX_LIMIT:
+        raise ValueError(f'limit - число от 1 до {MAX_LIMIT}')
+    return int(value)
+
+
+def encode_cursor(sort, key):
+    value, row_id = key
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return signing.dumps([sort, value, row_id], salt=CURSOR_SALT)
+
+
+def decode_cursor(cursor, sort, model):
+    """(значение поля сортировки, id) из курсора или None для первой страницы."""
+    if not cursor:
+        return None
+    try:
+        cursor_sort, value, row_id = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise ValueError('Неверный курсор')
+    if cursor_sort != sort:
+        raise ValueError('Курсор выдан для другой сортировки')
+    return model._meta.get_field(sort.lstrip('-')).to_python(value), row_id
+
+
+def fetch_page(queryset, sort, after, limit, fields, columns):
+    """
+    До limit строк queryset сразу после ключа after в порядке sort и id.
+    columns - столбцы полей fields (и 'id'); возвращает пары (ключ, строка).
+    """
+    field = sort.lstrip('-')
+    descending = sort.startswith('-')
+    pk = columns['id']
+    if after is not None:
+        value, row_id = after
+        op = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'{pk}__{op}': row_id})
+        )
+    order = (f'-{field}', f'-{pk}') if descending else (field, pk)
+    rows = queryset.order_by(*order).values_list(
+        field, pk, *(columns[name] for name in fields)
+    )[:limit]
+    return [((key, row_id), dict(zip(fields, values))) for key, row_id, *values in rows]
+
+
+def _page_response(page, sort, limit):
+    next_cursor = encode_cursor(sort, page[limit - 1][0]) if len(page) > limit else None
+    return _json_response({
+        'results': [row for _, row in page[:limit]],
+        'next': next_cursor,
+    })
+
+
+@api_login_required
+@read_from_replica
+def products(request):
+    form = ProductFilterForm(request.GET)
+    if not form.is_valid():
+        return _error('Неверные фильтры', errors=_form_errors(form))
+    sort = form.cleaned_data['sort'] or 'expiration_date'
+    try:
+        fields = selected_fields(request.GET.get('fields'), PRODUCT_FIELDS)
+        limit = page_limit(request.GET.get('limit'))
+        after = decode_cursor(request.GET.get('cursor'), sort, Product)
+    except ValueError as error:
+        return _error(str(error))
+    queryset, archived = form.filter_products(request.user)
+    # Лишняя строка показывает, есть ли следующая страница
+    page = fetch_page(
+        queryset, sort, after, limit + 1, fields,
+        {name: columns[0] for name, columns in PRODUCT_FIELDS.items()},
+    )
+    if archived is not None:
+        archived_page = fetch_page(
+            archived, sort, after, limit + 1, fields,
+            {name: columns[1] for name, columns in PRODUCT_FIELDS.items()},
+        )
+        # id архивного продукта - id исходного продукта, ключи не совпадают
+        page = list(heapq.merge(
+            page, archived_page, key=lambda item: item[0], reverse=sort.startswith('-')
+        ))[:limit + 1]
+    return _page_response(page, sort, limit)
+
+
+@api_login_required
+@read_from_replica
+def categories(request):
+    sort = 'name'
+    try:
+        fields = selected_fields(request.GET.get('fields'), CATEGORY_FIELDS)
+        limit = page_limit(request.GET.get('limit'))
+        after = decode_cursor(request.GET.get('cursor'), sort, Category)
+    except ValueError as error:
+        return _error(str(error))
+    page = fetch_page(Category.objects.all(), sort, after, limit + 1, fields, CATEGORY_FIELDS)
+    return _page_response(page, sort, limit)
+
+
+def _form_data(operation):
+    data = operation.get('data', {})
+    if not isinstance(data, dict):
+        raise BatchError({'error': 'data должен быть объектом'})
+    return data
+
+
+def _create_defaults():
+    # Пропущенные поля получают значения по умолчанию модели, а не пустые
+    # значения формы: для notifications отсутствие значило бы False
+    return {
+        field.name: field.get_default()
+        for field in Product._meta.concrete_fields
+        if field.name in ProductForm.Meta.fields and field.has_default()
+    }
+
+
+def _save(form, user):
+    if not form.is_valid():
+        raise BatchError({'errors': _form_errors(form)})
+    product = form.save(commit=False)
+    product.user = user
+    product.save()
+    return product
+
+
+def apply_operation(operation, products, user):
+    """Применяет одну операцию; products - продукты пользователя по id."""
+    if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+        raise BatchError({'error': f'op - одно из: {", ".join(OPERATIONS)}'})
+    op = operation['op']
+    if op == 'create':
+        product = _save(ProductForm({**_create_defaults(), **_form_data(operation)}), user)
+        products[product.pk] = product
+        return {'op': op, 'id': product.pk}
+
+    product_id = operation.get('id')
+    product = products.get(product_id) if isinstance(product_id, int) else None
+    if product is None:
+        raise BatchError({'error': f'Продукт {product_id} не найден'})
+    if op == 'update':
+        data = {**model_to_dict(product, fields=ProductForm.Meta.fields), **_form_data(operation)}
+        _save(ProductForm(data, instance=product), user)
+    elif op == 'delete':
+        product.delete()
+        del products[product_id]
+    else:
+        product.status = 'used'
+        product.save()
+    return {'op': op, 'id': product_id}
+
+
+@api_login_required
+def product_batch(request):
+    if request.method != 'POST':
+        return _error('Нужен POST', status=405)
+    try:
+        operations = json.loads(request.body)['operations']
+    except (ValueError, KeyError, TypeError):
+        return _error('Ожидается JSON {"operations": [...]}')
+    if not isinstance(operations, list) or not 1 <= len(operations) <= MAX_OPERATIONS:
+        return _error(f'operations - список из 1-{MAX_OPERATIONS} операций')
+
+    user = request.user
+    database = shard_for(user.pk)
+    ids = [
+        operation.get('id') for operation in operations
+        if isinstance(operation, dict) and isinstance(operation.get('id'), int)
+    ]
+    results = []
+    errors = []
+    # Продукты могут лежать в шарде, а журнал событий и рекомендации - в
+    # основной БД: транзакция открывается в обеих
+    with transaction.atomic(using=PRIMARY), transaction.atomic(using=database):
+        products = Product.objects.for_user(user).in_bulk(ids)
+        for index, operation in enumerate(operations):
+            try:
+                results.append(apply_operation(operation, products, user))
+            except BatchError as error:
+                errors.append({'index': index, **error.args[0]})
+        if errors:
+            transaction.set_rollback(True, using=database)
+            transaction.set_rollback(True, using=PRIMARY)
+    if errors:
+        return _json_response({'errors': errors}, status=400)
+    return _json_response({'results': results})
@@ -0,0 +1,28 @@
+from django.apps import AppConfig
+from django.contrib.staticfiles.apps import StaticFilesConfig
+
+
+class FreshTrackerConfig(AppConfig):
+    default = True
+    name = 'app'
+    verbose_name = 'FreshTracker'
+
+    def ready(self):
+        from . import signals, tasks  # noqa: F401
+
+
+class AssetsConfig(StaticFilesConfig):
+    """collectstatic без файлов старого шаблона проекта, на которые не ссылается base.html."""
+
+    ignore_patterns = StaticFilesConfig.ignore_patterns + [
+        'app/js/_references.js',
+        'app/js/*.intellisense.js',
+        'app/js/*-vsdoc.js',
+        'app/js/jquery*',
+        'app/js/bootstrap*',
+        'app/js/modernizr*',
+        'app/js/respond*',
+        'app/css/bootstrap*',
+        'app/css/site.css',
+        'app/fonts/*',
+    ]
@@ -0,0 +1,48 @@
+"""
+Архив завершённых продуктов.
+
+Продукты, которые больше ARCHIVE_AFTER_DAYS дней назад использованы,
+выброшены или просрочены, переносятся из Product в ArchivedProduct той же
+БД (шарда). Таблица и индексы Product остаются маленькими, а история
+по-прежнему доступна прогнозам и фильтру "Использовано" списка продуктов.
+"""
+from django.db import transaction
+
+from .cache import bump_inventory_generation
+from .events import muted
+from .forecasting import FINISHED_STATUSES
+from .models import ArchivedProduct, Product
+from .recommendations import mark_stale
+from .sharding import product_databases
+from .tasks import schedule_stale_recommendations
+
+
+def archive_batch(database, cutoff, batch_size):
+    """Переносит до batch_size продуктов, завершённых до cutoff; возвращает их число."""
+    products = list(
+        Product.objects.using(database)
+        .filter(status__in=FINISHED_STATUSES, updated_at__lt=cutoff)
+        .order_by('pk')[:batch_size]
+    )
+    if not products:
+        return 0
+    # События по этим продуктам уже в журнале - удаление не логируем
+    with transaction.atomic(using=database), muted():
+        ArchivedProduct.objects.using(database).bulk_create(
+            [ArchivedProduct.from_product(product) for product in products]
+        )
+        Product.objects.using(database).filter(pk__in=[p.pk for p in products]).delete()
+    user_ids = {product.user_id for product in products}
+    for user_id in user_ids:
+        bump_inventory_generation(user_id)
+    mark_stale(list(user_ids))
+    schedule_stale_recommendations()
+    return len(products)
+
+
+def archive_finished(cutoff, batch_size=1000):
+    archived = 0
+    for database in product_databases():
+        while moved := archive_batch(database, cutoff, batch_size):
+            archived += moved
+    return archived
@@ -0,0 +1,173 @@
+"""
+Кэш пользовательских данных с версионированием ключей.
+
+Ключ включает поколение инвентаря пользователя, поколение справочников
+(категории, шаблоны рекомендаций) и текущую дату. Любая запись Product
+меняет поколение пользователя, поэтому старые записи кэша просто перестают
+читаться и вытесняются по таймауту - явная инвалидация не нужна.
+
+Реплики БД догоняют запись до REPLICA_LAG секунд. Всё это время после
+смены поколения кэш заполняется из основной БД: иначе строки отставшей
+реплики закэшировались бы под новым поколением на весь CACHE_TIMEOUT.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .routers import pin_to_primary
+
+CACHE_TIMEOUT = 60 * 60
+CATALOG_GENERATION_KEY = 'catalog-gen'
+
+_MISSING = object()
+
+
+def _user_generation_key(user_id):
+    return f'inventory-gen:{user_id}'
+
+
+def _written_key(generation_key):
+    return f'{generation_key}:written'
+
+
+def _new_generation(current=None):
+    # Время в наносекундах, а не счётчик: после вытеснения ключа или при
+    # одновременной записи из двух процессов поколение не повторится.
+    return max(time.time_ns(), (current or 0) + 1)
+
+
+def _resolve_generations(found, user_key):
+    missing = {}
+    for key in (user_key, CATALOG_GENERATION_KEY):
+        if key not in found:
+            missing[key] = _new_generation()
+    return {**missing, **found}, missing
+
+
+def _build_key(user_id, generations, user_key, name, parts):
+    digest = hashlib.md5(
+        repr((timezone.now().date(),) + parts).encode('utf-8')
+    ).hexdigest()
+    return (
+        f'u{user_id}:{generations[user_key]}:{generations[CATALOG_GENERATION_KEY]}'
+        f':{name}:{digest}'
+    )
+
+
+def user_cache_key(user_id, name, *parts):
+    user_key = _user_generation_key(user_id)
+    found = cache.get_many([user_key, CATALOG_GENERATION_KEY])
+    generations, missing = _resolve_generations(found, user_key)
+    for key, value in missing.items():
+        if not cache.add(key, value, timeout=None):
+            generations[key] = cache.get(key, value)
+    return _build_key(user_id, generations, user_key, name, parts)
+
+
+async def auser_cache_key(user_id, name, *parts):
+    user_key = _user_generation_key(user_id)
+    found = await cache.aget_many([user_key, CATALOG_GENERATION_KEY])
+    generations, missing = _resolve_generations(found, user_key)
+    for key, value in missing.items():
+        if not await cache.aadd(key, value, timeout=None):
+            generations[key] = await cache.aget(key, value)
+    return _build_key(user_id, generations, user_key, name, parts)
+
+
+def _recent_write_keys(user_id):
+    return [_written_key(_user_generation_key(user_id)), _written_key(CATALOG_GENERATION_KEY)]
+
+
+def read_primary_after_write(user_id):
+    """Остаток запроса читает основную БД, если данные пользователя только что менялись."""
+    if settings.DATABASE_REPLICAS and cache.get_many(_recent_write_keys(user_id)):
+        pin_to_primary()
+
+
+async def aread_primary_after_write(user_id):
+    if settings.DATABASE_REPLICAS and await cache.aget_many(_recent_write_keys(user_id)):
+        pin_to_primary()
+
+
+def cached_for_user(user_id, name, factory, *parts, timeout=CACHE_TIMEOUT):
+    """Возвращает factory() из кэша пользователя, вычисляя при промахе."""
+    key = user_cache_key(user_id, name, *parts)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        read_primary_after_write(user_id)
+        value = factory()
+        cache.set(key, value, timeout)
+    return value
+
+
+async def acached_for_user(user_id, name, factory, *parts, timeout=CACHE_TIMEOUT):
+    """Асинхронный вариант cached_for_user; factory - корутинная функция."""
+    key = await auser_cache_key(user_id, name, *parts)
+    value = await cache.aget(key, _MISSING)
+    if value is _MISSING:
+        await aread_primary_after_write(user_id)
+        value = await factory()
+        await cache.aset(key, value, timeout)
+    return value
+
+
+def _bump(key):
+    cache.set(key, _new_generation(cache.get(key)), timeout=None)
+    cache.set(_written_key(key), True, timeout=settings.REPLICA_LAG)
+
+
+def bump_inventory_generation(user_id):
+    # После коммита: иначе параллельный запрос успеет закэшировать старые
+    # данные уже под новым поколением.
+    transaction.on_commit(lambda: _bump(_user_generation_key(user_id)))
+
+
+def _generation(key):
+    generation = cache.get(key)
+    if generation is None:
+        generation = _new_generation()
+        if not cache.add(key, generation, timeout=None):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def inventory_generation(user_id):
+    """Текущее поколение инвентаря пользователя; создаётся при первом обращении."""
+    return _generation(_user_generation_key(user_id))
+
+
+async def ainventory_generation(user_id):
+    """Как inventory_generation, для async-кода."""
+    key = _user_generation_key(user_id)
+    generation = await cache.aget(key)
+    if generation is None:
+        generation = _new_generation()
+        if not await cache.aadd(key, generation, timeout=None):
+            generation = await cache.aget(key, generation)
+    return generation
+
+
+def catalog_generation():
+    """Текущее поколение справочников; создаётся при первом обращении."""
+    return _generation(CATALOG_GENERATION_KEY)
+
+
+def fragment_version(user_id):
+    """
+    Версия данных пользователя для ключей {% cache %} в шаблонах: поколения
+    инвентаря и справочников и текущая дата, как в ключах cached_for_user.
+    """
+    return user_cache_key(user_id, 'fragments')
+
+
+def bump_catalog_generation():
+    transaction.on_commit(lambda: _bump(CATALOG_GENERATION_KEY))
+
+
+async def acatalog_generation():
+    """Текущее поколение справочников или None, если его ещё нет в кэше."""
+    return await cache.aget(CATALOG_GENERATION_KEY)
@@ -0,0 +1,121 @@
+"""
+Локальный справочник продуктов для автодополнения.
+
+Справочник (название, категория, срок хранения) читается из TSV-файла
+PRODUCT_CATALOG_PATH один раз на процесс. Поиск идёт по двум отсортированным
+массивам ключей - полным названиям и отдельным словам названий: префикс
+находится через bisect, совпадения лежат подряд, БД не нужна.
+"""
+import bisect
+from collections import namedtuple
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+
+from .models import Category
+
+# shelf_life_days - None, если срок берётся из категории
+CatalogEntry = namedtuple('CatalogEntry', 'name category shelf_life_days')
+
+
+def normalize(text):
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+def _sorted_index(pairs):
+    pairs.sort()
+    return [key for key, _ in pairs], [position for _, position in pairs]
+
+
+class ProductCatalog:
+    def __init__(self, entries):
+        self.entries = []
+        names, words = [], []
+        seen = set()
+        for entry in entries:
+            key = normalize(entry.name)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            position = len(self.entries)
+            self.entries.append(entry)
+            names.append((key, position))
+            # "сыр российский" находится и по "росс"
+            parts = key.split(' ')
+            for i in range(1, len(parts)):
+                words.append((' '.join(parts[i:]), position))
+        self._names = _sorted_index(names)
+        self._words = _sorted_index(words)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _scan(index, prefix, found, limit):
+        keys, positions = index
+        i = bisect.bisect_left(keys, prefix)
+        while i < len(keys) and len(found) < limit and keys[i].startswith(prefix):
+            if positions[i] not in found:
+                found.append(positions[i])
+            i += 1
+
+    def search(self, query, limit=10):
+        """Продукты, название или одно из слов которых начинается с query."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        found = []
+        # Сначала совпадения с начала названия, затем по словам внутри
+        self._scan(self._names, prefix, found, limit)
+        self._scan(self._words, prefix, found, limit)
+        return [self.entries[position] for position in found]
+
+
+def read_catalog(path):
+    """Строки файла: название<TAB>категория[<TAB>срок хранения, дней]."""
+    entries = []
+    with open(path, encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.split('\t')
+            name = fields[0].strip()
+            category = fields[1].strip() if len(fields) > 1 else ''
+            days = fields[2].strip() if len(fields) > 2 else ''
+            entries.append(CatalogEntry(name, category or None, int(days) if days else None))
+    return ProductCatalog(entries)
+
+
+@lru_cache(maxsize=4)
+def _load(path):
+    return read_catalog(path)
+
+
+def get_catalog():
+    return _load(str(settings.PRODUCT_CATALOG_PATH))
+
+
+def suggestions(query, today, limit=10):
+    """Варианты для формы: категория из БД и предлагаемый срок годности."""
+    entries = get_catalog().search(query, limit)
+    if not entries:
+        return []
+    categories = {
+        normalize(name): (pk, days)
+        for pk, name, days in Category.objects.values_list('id', 'name', 'default_shelf_life_days')
+    }
+    results = []
+    for entry in entries:
+        category_id, days = categories.get(normalize(entry.category or ''), (None, None))
+        if entry.shelf_life_days is not None:
+            days = entry.shelf_life_days
+        results.append({
+            'name': entry.name,
+            'category': entry.category,
+            'category_id': category_id,
+            'shelf_life_days': days,
+            'expiration_date': (today + timedelta(days=days)).isoformat() if days else None,
+        })
+    return results
@@ -0,0 +1,108 @@
+"""
+Построение графиков для главной страницы и статистики.
+
+Графики строятся сразу в компактный inline SVG: данных не больше десятка
+столбцов или секторов, и растеризация через matplotlib для них не нужна.
+"""
+import math
+
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+CATEGORY_COLORS = ['#28a745', '#17a2b8', '#ffc107', '#dc3545', '#6c757d']
+URGENCY_LABELS = ['Просрочено', 'Скоро истекает', 'На этой неделе', 'В норме']
+URGENCY_COLORS = ['#dc3545', '#ffc107', '#17a2b8', '#28a745']
+PIE_COLORS = [
+    '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+    '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf',
+]
+
+FONT = 'font-family="sans-serif" font-size="12"'
+TITLE_FONT = 'font-family="sans-serif" font-size="15" font-weight="bold"'
+
+
+def _svg(width, height, title, body):
+    return mark_safe(
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+        f'class="img-fluid" role="img" aria-label="{escape(title)}">'
+        f'<text x="{width // 2}" y="20" text-anchor="middle" {TITLE_FONT}>'
+        f'{escape(title)}</text>'
+        f'{body}</svg>'
+    )
+
+
+def bar_chart(labels, values, colors, title, ylabel='Количество', width=600, height=320):
+    """Столбчатая диаграмма с подписями значений над столбцами."""
+    left, top, bottom = 50, 35, 90
+    plot_w = width - left - 10
+    plot_h = height - top - bottom
+    peak = max(values, default=0) or 1
+    slot = plot_w / max(len(values), 1)
+    bar_w = slot * 0.7
+
+    parts = [
+        f'<line x1="{left}" y1="{top + plot_h}" x2="{width - 10}" y2="{top + plot_h}" stroke="#333"/>',
+        f'<line x1="{left}" y1="{top}" x2="{left}" y2="{top + plot_h}" stroke="#333"/>',
+        f'<text transform="translate(14 {top + plot_h // 2}) rotate(-90)" '
+        f'text-anchor="middle" {FONT}>{escape(ylabel)}</text>',
+    ]
+    for i, (label, value) in enumerate(zip(labels, values)):
+        bar_h = plot_h * value / peak
+        x = left + slot * i + (slot - bar_w) / 2
+        y = top + plot_h - bar_h
+        cx = x + bar_w / 2
+        parts.append(
+            f'<rect x="{x:.1f}" y="{y:.1f}" width="{bar_w:.1f}" height="{bar_h:.1f}" '
+            f'fill="{colors[i % len(colors)]}"><title>{escape(label)}: {value}</title></rect>'
+            f'<text x="{cx:.1f}" y="{y - 4:.1f}" text-anchor="middle" {FONT}>{value}</text>'
+            f'<text transform="translate({cx:.1f} {top + plot_h + 12}) rotate(-45)" '
+            f'text-anchor="end" {FONT}>{escape(label)}</text>'
+        )
+    return _svg(width, height, title, ''.join(parts))
+
+
+def pie_chart(labels, values, title, width=600, height=320):
+    """Круговая диаграмма с процентами и легендой справа."""
+    total = sum(values)
+    cx, cy, r = 150, 175, 125
+    parts = []
+    angle = -math.pi / 2
+    for i, (label, value) in enumerate(zip(labels, values)):
+        color = PIE_COLORS[i % len(PIE_COLORS)]
+        share = value / total if total else 0
+        if share >= 1:
+            parts.append(f'<circle cx="{cx}" cy="{cy}" r="{r}" fill="{color}"/>')
+        elif share > 0:
+            end = angle + share * 2 * math.pi
+            x1, y1 = cx + r * math.cos(angle), cy + r * math.sin(angle)
+            x2, y2 = cx + r * math.cos(end), cy + r * math.sin(end)
+            large = 1 if share > 0.5 else 0
+            parts.append(
+                f'<path d="M{cx} {cy}L{x1:.1f} {y1:.1f}A{r} {r} 0 {large} 1 {x2:.1f} {y2:.1f}Z" '
+                f'fill="{color}"><title>{escape(label)}: {value}</title></path>'
+            )
+            mid = (angle + end) / 2
+            parts.append(
+                f'<text x="{cx + r * 0.65 * math.cos(mid):.1f}" y="{cy + r * 0.65 * math.sin(mid) + 4:.1f}" '
+                f'text-anchor="middle" {FONT} fill="#fff">{share * 100:.1f}%</text>'
+            )
+            angle = end
+        ly = 50 + i * 20
+        parts.append(
+            f'<rect x="300" y="{ly - 10}" width="12" height="12" fill="{color}"/>'
+            f'<text x="318" y="{ly}" {FONT}>{escape(label)}</text>'
+        )
+    return _svg(width, height, title, ''.join(parts))
+
+
+def category_bar_chart(labels, values):
+    """Топ-5 категорий для главной страницы."""
+    return bar_chart(labels, values, CATEGORY_COLORS, 'Топ-5 категорий продуктов')
+
+
+def category_pie_chart(labels, values):
+    return pie_chart(labels, values, 'Распределение по категориям')
+
+
+def urgency_bar_chart(urgency_values):
+    return bar_chart(URGENCY_LABELS, urgency_values, URGENCY_COLORS, 'Статус продуктов по срочности')
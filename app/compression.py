@@ -0,0 +1,192 @@
+"""
+Сжатие ответов приложения и минификация HTML.
+
+Шаблоны дают сильно отступленную разметку (список продуктов - десятки
+строк на продукт), а страницы со встроенными графиками весят сотни
+килобайт. CompressionMiddleware сначала схлопывает в HTML каждую серию
+пробелов с переводом строки в один перевод строки - браузер отображает
+такую разметку так же, а содержимое pre, textarea, script и style не
+трогается. Затем тело сжимается в br (если установлен пакет brotli) или
+gzip по Accept-Encoding, если тип содержимого входит в
+COMPRESS_CONTENT_TYPES, а тело не короче COMPRESS_MIN_SIZE. Потоковые
+ответы сжимаются по частям с выталкиванием каждой части, минификация к
+ним не применяется.
+"""
+import re
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Для ответов на лету: качество 11 слишком медленно, 5 близко к нему по размеру
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+# Случайная длина заголовка gzip против BREACH, как в GZipMiddleware Django
+GZIP_RANDOM_BYTES = 100
+
+_RAW_BLOCKS = r'<(pre|textarea|script|style)\b.*?</\1\s*>'
+# Только пробельные символы HTML: неразрывный пробел - это содержимое
+_SPACES = ' \t\r\f'
+# Тело в UTF-8 обрабатывается как bytes, без декодирования: пробелы и
+# перевод строки там однобайтовые и не встречаются внутри других символов
+_SYNTAX = {
+    str: (re.compile(_RAW_BLOCKS, re.S | re.I), '\n', _SPACES, ''),
+    bytes: (re.compile(_RAW_BLOCKS.encode(), re.S | re.I), b'\n', _SPACES.encode(), b''),
+}
+
+
+def _collapse_lines(text, newline, spaces):
+    lines = text.split(newline)
+    if len(lines) == 1:
+        return text
+    first, *middle, last = lines
+    # split/strip по строкам заметно быстрее регулярного выражения на мегабайтах разметки
+    middle = filter(None, [line.strip(spaces) for line in middle])
+    return newline.join([first.rstrip(spaces), *middle, last.lstrip(spaces)])
+
+
+def minify_html(text):
+    """
+    Каждая серия пробелов с переводом строки - один перевод строки.
+    text - str или bytes в UTF-8.
+    """
+    raw_blocks, newline, spaces, empty = _SYNTAX[bytes if isinstance(text, bytes) else str]
+    parts = []
+    position = 0
+    for block in raw_blocks.finditer(text):
+        parts.append(_collapse_lines(text[position:block.start()], newline, spaces))
+        parts.append(block.group(0))
+        position = block.end()
+    parts.append(_collapse_lines(text[position:], newline, spaces))
+    return empty.join(parts)
+
+
+def choose_encoding(accept_encoding):
+    accepted = set()
+    for part in accept_encoding.lower().split(','):
+        coding, _, params = part.partition(';')
+        # "gzip;q=0" - клиент явно отказывается от кодировки
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    return compress_string(content, max_random_bytes=GZIP_RANDOM_BYTES)
+
+
+class StreamCompressor:
+    """Сжимает поток частями; каждая часть сразу уходит клиенту целиком."""
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._compress = self._compressor.process
+            self._flush = self._compressor.flush
+            self._finish = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+            self._flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+
+    def chunk(self, data):
+        return self._compress(data) + self._flush()
+
+    def finish(self):
+        return self._finish()
+
+    def stream(self, chunks):
+        for data in chunks:
+            yield self.chunk(data)
+        yield self.finish()
+
+    async def astream(self, chunks):
+        async for data in chunks:
+            yield self.chunk(data)
+        yield self.finish()
+
+
+def _media_type(response):
+    return response.get('Content-Type', '').split(';')[0].strip().lower()
+
+
+def _weaken_etag(response):
+    # Сжатое тело отличается побайтно - сильный ETag стал бы неверным
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response.headers['ETag'] = 'W/' + etag
+
+
+def process_response(request, response):
+    if response.has_header('Content-Encoding') or response.status_code in (204, 304):
+        return response
+    media_type = _media_type(response)
+    if not response.streaming and media_type == 'text/html' and settings.HTML_MINIFY:
+        charset = response.charset
+        if charset.lower().replace('-', '') == 'utf8':
+            response.content = minify_html(response.content)
+        else:
+            response.content = minify_html(response.content.decode(charset)).encode(charset)
+        # CommonMiddleware уже проставил длину исходного тела
+        if response.has_header('Content-Length'):
+            response.headers['Content-Length'] = str(len(response.content))
+    if media_type not in settings.COMPRESS_CONTENT_TYPES:
+        return response
+    # Vary ставится и для несжатого ответа: кэш по пути не должен отдать
+    # его клиенту, который умеет сжатие, и наоборот
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+    if response.streaming:
+        compressor = StreamCompressor(encoding)
+        if response.is_async:
+            response.streaming_content = compressor.astream(response.streaming_content)
+        else:
+            response.streaming_content = compressor.stream(response.streaming_content)
+        del response.headers['Content-Length']
+    else:
+        if len(response.content) < settings.COMPRESS_MIN_SIZE:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+    _weaken_etag(response)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+class CompressionMiddleware:
+    """Минифицирует HTML и сжимает ответы по Accept-Encoding."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return process_response(request, await self.get_response(request))
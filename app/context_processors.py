@@ -0,0 +1,25 @@
+"""
+Версии данных для кэша фрагментов шаблонов.
+
+Фрагменты ({% cache %}) хранятся в общем кэше под ключом с версией данных:
+data_version меняется при любой записи продуктов пользователя или
+справочников и со сменой даты, catalog_version - только при изменении
+справочников. Старые фрагменты не удаляются, а перестают читаться и
+вытесняются по таймауту. Версии читаются из кэша лениво - только если
+шаблон действительно использует фрагменты.
+"""
+from django.utils.functional import SimpleLazyObject
+
+from .cache import CACHE_TIMEOUT, catalog_generation, fragment_version
+
+
+def fragment_cache(request):
+    def data_version():
+        user = request.user
+        return fragment_version(user.pk) if user.is_authenticated else 'anonymous'
+
+    return {
+        'data_version': SimpleLazyObject(data_version),
+        'catalog_version': SimpleLazyObject(lambda: str(catalog_generation())),
+        'fragment_timeout': CACHE_TIMEOUT,
+    }
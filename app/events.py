@@ -0,0 +1,154 @@
+"""
+Журнал событий продуктов и дневные агрегаты.
+
+Каждое событие сразу добавляется в DailyProductStats, поэтому графики
+отходов и потребления за любой период читают готовые дневные строки,
+а не пересчитывают продукты.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import DailyProductStats, ProductEvent
+
+STATUS_EVENTS = ('used', 'expired', 'thrown')
+
+_muted = ContextVar('product_events_muted', default=False)
+
+
+@contextmanager
+def muted():
+    """
+    Служебные перемещения и удаления продуктов не попадают в журнал и не
+    сбрасывают кэш по каждой строке - вызывающий код делает это сам, один
+    раз на пользователя.
+    """
+    token = _muted.set(True)
+    try:
+        yield
+    finally:
+        _muted.reset(token)
+
+
+def _add_to_rollup(event):
+    price = event.price or Decimal('0')
+    rollup = DailyProductStats.objects.filter(
+        user_id=event.user_id,
+        date=event.date,
+        category_id=event.category_id,
+        event=event.event,
+    )
+    updated = rollup.update(
+        count=F('count') + 1,
+        quantity=F('quantity') + event.quantity,
+        price=F('price') + price,
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            DailyProductStats.objects.create(
+                user_id=event.user_id,
+                date=event.date,
+                category_id=event.category_id,
+                event=event.event,
+                count=1,
+                quantity=event.quantity,
+                price=price,
+            )
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        rollup.update(
+            count=F('count') + 1,
+            quantity=F('quantity') + event.quantity,
+            price=F('price') + price,
+        )
+
+
+def is_muted():
+    return _muted.get()
+
+
+def record_event(product, event):
+    if is_muted():
+        return None
+    with transaction.atomic():
+        product_event = ProductEvent.objects.create(
+            user_id=product.user_id,
+            product_id=product.pk,
+            category_id=product.category_id,
+            event=event,
+            quantity=product.quantity,
+            price=product.estimated_price,
+            date=timezone.now().date(),
+        )
+        _add_to_rollup(product_event)
+    return product_event
+
+
+def rebuild_rollups(user_ids=None):
+    """Полностью пересчитывает агрегаты из журнала событий."""
+    events = ProductEvent.objects.all()
+    rollups = DailyProductStats.objects.all()
+    if user_ids is not None:
+        events = events.filter(user_id__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+    rows = (
+        events.order_by()
+        .values('user_id', 'date', 'category_id', 'event')
+        .annotate(total=Count('id'), total_quantity=Sum('quantity'), total_price=Sum('price'))
+    )
+    with transaction.atomic():
+        rollups.delete()
+        DailyProductStats.objects.bulk_create(
+            [
+                DailyProductStats(
+                    user_id=row['user_id'],
+                    date=row['date'],
+                    category_id=row['category_id'],
+                    event=row['event'],
+                    count=row['total'],
+                    quantity=row['total_quantity'] or 0,
+                    price=row['total_price'] or 0,
+                )
+                for row in rows
+            ],
+            batch_size=1000,
+        )
+
+
+def _period(user, start, end, events):
+    return DailyProductStats.objects.filter(
+        user=user, date__gte=start, date__lte=end, event__in=events
+    ).order_by()
+
+
+def totals_by_category(user, start, end, events):
+    """Количество событий по категориям за период, по убыванию."""
+    rows = (
+        _period(user, start, end, events)
+        .values('category__name')
+        .annotate(total=Sum('count'))
+        .order_by('-total')
+    )
+    return [(row['category__name'] or 'Без категории', row['total']) for row in rows]
+
+
+def period_summary(user, start, end):
+    rows = (
+        _period(user, start, end, ('used',) + ProductEvent.WASTE_EVENTS)
+        .values('event')
+        .annotate(total=Sum('count'), total_price=Sum('price'))
+    )
+    summary = {'used': 0, 'wasted': 0, 'wasted_price': Decimal('0')}
+    for row in rows:
+        if row['event'] == 'used':
+            summary['used'] += row['total']
+        else:
+            summary['wasted'] += row['total']
+            summary['wasted_price'] += row['total_price'] or 0
+    return summary
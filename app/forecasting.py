@@ -0,0 +1,129 @@
+"""
+Прогноз потребления по категориям.
+
+Пакетная задача (команда compute_forecasts) одним запросом забирает историю
+всех пользователей и считает по парам (пользователь, категория) среднее
+число дней от покупки до использования и долю выброшенных продуктов -
+векторно, через groupby. В запросе страницы остаётся только поиск по
+готовой таблице ConsumptionForecast.
+"""
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.db.models import F
+
+from .cache import bump_catalog_generation
+from .models import ArchivedProduct, ConsumptionForecast, Product, RecommendationBatch
+from .sharding import product_databases
+
+FINISHED_STATUSES = ('used', 'expired', 'thrown')
+# На сколько дней "приближает" продукт полная доля отходов в категории
+WASTE_WEIGHT = 2.0
+
+
+def history_frame():
+    rows = []
+    # Давно завершённые продукты лежат в архиве, недавние - ещё в Product
+    for database in product_databases():
+        for model in (Product, ArchivedProduct):
+            rows.extend(
+                model.objects.using(database)
+                .filter(status__in=FINISHED_STATUSES)
+                .order_by()
+                .values_list('user_id', 'category_id', 'status', 'purchase_date', 'updated_at')
+            )
+    df = pd.DataFrame.from_records(
+        rows, columns=['user_id', 'category_id', 'status', 'purchase_date', 'updated_at'],
+        nrows=len(rows),
+    )
+    purchased = np.array(df['purchase_date'].tolist(), dtype='datetime64[D]')
+    finished = (
+        pd.to_datetime(df['updated_at'], utc=True)
+        .dt.tz_localize(None)
+        .to_numpy()
+        .astype('datetime64[D]')
+    )
+    df['days_to_finish'] = (finished - purchased).astype(np.int64)
+    return df
+
+
+def compute_forecasts(df):
+    """DataFrame прогнозов по (user_id, category_id) из истории df."""
+    used = df['status'] == 'used'
+    df = df.assign(
+        used=used.astype(np.int64),
+        wasted=(~used).astype(np.int64),
+        days_to_use=df['days_to_finish'].where(used),
+    )
+    grouped = df.groupby(['user_id', 'category_id'], dropna=False).agg(
+        used_count=('used', 'sum'),
+        wasted_count=('wasted', 'sum'),
+        avg_days_to_use=('days_to_use', 'mean'),
+    )
+    grouped['waste_rate'] = grouped['wasted_count'] / (
+        grouped['used_count'] + grouped['wasted_count']
+    )
+    return grouped.reset_index()
+
+
+def store_forecasts(forecasts):
+    objects = [
+        ConsumptionForecast(
+            user_id=int(row.user_id),
+            category_id=None if pd.isna(row.category_id) else int(row.category_id),
+            used_count=int(row.used_count),
+            wasted_count=int(row.wasted_count),
+            avg_days_to_use=None if pd.isna(row.avg_days_to_use) else float(row.avg_days_to_use),
+            waste_rate=float(row.waste_rate),
+        )
+        for row in forecasts.itertuples(index=False)
+    ]
+    with transaction.atomic():
+        ConsumptionForecast.objects.all().delete()
+        ConsumptionForecast.objects.bulk_create(objects, batch_size=1000)
+        # Порядок сохранённых рекомендаций зависит от прогнозов
+        RecommendationBatch.objects.update(version=F('version') + 1)
+        # Прогнозы пересчитываются для всех сразу - сбрасываем общее поколение,
+        # чтобы закэшированные рекомендации учли новый порядок
+        bump_catalog_generation()
+    return len(objects)
+
+
+def refresh_forecasts():
+    return store_forecasts(compute_forecasts(history_frame()))
+
+
+def _forecast_map(rows):
+    return {category_id: (avg_days, waste_rate) for category_id, avg_days, waste_rate in rows}
+
+
+def _forecast_rows(user):
+    return ConsumptionForecast.objects.filter(user=user).values_list(
+        'category_id', 'avg_days_to_use', 'waste_rate'
+    )
+
+
+def forecasts_for(user):
+    """{category_id: (avg_days_to_use, waste_rate)} для пользователя."""
+    return _forecast_map(_forecast_rows(user))
+
+
+async def aforecasts_for(user):
+    return _forecast_map([row async for row in _forecast_rows(user)])
+
+
+def rank_key(product, days_remaining, forecasts, today):
+    """
+    Ключ сортировки рекомендаций: дни до истечения срока, уменьшенные
+    на отставание от привычного темпа использования и на склонность
+    выбрасывать продукты этой категории.
+    """
+    forecast = forecasts.get(product.category_id)
+    if forecast is None:
+        return (days_remaining, days_remaining)
+    avg_days_to_use, waste_rate = forecast
+    score = days_remaining - WASTE_WEIGHT * waste_rate
+    if avg_days_to_use is not None:
+        expected_left = avg_days_to_use - (today - product.purchase_date).days
+        score -= max(0.0, expected_left - days_remaining)
+    return (score, days_remaining)
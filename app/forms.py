@@ -2,8 +2,10 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from .models import Product, Category
+from django.db.models import Q
+from .models import ArchivedProduct, Product, Category
 from django.utils import timezone
+from datetime import timedelta
 
 class UserRegisterForm(UserCreationForm):
     email = forms.EmailField(
@@ -184,4 +186,40 @@ class ProductFilterForm(forms.Form):
         required=False,
         initial='expiration_date',
         widget=forms.Select(attrs={'class': 'form-select'})
-    )
\ No newline at end of file
+    )
+
+    def filter_products(self, user):
+        """
+        Продукты пользователя по фильтрам проверенной формы, без сортировки,
+        и архивные продукты для статуса "used" (для остальных - None).
+        """
+        data = self.cleaned_data
+        today = timezone.now().date()
+        products = Product.objects.for_user(user)
+        # Давно использованные продукты лежат в архиве: фильтр "used" читает и его
+        archived = None
+
+        status = data.get('status')
+        if status == 'warning':
+            products = products.filter(
+                expiration_date__lte=today + timedelta(days=2),
+                expiration_date__gte=today,
+                status='active'
+            )
+        elif status == 'danger':
+            products = products.filter(expiration_date__lt=today, status='active')
+        elif status == 'used':
+            products = products.filter(status='used')
+            archived = ArchivedProduct.objects.for_user(user).filter(status='used')
+        elif status == 'active':
+            products = products.filter(status='active')
+
+        filters = {
+            field: data[field] for field in ('category', 'storage', 'priority') if data.get(field)
+        }
+        search_term = data.get('search')
+        search = Q(name__icontains=search_term) | Q(notes__icontains=search_term) if search_term else Q()
+        products = products.filter(search, **filters)
+        if archived is not None:
+            archived = archived.filter(search, **filters)
+        return products, archived
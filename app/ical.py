@@ -0,0 +1,171 @@
+"""
+Календарь сроков годности в формате iCalendar (RFC 5545).
+
+Календарные приложения опрашивают ленту часто, поэтому готовая лента
+пользователя хранится в кэше вместе с поколением инвентаря, для которого
+она собрана. Пока поколение не менялось, запрос не читает продукты вовсе.
+После изменений заново сериализуются только продукты с updated_at не раньше
+прошлой сборки, а завершённые и удалённые выбрасываются по списку id
+активных продуктов. ETag ленты - хэш её текста, Last-Modified - время
+последнего изменения её событий, включая выброшенные.
+"""
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .cache import inventory_generation
+from .models import CalendarFeed, Product
+
+FEED_TIMEOUT = 7 * 24 * 60 * 60
+# Запас по updated_at: запись, закоммиченная позже чужой более новой,
+# и расхождение часов между серверами не теряют изменений
+REFRESH_OVERLAP = timedelta(minutes=5)
+# За сколько до истечения срока срабатывает напоминание
+ALARM_BEFORE = '-P1D'
+EVENT_FIELDS = ('name', 'expiration_date', 'quantity', 'unit', 'storage',
+                'notes', 'notifications', 'updated_at')
+
+
+def _feed_key(user_id):
+    return f'ics:{user_id}'
+
+
+def _token_key(token):
+    return f'ics-token:{token}'
+
+
+def escape(text):
+    return (
+        text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Переносит строку длиннее 75 октетов, не разрывая символы UTF-8."""
+    if len(line.encode('utf-8')) <= 75:
+        return line
+    parts, current, size = [], '', 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        # Продолжение начинается с пробела, он тоже занимает октет
+        if size + width > (75 if not parts else 74):
+            parts.append(current)
+            current, size = '', 0
+        current += char
+        size += width
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+
+def vevent(product, user_id):
+    """Событие на день истечения срока; с напоминанием, если включены уведомления."""
+    day = product.expiration_date
+    stamp = product.updated_at.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    description = f'{product.quantity:g} {product.unit}'
+    if product.storage:
+        description += f', {product.get_storage_display().lower()}'
+    if product.notes:
+        description += f'\n{product.notes}'
+    summary = escape(f'Истекает срок: {product.name}')
+    lines = [
+        'BEGIN:VEVENT',
+        # id продукта уникален только внутри шарда, поэтому в UID есть и пользователь
+        f'UID:product-{user_id}-{product.pk}@freshtracker',
+        f'DTSTAMP:{stamp}',
+        f'DTSTART;VALUE=DATE:{day:%Y%m%d}',
+        f'DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}',
+        f'SUMMARY:{summary}',
+        f'DESCRIPTION:{escape(description)}',
+        'TRANSP:TRANSPARENT',
+    ]
+    if product.notifications:
+        lines += [
+            'BEGIN:VALARM',
+            'ACTION:DISPLAY',
+            f'TRIGGER:{ALARM_BEFORE}',
+            f'DESCRIPTION:{summary}',
+            'END:VALARM',
+        ]
+    lines.append('END:VEVENT')
+    return '\r\n'.join(fold(line) for line in lines) + '\r\n'
+
+
+def render_calendar(events):
+    body = ''.join(events[pk] for pk in sorted(events))
+    return (
+        'BEGIN:VCALENDAR\r\n'
+        'VERSION:2.0\r\n'
+        'PRODID:-//FreshTracker//Сроки годности//RU\r\n'
+        'CALSCALE:GREGORIAN\r\n'
+        'X-WR-CALNAME:FreshTracker\r\n'
+        f'{body}'
+        'END:VCALENDAR\r\n'
+    )
+
+
+def _refresh(user_id, state, generation):
+    active = Product.objects.for_user(user_id).filter(status='active')
+    events = {}
+    changed = active
+    last_updated = modified = None
+    if state is not None:
+        ids = set(active.values_list('id', flat=True))
+        events = {pk: text for pk, text in state['events'].items() if pk in ids}
+        last_updated = state['last_updated']
+        modified = state.get('modified')
+        # У выброшенного события нет updated_at - лента изменилась сейчас.
+        # last_updated при этом не двигается: по нему ищутся изменённые продукты
+        if len(events) < len(state['events']):
+            modified = timezone.now()
+        if last_updated is not None:
+            changed = active.filter(updated_at__gte=last_updated - REFRESH_OVERLAP)
+    for product in changed.only(*EVENT_FIELDS):
+        events[product.pk] = vevent(product, user_id)
+        last_updated = max(filter(None, (last_updated, product.updated_at)))
+    body = render_calendar(events)
+    return {
+        'generation': generation,
+        'events': events,
+        'last_updated': last_updated,
+        'modified': max(filter(None, (modified, last_updated)), default=None),
+        'body': body,
+        'etag': '"%s"' % hashlib.md5(body.encode('utf-8')).hexdigest(),
+    }
+
+
+def get_feed(user_id):
+    """Состояние ленты пользователя: body, etag, modified (для Last-Modified)."""
+    # Поколение читается до продуктов: запись во время сборки сменит его,
+    # и следующий запрос доберёт изменение
+    generation = inventory_generation(user_id)
+    state = cache.get(_feed_key(user_id))
+    if state is None or state['generation'] != generation:
+        state = _refresh(user_id, state, generation)
+        cache.set(_feed_key(user_id), state, FEED_TIMEOUT)
+    return state
+
+
+def feed_user_id(token):
+    """id владельца ленты по токену или None."""
+    user_id = cache.get(_token_key(token))
+    if user_id is None:
+        user_id = CalendarFeed.objects.filter(token=token).values_list('user_id', flat=True).first()
+        if user_id is not None:
+            cache.set(_token_key(token), user_id, FEED_TIMEOUT)
+    return user_id
+
+
+def feed_for_user(user):
+    feed, _ = CalendarFeed.objects.get_or_create(user=user, defaults={'token': CalendarFeed.new_token()})
+    return feed
+
+
+def reset_token(feed):
+    """Новая ссылка; старая перестаёт работать сразу."""
+    cache.delete(_token_key(feed.token))
+    feed.token = CalendarFeed.new_token()
+    feed.save(update_fields=['token'])
+    return feed
@@ -0,0 +1,186 @@
+"""
+Очередь отложенных задач в таблице Job.
+
+Задача - функция, зарегистрированная декоратором task; в очередь кладутся
+её имя и JSON-аргументы. Воркер (manage.py run_jobs) забирает задачи по
+убыванию приоритета: строка переводится в running условным UPDATE, поэтому
+одну задачу не возьмут два процесса. Упавшая задача повторяется с
+экспоненциальной задержкой, пока не кончатся попытки. Задача с dedup_key
+не ставится второй раз, пока первая ждёт в очереди - enqueue вернёт её.
+Пока задача выполняется, воркер раз в треть JOB_TIMEOUT обновляет её
+locked_at, поэтому долгая задача не уходит второму воркеру; задачи, чей
+воркер умер и перестал обновлять locked_at, возвращаются в очередь через
+JOB_TIMEOUT секунд.
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name=None, priority=0, max_attempts=3):
+    """Регистрирует функцию как задачу; аргументы и результат - JSON."""
+    def register(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        func.priority = priority
+        func.max_attempts = max_attempts
+        TASKS[func.task_name] = func
+        return func
+
+    return register
+
+
+def enqueue(func, *args, user=None, dedup_key=None, priority=None, delay=0):
+    """Ставит func(*args) в очередь и возвращает Job (или уже ждущую с тем же dedup_key)."""
+    fields = {
+        'name': func.task_name,
+        'args': list(args),
+        'user': user,
+        'priority': func.priority if priority is None else priority,
+        'max_attempts': func.max_attempts,
+        'dedup_key': dedup_key,
+        'run_at': timezone.now() + timedelta(seconds=delay),
+    }
+    if dedup_key is None:
+        return Job.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Job.objects.create(**fields)
+    except IntegrityError:
+        existing = Job.objects.filter(dedup_key=dedup_key, status='pending').first()
+        if existing is not None:
+            return existing
+        # Ждущую задачу успели забрать - ставим новую
+        return Job.objects.create(**fields)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(limit, worker=None):
+    """До limit задач, готовых к запуску, переведённых в running этим воркером."""
+    worker = worker or worker_name()
+    candidates = (
+        Job.objects.filter(status='pending', run_at__lte=timezone.now())
+        .order_by('-priority', 'run_at', 'id')
+        .values_list('id', flat=True)[:limit * 2]
+    )
+    claimed = []
+    for job_id in candidates:
+        # Условие на status: кто успел первым, тот и забрал
+        taken = Job.objects.filter(pk=job_id, status='pending').update(
+            status='running', locked_at=timezone.now(), locked_by=worker,
+            attempts=F('attempts') + 1,
+        )
+        if taken:
+            claimed.append(job_id)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def retry_delay(attempts):
+    return settings.JOB_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+@contextmanager
+def heartbeat(job):
+    """Пока блок выполняется, в фоновом потоке обновляет locked_at задачи."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            # Треть таймаута: даже пропущенный раз не отдаёт задачу другому воркеру
+            while not stop.wait(settings.JOB_TIMEOUT / 3):
+                Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by).update(
+                    locked_at=timezone.now()
+                )
+        finally:
+            # Соединения у каждого потока свои - закрываем соединение этого
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f'job-{job.pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run(job_id):
+    """Выполняет забранную задачу и записывает результат или ошибку."""
+    job = Job.objects.get(pk=job_id)
+    func = TASKS.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'Неизвестная задача {job.name}')
+        with heartbeat(job):
+            result = func(*job.args)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Задача %s #%s упала (попытка %d)', job.name, job.pk, job.attempts)
+        if func is not None and job.attempts < job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(
+                status='pending', error=error,
+                run_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status='failed', error=error, finished_at=timezone.now()
+            )
+        return False
+    Job.objects.filter(pk=job.pk).update(
+        status='done', result=result, error='', finished_at=timezone.now()
+    )
+    return True
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи, чей воркер не обновлял locked_at дольше JOB_TIMEOUT."""
+    stale = Job.objects.filter(
+        status='running',
+        locked_at__lt=timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT),
+    )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', error='Превышено время выполнения', finished_at=timezone.now()
+    )
+    return failed + stale.update(status='pending', run_at=timezone.now())
+
+
+def run_pending(limit=100, worker=None):
+    """Выполняет готовые задачи в текущем потоке; число выполненных."""
+    done = 0
+    while done < limit:
+        claimed = claim(min(10, limit - done), worker)
+        if not claimed:
+            break
+        for job_id in claimed:
+            run(job_id)
+            done += 1
+    return done
+
+
+def job_state(job):
+    """Состояние задачи для опроса из браузера."""
+    state = {'id': job.pk, 'status': job.status, 'attempts': job.attempts}
+    if job.status == 'done':
+        state['result'] = job.result
+    elif job.status == 'failed':
+        state['error'] = job.error.strip().splitlines()[-1] if job.error else ''
+    return state
@@ -0,0 +1,104 @@
+"""Общие утилиты для команд bench_*: временная БД, генерация данных и замеры."""
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import override_settings
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.utils import timezone
+
+from app.models import Category, Product
+from app.sharding import shard_for
+
+CATEGORY_NAMES = [
+    'Молочные продукты', 'Овощи', 'Фрукты', 'Мясо', 'Рыба',
+    'Хлеб', 'Крупы', 'Напитки', 'Заморозка', 'Соусы',
+]
+# Бенчмарк не должен читать и засорять рабочий файловый кэш
+BENCH_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench-sessions',
+    },
+}
+PRODUCT_NAMES = [
+    'Молоко', 'Кефир', 'Сыр', 'Творог', 'Помидоры', 'Огурцы', 'Яблоки',
+    'Бананы', 'Курица', 'Говядина', 'Лосось', 'Хлеб', 'Гречка', 'Сок',
+    'Пельмени', 'Кетчуп', 'Йогурт', 'Морковь', 'Апельсины', 'Сметана',
+]
+
+
+@contextmanager
+def bench_database():
+    """Создаёт тестовую БД, чтобы бенчмарк не трогал рабочие данные."""
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        with override_settings(CACHES=BENCH_CACHES):
+            yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+def seed_products(n, username='bench', seed=42):
+    rng = random.Random(seed)
+    user, _ = User.objects.get_or_create(username=username)
+    categories = [
+        Category.objects.get_or_create(name=name)[0] for name in CATEGORY_NAMES
+    ]
+    today = timezone.now().date()
+    statuses = ['active'] * 6 + ['used', 'used', 'thrown', 'expired']
+    products = [
+        Product(
+            user=user,
+            name=f'{rng.choice(PRODUCT_NAMES)} {i}',
+            category=rng.choice(categories + [None]),
+            expiration_date=today + timedelta(days=rng.randint(-5, 30)),
+            purchase_date=today - timedelta(days=rng.randint(0, 20)),
+            quantity=rng.randint(1, 5),
+            priority=rng.choice(['low', 'medium', 'high']),
+            storage=rng.choice(['fridge', 'freezer', 'pantry', 'room']),
+            status=rng.choice(statuses),
+        )
+        for i in range(n)
+    ]
+    Product.objects.using(shard_for(user.pk)).bulk_create(products, batch_size=1000)
+    return user
+
+
+def peak_memory(func):
+    """Пик памяти, выделенной Python за вызов func, в байтах."""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def timed(func, repeat=5):
+    """Лучшее время из repeat прогонов, в миллисекундах."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.archive import archive_finished
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит в архив продукты, использованные, выброшенные или просроченные '
+        'больше --days дней назад. Запускайте по расписанию, например раз в сутки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        archived = archive_finished(cutoff, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Перенесено в архив: {archived}'))
@@ -0,0 +1,48 @@
+"""Время и пик памяти загрузки продуктов для аналитики: модели против values_list."""
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from app.analytics import products_frame
+from app.models import Product
+
+from ._bench import bench_database, peak_memory, seed_products, timed
+
+
+def load_with_models(queryset):
+    """Прежний путь: экземпляры Product -> список словарей -> DataFrame."""
+    data = []
+    for p in queryset.select_related('category'):
+        data.append({
+            'name': p.name,
+            'category': p.category.name if p.category else 'Без категории',
+            'days_left': p.days_remaining,
+            'expiration_date': p.expiration_date,
+            'priority': p.priority,
+            'quantity': p.quantity,
+        })
+    return pd.DataFrame(data)
+
+
+def load_columnar(queryset):
+    return products_frame(queryset, ('name', 'category', 'priority', 'quantity'))
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает загрузку данных для аналитики через модели и values_list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+
+    def handle(self, *args, **options):
+        with bench_database():
+            user = seed_products(options['rows'])
+            queryset = Product.objects.for_user(user)
+            self.stdout.write(f'Строк: {queryset.count()}')
+            for name, loader in (('модели', load_with_models), ('values_list', load_columnar)):
+                ms, df = timed(lambda: loader(queryset), repeat=3)
+                mb = peak_memory(lambda: loader(queryset)) / 1024 / 1024
+                self.stdout.write(
+                    f'{name:12} {ms:8.0f} ms, пик памяти {mb:7.1f} MiB, '
+                    f'days_left mean {df["days_left"].mean():.2f}'
+                )
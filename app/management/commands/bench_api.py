@@ -0,0 +1,99 @@
+"""Цена одной операции через пакетный JSON API и через HTML-формы."""
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from app.models import Product
+
+from ._bench import bench_database, clear_caches, seed_products, timed
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает создание, изменение, отметку и удаление продуктов пакетом API и формами HTML'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--operations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        n = options['operations']
+        with bench_database():
+            user = seed_products(options['products'])
+            client = Client()
+            client.force_login(user)
+            today = timezone.now().date()
+            form = {
+                'name': 'Бенч', 'expiration_date': (today + timedelta(days=5)).isoformat(),
+                'purchase_date': today.isoformat(),
+                'quantity': '1', 'unit': 'шт', 'priority': 'medium', 'notifications': 'on',
+            }
+
+            def ids(limit):
+                return list(
+                    Product.objects.for_user(user).filter(status='active')
+                    .order_by('-pk').values_list('pk', flat=True)[:limit]
+                )
+
+            def html(requests):
+                start = time.perf_counter()
+                for url, data in requests:
+                    response = client.post(url, data)
+                    # Успешная форма перенаправляет на список
+                    assert response.status_code == 302, url
+                return (time.perf_counter() - start) * 1000 / n
+
+            def batch(operations):
+                start = time.perf_counter()
+                response = client.post(
+                    reverse('api_product_batch'), json.dumps({'operations': operations}),
+                    content_type='application/json',
+                )
+                assert response.status_code == 200, response.content[:500]
+                return (time.perf_counter() - start) * 1000 / n
+
+            cases = [
+                # Разные названия: для похожих продуктов форма показывает другую страницу
+                ('создание', lambda: html([
+                    (reverse('product_add'), {**form, 'name': f'Форма {i}.'}) for i in range(n)
+                ]),
+                 lambda: batch([{'op': 'create', 'data': form}] * n)),
+                ('изменение', lambda: html([
+                    (reverse('product_edit', args=[pk]), {**form, 'quantity': '2'}) for pk in ids(n)
+                ]), lambda: batch([
+                    {'op': 'update', 'id': pk, 'data': {'quantity': 2}} for pk in ids(n)
+                ])),
+                ('отметка', lambda: html([
+                    (reverse('product_mark_used', args=[pk]), {}) for pk in ids(n)
+                ]), lambda: batch([{'op': 'mark_used', 'id': pk} for pk in ids(n)])),
+                ('удаление', lambda: html([
+                    (reverse('product_delete', args=[pk]), {}) for pk in ids(n)
+                ]), lambda: batch([{'op': 'delete', 'id': pk} for pk in ids(n)])),
+            ]
+            for name, by_form, by_batch in cases:
+                form_ms = by_form()
+                batch_ms = by_batch()
+                self.stdout.write(
+                    f'{name:10} HTML {form_ms:6.2f} ms/операция | пакет {batch_ms:6.2f} ms/операция'
+                )
+
+            count = Product.objects.for_user(user).filter(status='active').count()
+            for label, url, params in (
+                ('HTML-список', reverse('product_list'), {'status': 'active'}),
+                ('API limit=1000', reverse('api_products'), {'status': 'active', 'limit': 1000}),
+                ('API 3 поля', reverse('api_products'),
+                 {'status': 'active', 'limit': 1000, 'fields': 'id,name,expiration_date'}),
+            ):
+                def read():
+                    clear_caches()
+                    client.force_login(user)
+                    return client.get(url, params)
+                read_ms, response = timed(read)
+                self.stdout.write(
+                    f'{label:16} {read_ms:7.1f} ms, {len(response.content) / 1024:7.1f} KiB '
+                    f'(активных продуктов: {count})'
+                )
@@ -0,0 +1,95 @@
+"""
+Нагрузочный тест: смешанные быстрые и медленные запросы.
+
+Запросы приходят с постоянным интервалом. Один синхронный WSGI-воркер
+обслуживает их по очереди, и быстрые запросы ждут за медленными целиком; в
+ASGI медленная страница отпускает event loop на время запросов к БД и
+построения отчёта (sync_to_async), и быстрые запросы обслуживаются между ними.
+Задержка считается от момента прихода запроса.
+"""
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+
+from ._bench import bench_database, seed_products
+
+FAST_URL = '/products/?status=warning'
+SLOW_URL = '/products/statistics/'
+
+
+def _summary(latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    return f'mean {statistics.mean(ordered):7.1f} ms, p95 {p95:7.1f} ms'
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает задержки WSGI и ASGI при смешанной нагрузке'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=300)
+        parser.add_argument('--slow', type=int, default=8)
+        parser.add_argument('--fast', type=int, default=32)
+        parser.add_argument('--interval', type=float, default=100,
+                            help='Интервал между запросами, мс')
+
+    def handle(self, *args, **options):
+        with bench_database():
+            user = seed_products(options['products'])
+            urls = self._mixed_urls(options['slow'], options['fast'])
+
+            client = Client()
+            client.force_login(user)
+            client.get(SLOW_URL)
+            interval = options['interval'] / 1000
+            wsgi = self._run_wsgi(client, urls, interval)
+
+            aclient = AsyncClient()
+            aclient.force_login(user)
+            asgi = asyncio.run(self._run_asgi(aclient, urls, interval))
+
+        for title, (wall, fast, slow) in (('WSGI, 1 воркер', wsgi), ('ASGI', asgi)):
+            self.stdout.write(f'{title}: всего {wall:.0f} ms')
+            self.stdout.write(f'  быстрые:   {_summary(fast)}')
+            self.stdout.write(f'  медленные: {_summary(slow)}')
+
+    def _mixed_urls(self, slow, fast):
+        # Медленные запросы равномерно перемешаны с быстрыми
+        step = max(1, (slow + fast) // max(slow, 1))
+        mixed = [FAST_URL] * fast
+        for i in range(slow):
+            mixed.insert(min(i * step, len(mixed)), SLOW_URL)
+        return mixed
+
+    def _run_wsgi(self, client, urls, interval):
+        start = time.perf_counter()
+        fast, slow = [], []
+        for i, url in enumerate(urls):
+            arrival = start + i * interval
+            idle = arrival - time.perf_counter()
+            if idle > 0:
+                time.sleep(idle)
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+            elapsed = (time.perf_counter() - arrival) * 1000
+            (slow if url == SLOW_URL else fast).append(elapsed)
+        return (time.perf_counter() - start) * 1000, fast, slow
+
+    async def _run_asgi(self, client, urls, interval):
+        await client.get(SLOW_URL)
+        start = time.perf_counter()
+        fast, slow = [], []
+
+        async def fetch(i, url):
+            await asyncio.sleep(i * interval)
+            arrival = time.perf_counter()
+            response = await client.get(url)
+            assert response.status_code == 200, response.status_code
+            elapsed = (time.perf_counter() - arrival) * 1000
+            (slow if url == SLOW_URL else fast).append(elapsed)
+
+        await asyncio.gather(*(fetch(i, url) for i, url in enumerate(urls)))
+        return (time.perf_counter() - start) * 1000, fast, slow
@@ -0,0 +1,70 @@
+"""Загрузка справочника продуктов и время ответа автодополнения."""
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from app.catalog import read_catalog
+
+from ._bench import CATEGORY_NAMES, PRODUCT_NAMES, bench_database, seed_products
+
+VARIANTS = ['домашний', 'фермерский', 'деревенский', 'отборный', 'классический', 'премиум']
+
+
+def write_catalog(path, size, seed=42):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(size):
+            name = f'{rng.choice(PRODUCT_NAMES)} {rng.choice(VARIANTS)} {i}'
+            f.write(f'{name}\t{rng.choice(CATEGORY_NAMES)}\n')
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+class Command(BaseCommand):
+    help = 'Измеряет загрузку справочника продуктов и время ответа автодополнения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        queries = [
+            rng.choice(PRODUCT_NAMES + VARIANTS)[:rng.randint(1, 5)]
+            for _ in range(options['queries'])
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'catalog.tsv')
+            write_catalog(path, options['entries'])
+
+            start = time.perf_counter()
+            catalog = read_catalog(path)
+            load_ms = (time.perf_counter() - start) * 1000
+            self.stdout.write(f'Записей: {len(catalog)}, загрузка {load_ms:.0f} ms')
+
+            search = []
+            for query in queries:
+                start = time.perf_counter()
+                catalog.search(query)
+                search.append((time.perf_counter() - start) * 1000)
+            self.stdout.write('поиск в индексе  p50 {:.3f} ms, p99 {:.3f} ms'.format(*percentiles(search)))
+
+            with bench_database(), override_settings(PRODUCT_CATALOG_PATH=path):
+                client = Client()
+                client.force_login(seed_products(0))
+                client.get('/products/autocomplete/', {'q': 'м'})
+                requests = []
+                for query in queries:
+                    start = time.perf_counter()
+                    response = client.get('/products/autocomplete/', {'q': query})
+                    requests.append((time.perf_counter() - start) * 1000)
+                    assert response.status_code == 200
+                self.stdout.write('запрос к view    p50 {:.3f} ms, p99 {:.3f} ms'.format(*percentiles(requests)))
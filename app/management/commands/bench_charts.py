@@ -0,0 +1,76 @@
+"""Сравнение SVG-графиков с прежним путём matplotlib -> PNG -> base64."""
+import base64
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+
+from app import charts
+
+from ._bench import peak_memory, timed
+
+CATEGORIES = ['Молочные продукты', 'Овощи', 'Фрукты', 'Мясо', 'Рыба']
+COUNTS = [42, 35, 20, 12, 7]
+URGENCY = [3, 8, 15, 40]
+
+
+def png_index_chart():
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.bar(CATEGORIES, COUNTS, color=charts.CATEGORY_COLORS)
+    ax.set_title('Топ-5 категорий продуктов')
+    ax.set_xlabel('Категория')
+    ax.set_ylabel('Количество')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', dpi=100)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def png_statistics_chart():
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(12, 6))
+    pie_ax, bar_ax = fig.subplots(1, 2)
+    pie_ax.pie(COUNTS, labels=CATEGORIES, autopct='%1.1f%%')
+    pie_ax.set_title('Распределение по категориям')
+    bar_ax.bar(charts.URGENCY_LABELS, URGENCY, color=charts.URGENCY_COLORS)
+    bar_ax.set_title('Статус продуктов по срочности')
+    bar_ax.set_ylabel('Количество')
+    bar_ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', dpi=100)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def svg_index_chart():
+    return charts.category_bar_chart(CATEGORIES, COUNTS)
+
+
+def svg_statistics_chart():
+    return (
+        charts.category_pie_chart(CATEGORIES, COUNTS)
+        + charts.urgency_bar_chart(URGENCY)
+    )
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время, память и размер SVG и PNG-графиков'
+
+    def handle(self, *args, **options):
+        cases = [
+            ('index, PNG', png_index_chart),
+            ('index, SVG', svg_index_chart),
+            ('statistics, PNG', png_statistics_chart),
+            ('statistics, SVG', svg_statistics_chart),
+        ]
+        for name, func in cases:
+            func()  # прогрев: импорт matplotlib, шрифты
+            ms, payload = timed(func, repeat=10)
+            self.stdout.write(
+                f'{name:16} {ms:8.2f} ms, пик памяти {peak_memory(func) / 1024:8.0f} KiB, '
+                f'размер {len(payload.encode("utf-8")) / 1024:6.1f} KiB'
+            )
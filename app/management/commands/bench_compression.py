@@ -0,0 +1,43 @@
+"""Размер ответа и цена минификации и сжатия для больших страниц."""
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from app.compression import brotli, compress, minify_html
+
+from ._bench import bench_database, seed_products, timed
+
+PAGES = ['/products/', '/', '/products/statistics/']
+
+
+class Command(BaseCommand):
+    help = 'Байты на проводе и время минификации и сжатия для списка из 2000 продуктов и страниц с графиками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        encodings = ['gzip'] + (['br'] if brotli is not None else [])
+        with bench_database():
+            client = Client()
+            client.force_login(seed_products(options['products']))
+            for page in PAGES:
+                with override_settings(HTML_MINIFY=False):
+                    plain_ms, response = timed(lambda: client.get(page))
+                raw = response.content
+                minify_ms, minified = timed(lambda: minify_html(raw))
+                self.stdout.write(
+                    f'{page:24} ответ {plain_ms:6.1f} ms, {len(raw) / 1024:7.1f} KiB | '
+                    f'минификация {minify_ms:5.2f} ms -> {len(minified) / 1024:7.1f} KiB'
+                )
+                for encoding in encodings:
+                    for label, body in (('исходный', raw), ('минифицированный', minified)):
+                        compress_ms, compressed = timed(lambda: compress(body, encoding))
+                        self.stdout.write(
+                            f'{"":24} {encoding:4} {label:16} {compress_ms:6.2f} ms -> '
+                            f'{len(compressed) / 1024:7.1f} KiB'
+                        )
+                    full_ms, full = timed(lambda: client.get(page, HTTP_ACCEPT_ENCODING=encoding))
+                    self.stdout.write(
+                        f'{"":24} {encoding:4} весь ответ через middleware {full_ms:6.1f} ms, '
+                        f'{len(full.content) / 1024:7.1f} KiB'
+                    )
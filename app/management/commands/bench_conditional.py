@@ -0,0 +1,39 @@
+"""Повторный визит на страницы пользователя: полный ответ против 304."""
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from ._bench import bench_database, clear_caches, seed_products, timed
+
+PAGES = ['/products/', '/products/statistics/', '/recommendations/']
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает повторный визит без валидатора и с If-None-Match'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with bench_database():
+            client = Client()
+            client.force_login(seed_products(options['products']))
+            for page in PAGES:
+                def full():
+                    # Без кэша данных: так выглядит визит после вытеснения
+                    clear_caches()
+                    return client.get(page)
+
+                full_ms, response = timed(full)
+                # Кэш очищен - поколение справочников, а с ним и ETag, новые
+                client.get(page)
+                etag = client.get(page)['ETag']
+
+                def revalidate():
+                    return client.get(page, HTTP_IF_NONE_MATCH=etag)
+
+                not_modified_ms, not_modified = timed(revalidate)
+                self.stdout.write(
+                    f'{page:24} {response.status_code}: {full_ms:7.1f} ms, '
+                    f'{len(response.content) / 1024:6.1f} KiB | '
+                    f'{not_modified.status_code}: {not_modified_ms:5.1f} ms'
+                )
@@ -0,0 +1,55 @@
+"""Построение индекса рецептов и время подбора для больших запасов."""
+import os
+import random
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.catalog import get_catalog
+from app.recipes import PRIORITY_WEIGHTS, read_recipes
+
+from .bench_catalog import percentiles
+
+
+def write_corpus(path, size, seed=42):
+    """Синтетический корпус: ингредиенты рецептов из поставляемого файла, перемешанные."""
+    rng = random.Random(seed)
+    ingredients = sorted({i for r in read_recipes(settings.RECIPES_PATH).recipes for i in r.ingredients})
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(size):
+            f.write(f'Рецепт {i}\t{", ".join(rng.sample(ingredients, rng.randint(3, 9)))}\n')
+
+
+class Command(BaseCommand):
+    help = 'Измеряет построение индекса рецептов и подбор для запасов из сотен продуктов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=50_000)
+        parser.add_argument('--runs', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        names = [entry.name for entry in get_catalog().entries]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'recipes.tsv')
+            write_corpus(path, options['recipes'])
+            start = time.perf_counter()
+            index = read_recipes(path)
+            build_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f'Рецептов: {len(index)}, построение индекса {build_ms:.0f} ms')
+
+        for size in (100, 300, 1000):
+            samples = []
+            for _ in range(options['runs']):
+                products = [
+                    (rng.choice(names), rng.random() * rng.choice(list(PRIORITY_WEIGHTS.values())))
+                    for _ in range(size)
+                ]
+                start = time.perf_counter()
+                index.rank(products)
+                samples.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                '{:5} продуктов  p50 {:.2f} ms, p99 {:.2f} ms'.format(size, *percentiles(samples))
+            )
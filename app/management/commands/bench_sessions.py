@@ -0,0 +1,43 @@
+"""Запросы к БД и время на запрос для разных хранилищ сессий."""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ._bench import bench_database, clear_caches, seed_products
+
+URLS = ['/about/', '/products/?status=warning']
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает число обращений к БД на запрос для хранилищ сессий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+
+    def handle(self, *args, **options):
+        n = options['requests']
+        with bench_database():
+            user = seed_products(50)
+            for name, engine in settings.SESSION_ENGINES.items():
+                with override_settings(SESSION_ENGINE=engine):
+                    clear_caches()
+                    client = Client()
+                    client.force_login(user)
+                    client.get(URLS[0])
+                    with CaptureQueriesContext(connection) as ctx:
+                        start = time.perf_counter()
+                        for i in range(n):
+                            client.get(URLS[i % len(URLS)])
+                        elapsed = (time.perf_counter() - start) * 1000 / n
+                    session_queries = sum(
+                        'django_session' in q['sql'] for q in ctx.captured_queries
+                    )
+                self.stdout.write(
+                    f'{name:15} запросов к БД: {len(ctx) / n:4.1f}/запрос, '
+                    f'из них к django_session: {session_queries / n:4.1f}, '
+                    f'{elapsed:6.2f} ms/запрос'
+                )
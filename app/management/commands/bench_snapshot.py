@@ -0,0 +1,81 @@
+"""Снимок продуктов в памяти: выборки без БД, попадания и расход памяти."""
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from app.models import Category, Product
+from app.recommendations import build_recommendations
+from app.snapshot import get_store, snapshot_for
+
+from ._bench import bench_database, seed_products, timed
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает выборки продуктов из БД и из снимка, моделирует попадания в снимки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=20_000)
+        parser.add_argument('--memory-mb', type=float, default=2)
+        parser.add_argument('--write-rate', type=float, default=0.02)
+
+    def handle(self, *args, **options):
+        with bench_database():
+            self.compare(options['products'])
+            self.simulate(options)
+
+    def compare(self, size):
+        user = seed_products(size)
+        today = timezone.now().date()
+        categories = {c.pk: c for c in Category.objects.all()}
+        with override_settings(INVENTORY_SNAPSHOT_MB=64):
+            snapshot = snapshot_for(user.pk)
+            cases = [
+                ('список активных', lambda: list(
+                    Product.objects.for_user(user).filter(status='active')
+                    .order_by('expiration_date').select_related('category')
+                ), lambda: snapshot.products(
+                    snapshot.order(snapshot.select(today), 'expiration_date'), categories
+                )),
+                ('скоро истекают', lambda: Product.objects.for_user(user).filter(
+                    status='active', expiration_date__gte=today,
+                    expiration_date__lte=today + timedelta(days=2),
+                ).count(), lambda: len(snapshot.select(today, 'warning'))),
+            ]
+            for name, from_db, from_snapshot in cases:
+                db_ms, _ = timed(from_db)
+                snapshot_ms, _ = timed(from_snapshot)
+                self.stdout.write(f'{name:20} БД {db_ms:7.2f} ms | снимок {snapshot_ms:7.2f} ms')
+            snapshot_ms, _ = timed(lambda: build_recommendations(user, today))
+        with override_settings(INVENTORY_SNAPSHOT_MB=0):
+            db_ms, _ = timed(lambda: build_recommendations(user, today))
+        self.stdout.write(f'{"рекомендации":20} БД {db_ms:7.2f} ms | снимок {snapshot_ms:7.2f} ms')
+        self.stdout.write(f'Снимок {size} продуктов: {snapshot.nbytes / 1024:.1f} KiB')
+
+    def simulate(self, options):
+        rng = random.Random(7)
+        users = [
+            seed_products(rng.randint(50, options['products']), username=f'bench{i}', seed=i)
+            for i in range(options['users'])
+        ]
+        # Немногие пользователи активны постоянно, большинство заходит редко
+        weights = [1 / (rank + 1) for rank in range(len(users))]
+        with override_settings(INVENTORY_SNAPSHOT_MB=options['memory_mb']):
+            store = get_store()
+            for user in rng.choices(users, weights, k=options['requests']):
+                if rng.random() < options['write_rate']:
+                    product = Product.objects.for_user(user).filter(status='active').first()
+                    if product is not None:
+                        product.save(update_fields=['updated_at'])
+                store.get(user.pk)
+            stats = store.stats()
+        self.stdout.write(
+            f'{options["requests"]} обращений, {len(users)} пользователей: '
+            f'попаданий {stats["hit_rate"]:.1%}, вытеснено {stats["evictions"]}, '
+            f'в памяти {stats["users"]} снимков, '
+            f'{stats["bytes"] / 2**20:.2f} из {stats["max_bytes"] / 2**20:.2f} МБ'
+        )
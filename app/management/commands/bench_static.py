@@ -0,0 +1,39 @@
+"""Вес локальной статики страницы до и после сборки collectstatic."""
+import re
+import tempfile
+
+from django.contrib.staticfiles import finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+STATIC_REF = re.compile(r'(?:href|src)="/static/([^"]+)"')
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает вес статики страницы входа без сборки и после collectstatic'
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root):
+            # Без манифеста ссылки указывают на исходные файлы
+            page = Client().get('/login/').content.decode()
+            before = {name: len(open(finders.find(name), 'rb').read()) for name in STATIC_REF.findall(page)}
+
+            call_command('collectstatic', interactive=False, verbosity=0)
+            client = Client()
+            page = client.get('/login/').content.decode()
+            after = {}
+            for name in STATIC_REF.findall(page):
+                response = client.get(f'/static/{name}', HTTP_ACCEPT_ENCODING='br, gzip')
+                after[name] = (
+                    len(response.content),
+                    response.get('Content-Encoding', '-'),
+                    response['Cache-Control'],
+                )
+
+        for name, size in before.items():
+            self.stdout.write(f'до    {name:40} {size:7} B')
+        for name, (size, encoding, cache_control) in after.items():
+            self.stdout.write(f'после {name:40} {size:7} B  {encoding:5} {cache_control}')
+        total_after = sum(size for size, _, _ in after.values())
+        self.stdout.write(f'Итого: {sum(before.values())} B -> {total_after} B')
@@ -0,0 +1,86 @@
+"""Время рендеринга страниц без кэша шаблонов и с кэшированным загрузчиком и фрагментами."""
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+
+from app.forms import ProductFilterForm, ProductForm
+from app.models import Category, Product
+from app.views import _index_context
+
+from ._bench import BENCH_CACHES, bench_database, clear_caches, seed_products, timed
+
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+# Как до кэширования: загрузчики без кэша, фрагменты не сохраняются
+UNCACHED_TEMPLATES = [{
+    **settings.TEMPLATES[0],
+    'OPTIONS': {**settings.TEMPLATES[0]['OPTIONS'], 'loaders': LOADERS},
+}]
+UNCACHED_CACHES = {
+    **BENCH_CACHES,
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+CACHED_TEMPLATES = [{
+    **settings.TEMPLATES[0],
+    'OPTIONS': {
+        **settings.TEMPLATES[0]['OPTIONS'],
+        'loaders': [('django.template.loaders.cached.Loader', LOADERS)],
+    },
+}]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает рендеринг шаблонов без кэша и с кэшированным загрузчиком и кэшем фрагментов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with bench_database():
+            user = seed_products(options['products'])
+            request = RequestFactory().get('/products/')
+            request.user = user
+            anonymous = RequestFactory().get('/about/')
+            anonymous.user = AnonymousUser()
+            pages = [
+                ('about.html', lambda: {}, anonymous),
+                ('index.html', lambda: async_to_sync(_index_context)(user), request),
+                ('product_add.html', lambda: {
+                    'form': ProductForm(), 'categories': Category.objects.all(),
+                }, request),
+                ('product_list.html', lambda: {
+                    'form': ProductFilterForm(),
+                    'products': list(
+                        Product.objects.for_user(user).filter(status='active')
+                        .select_related('category')
+                    ),
+                    'product_stats': {},
+                    'categories': Category.objects.all(),
+                    'selected_category': None,
+                }, request),
+            ]
+            for template, make_context, page_request in pages:
+                context = make_context()
+
+                def render():
+                    return render_to_string(template, dict(context), page_request)
+
+                with override_settings(TEMPLATES=UNCACHED_TEMPLATES, CACHES=UNCACHED_CACHES):
+                    before_ms, _ = timed(render, options['repeat'])
+                with override_settings(TEMPLATES=CACHED_TEMPLATES, CACHES=UNCACHED_CACHES):
+                    loader_ms, _ = timed(render, options['repeat'])
+                with override_settings(TEMPLATES=CACHED_TEMPLATES):
+                    clear_caches()
+                    # Первый рендеринг компилирует шаблон и заполняет фрагменты
+                    cold_ms, _ = timed(render, 1)
+                    after_ms, _ = timed(render, options['repeat'])
+                self.stdout.write(
+                    f'{template:20} без кэша {before_ms:6.2f} ms | загрузчик {loader_ms:6.2f} ms | '
+                    f'первый с фрагментами {cold_ms:6.2f} ms | с фрагментами {after_ms:6.2f} ms'
+                )
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.forecasting import compute_forecasts, history_frame, store_forecasts
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает прогнозы потребления по всем пользователям и категориям'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        history = history_frame()
+        stored = store_forecasts(compute_forecasts(history))
+        self.stdout.write(self.style.SUCCESS(
+            f'Истории: {len(history)} строк, прогнозов: {stored}, '
+            f'{(time.perf_counter() - start) * 1000:.0f} ms'
+        ))
@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.cache import bump_inventory_generation
+from app.events import muted
+from app.models import ArchivedProduct, Category, Product, ProductEvent, StoredRecommendation
+from app.recommendations import mark_stale
+from app.sharding import PRIMARY, shard_for
+from app.tasks import schedule_recommendations
+
+# Ограничение SQLite на число параметров в одном запросе
+CHUNK = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит продукты пользователей в шарды, заданные PRODUCT_SHARDS. '
+        'Запускайте после включения шардирования и после изменения числа шардов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько продуктов будет перенесено',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.PRODUCT_SHARDS:
+            raise CommandError('PRODUCT_SHARDS не задан: переносить некуда')
+        dry_run = options['dry_run']
+        if not dry_run:
+            self.sync_categories()
+        users = products = 0
+        for source in dict.fromkeys([PRIMARY, *settings.PRODUCT_SHARDS]):
+            user_ids = set()
+            for model in (Product, ArchivedProduct):
+                user_ids.update(
+                    model.objects.using(source).order_by()
+                    .values_list('user_id', flat=True).distinct()
+                )
+            for user_id in sorted(user_ids):
+                target = shard_for(user_id)
+                if target == source:
+                    continue
+                if dry_run:
+                    count = sum(
+                        model.objects.using(source).filter(user_id=user_id).count()
+                        for model in (Product, ArchivedProduct)
+                    )
+                else:
+                    count = self.move_user(user_id, source, target)
+                self.stdout.write(f'Пользователь {user_id}: {source} -> {target}, продуктов: {count}')
+                users += 1
+                products += count
+        verb = 'Будет перенесено' if dry_run else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} пользователей: {users}, продуктов: {products}'
+        ))
+
+    def sync_categories(self):
+        """Копирует справочник категорий из основной БД на каждый шард."""
+        categories = list(Category.objects.using(PRIMARY).all())
+        fields = [f.attname for f in Category._meta.concrete_fields if not f.primary_key]
+        for shard in settings.PRODUCT_SHARDS:
+            with transaction.atomic(using=shard):
+                existing = Category.objects.using(shard)
+                existing.exclude(pk__in=[c.pk for c in categories]).delete()
+                known = set(existing.values_list('pk', flat=True))
+                existing.bulk_update([c for c in categories if c.pk in known], fields, batch_size=CHUNK)
+                existing.bulk_create([c for c in categories if c.pk not in known], batch_size=CHUNK)
+
+    def copy_rows(self, model, rows, target, stamp_fields):
+        """Вставляет rows в target с новыми id, сохраняя даты stamp_fields."""
+        # bulk_create проставит auto_now/auto_now_add - запоминаем исходные даты
+        stamps = [[getattr(row, field) for field in stamp_fields] for row in rows]
+        for row in rows:
+            row.pk = None
+        model.objects.using(target).bulk_create(rows, batch_size=CHUNK)
+        for row, values in zip(rows, stamps):
+            for field, value in zip(stamp_fields, values):
+                setattr(row, field, value)
+        model.objects.using(target).bulk_update(rows, stamp_fields, batch_size=CHUNK)
+
+    def history_ids(self, user_id, ids, target):
+        """
+        Новые id для продуктов пользователя, которых больше нет среди строк
+        Product: удалённых и архивных. Они отрицательные и меньше всех уже
+        выданных, поэтому не совпадут ни с одним id продукта ни в одной БД.
+        Строки пользователя, уже лежащие в target, сохраняют свои id.
+        """
+        kept = set(Product.objects.using(target).filter(user_id=user_id).values_list('pk', flat=True))
+        kept.update(
+            ArchivedProduct.objects.using(target).filter(user_id=user_id)
+            .values_list('product_id', flat=True)
+        )
+        next_id = min([0, *ids, *kept]) - 1
+        mapping = {}
+        for old_id in sorted(ids - kept):
+            if old_id > 0:
+                mapping[old_id] = next_id
+                next_id -= 1
+        return mapping
+
+    def move_user(self, user_id, source, target):
+        products = list(Product.objects.using(source).filter(user_id=user_id).order_by('pk'))
+        archived = list(ArchivedProduct.objects.using(source).filter(user_id=user_id))
+        old_ids = [product.pk for product in products]
+        with transaction.atomic(), transaction.atomic(using=target), transaction.atomic(using=source):
+            events = list(ProductEvent.objects.filter(user_id=user_id).only('pk', 'product_id'))
+            history = {event.product_id for event in events} | {row.product_id for row in archived}
+            # id продуктов уникальны только внутри БД - журнал и архив ссылаются на новые
+            mapping = self.history_ids(user_id, history - set(old_ids), target)
+            for row in archived:
+                row.product_id = mapping.get(row.product_id, row.product_id)
+            self.copy_rows(Product, products, target, ['created_at', 'updated_at'])
+            self.copy_rows(ArchivedProduct, archived, target, ['archived_at'])
+            mapping.update(zip(old_ids, [product.pk for product in products]))
+            # Каждая строка журнала переписывается по pk ровно один раз: старые
+            # и новые id могут пересекаться, и повторная замена их бы спутала
+            changed = [event for event in events if event.product_id in mapping]
+            for event in changed:
+                event.product_id = mapping[event.product_id]
+            ProductEvent.objects.bulk_update(changed, ['product_id'], batch_size=CHUNK)
+            with muted():
+                StoredRecommendation.objects.using(source).filter(user_id=user_id).delete()
+                Product.objects.using(source).filter(user_id=user_id).delete()
+                ArchivedProduct.objects.using(source).filter(user_id=user_id).delete()
+        bump_inventory_generation(user_id)
+        mark_stale([user_id])
+        schedule_recommendations(user_id)
+        return len(products) + len(archived)
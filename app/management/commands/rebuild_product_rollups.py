@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.events import STATUS_EVENTS, rebuild_rollups
+from app.models import Product, ProductEvent
+from app.sharding import product_databases
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневные агрегаты из журнала событий продуктов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill', action='store_true',
+            help='Сначала создать события для продуктов, у которых их ещё нет',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            created = self.backfill(options['batch_size'])
+            self.stdout.write(f'Добавлено событий: {created}')
+        rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS('Агрегаты пересчитаны'))
+
+    def backfill(self, batch_size):
+        """События для продуктов, созданных до появления журнала."""
+        created = 0
+        batch = []
+        for product in self._unlogged_products(batch_size):
+            batch.append(self._event(product, 'created', product.created_at.date()))
+            if product.status in STATUS_EVENTS:
+                batch.append(self._event(product, product.status, product.updated_at.date()))
+            if len(batch) >= batch_size:
+                created += self._flush(batch)
+        created += self._flush(batch)
+        return created
+
+    def _unlogged_products(self, batch_size):
+        fields = ('user_id', 'category_id', 'quantity', 'estimated_price',
+                  'status', 'created_at', 'updated_at')
+        if not settings.PRODUCT_SHARDS:
+            logged = ProductEvent.objects.values('product_id')
+            products = Product.objects.exclude(pk__in=logged).order_by('pk').only(*fields)
+            yield from products.iterator(chunk_size=batch_size)
+            return
+        # id продуктов уникальны только внутри шарда - сверяем пары
+        logged = set(ProductEvent.objects.values_list('user_id', 'product_id'))
+        for database in product_databases():
+            products = Product.objects.using(database).order_by('pk').only(*fields)
+            for product in products.iterator(chunk_size=batch_size):
+                if (product.user_id, product.pk) not in logged:
+                    yield product
+
+    def _event(self, product, event, date):
+        return ProductEvent(
+            user_id=product.user_id,
+            product_id=product.pk,
+            category_id=product.category_id,
+            event=event,
+            quantity=product.quantity,
+            price=product.estimated_price,
+            date=date,
+        )
+
+    def _flush(self, batch):
+        with transaction.atomic():
+            ProductEvent.objects.bulk_create(batch)
+        count = len(batch)
+        batch.clear()
+        return count
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.recommendations import refresh_stale
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает устаревшие сохранённые рекомендации. '
+        'Запускайте сразу после полуночи, чтобы страницы не рассчитывали рекомендации при чтении.'
+    )
+
+    def handle(self, *args, **options):
+        refreshed = refresh_stale(timezone.now().date())
+        self.stdout.write(self.style.SUCCESS(f'Обновлено пользователей: {refreshed}'))
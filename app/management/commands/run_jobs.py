@@ -0,0 +1,81 @@
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from app import jobs
+
+
+def _init_process():
+    # При spawn процесс стартует с нуля; при fork наследует соединения родителя
+    django.setup()
+    connections.close_all()
+
+
+def _execute(job_id):
+    try:
+        return jobs.run(job_id)
+    finally:
+        # Поток пула живёт долго - не держим соединение между задачами
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Воркер очереди задач: забирает задачи из таблицы Job по приоритету и '
+        'выполняет их в пуле процессов (или потоков с --threads).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS)
+        parser.add_argument('--threads', action='store_true', help='Пул потоков вместо процессов')
+        parser.add_argument('--poll', type=float, default=1.0, help='Пауза при пустой очереди, с')
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и выйти')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        pool = ThreadPoolExecutor if options['threads'] else ProcessPoolExecutor
+        pool_options = {} if options['threads'] else {'initializer': _init_process}
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        name = jobs.worker_name()
+        self.stdout.write(f'Воркер {name}: {workers} {"потоков" if options["threads"] else "процессов"}')
+        done = failed = 0
+        running = set()
+        # Дочерние процессы не должны унаследовать открытое соединение
+        connections.close_all()
+        with pool(max_workers=workers, **pool_options) as executor:
+            try:
+                while not self.stopping:
+                    jobs.requeue_stale()
+                    free = workers - len(running)
+                    if free:
+                        for job_id in jobs.claim(free, name):
+                            running.add(executor.submit(_execute, job_id))
+                    if not running:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll'])
+                        continue
+                    finished, running = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        if future.result():
+                            done += 1
+                        else:
+                            failed += 1
+            except KeyboardInterrupt:
+                self.stopping = True
+            # Начатые задачи доводятся до конца, новые не забираются
+            for future in wait(running).done:
+                if future.result():
+                    done += 1
+                else:
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {done}, с ошибкой: {failed}'))
+
+    def stop(self, signum, frame):
+        self.stopping = True
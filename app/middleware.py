@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from importlib import import_module
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from .routers import PIN_COOKIE, SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+_cleanup_lock = threading.Lock()
+_last_cleanup = None
+
+
+def clear_expired_sessions():
+    engine = import_module(settings.SESSION_ENGINE)
+    engine.SessionStore.clear_expired()
+
+
+def _cleanup_in_thread():
+    try:
+        clear_expired_sessions()
+    except DatabaseError:
+        # SQLite может быть занят записью; попробуем в следующий интервал
+        logger.warning('Не удалось очистить просроченные сессии', exc_info=True)
+    finally:
+        connections.close_all()
+
+
+def schedule_session_cleanup():
+    """
+    Раз в SESSION_CLEANUP_INTERVAL секунд чистит сессии в фоновом потоке.
+    Первая очистка - через интервал после старта процесса; 0 отключает очистку.
+    """
+    global _last_cleanup
+    interval = settings.SESSION_CLEANUP_INTERVAL
+    now = time.monotonic()
+    if interval <= 0 or (_last_cleanup is not None and now - _last_cleanup < interval):
+        return
+    if not _cleanup_lock.acquire(blocking=False):
+        return
+    try:
+        if _last_cleanup is None:
+            _last_cleanup = now
+            return
+        if now - _last_cleanup < interval:
+            return
+        _last_cleanup = now
+    finally:
+        _cleanup_lock.release()
+    threading.Thread(
+        target=_cleanup_in_thread, name='session-cleanup', daemon=True
+    ).start()
+
+
+class SessionCleanupMiddleware:
+    """Запускает фоновую очистку просроченных сессий, не задерживая ответ."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        schedule_session_cleanup()
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        schedule_session_cleanup()
+        return await self.get_response(request)
+
+
+class ReplicaPinMiddleware:
+    """После запроса с записью клиент REPLICA_LAG секунд читает из основной БД."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._pin(request, await self.get_response(request))
+
+    @staticmethod
+    def _pin(request, response):
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_LAG, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProductStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('event', models.CharField(choices=[('created', 'Добавлен'), ('used', 'Использован'), ('expired', 'Просрочен'), ('thrown', 'Выброшен'), ('deleted', 'Удалён')], max_length=10, verbose_name='Событие')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество событий')),
+                ('quantity', models.FloatField(default=0, verbose_name='Суммарное количество')),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Суммарная стоимость')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='app.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_product_stats', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Дневная статистика',
+                'verbose_name_plural': 'Дневная статистика',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['user', 'date', 'event'], name='app_dailypr_user_id_dcbbca_idx')],
+                'unique_together': {('user', 'date', 'category', 'event')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField(verbose_name='ID продукта')),
+                ('event', models.CharField(choices=[('created', 'Добавлен'), ('used', 'Использован'), ('expired', 'Просрочен'), ('thrown', 'Выброшен'), ('deleted', 'Удалён')], max_length=10, verbose_name='Событие')),
+                ('quantity', models.FloatField(default=1, verbose_name='Количество')),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Стоимость')),
+                ('date', models.DateField(default=django.utils.timezone.now, verbose_name='Дата')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='app.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_events', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Событие продукта',
+                'verbose_name_plural': 'События продуктов',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'date'], name='app_product_user_id_15ecc8_idx')],
+            },
+        ),
+    ]
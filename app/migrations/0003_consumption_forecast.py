@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_product_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumptionForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('used_count', models.PositiveIntegerField(default=0, verbose_name='Использовано')),
+                ('wasted_count', models.PositiveIntegerField(default=0, verbose_name='Выброшено и просрочено')),
+                ('avg_days_to_use', models.FloatField(blank=True, null=True, verbose_name='Среднее число дней от покупки до использования')),
+                ('waste_rate', models.FloatField(default=0, verbose_name='Доля отходов')),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='app.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumption_forecasts', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Прогноз потребления',
+                'verbose_name_plural': 'Прогнозы потребления',
+                'unique_together': {('user', 'category')},
+            },
+        ),
+    ]
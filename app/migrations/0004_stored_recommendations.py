@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_consumption_forecast'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('computed_version', models.PositiveIntegerField(blank=True, null=True)),
+                ('computed_on', models.DateField(blank=True, null=True, verbose_name='Рассчитано на дату')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_batch', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Пакет рекомендаций',
+                'verbose_name_plural': 'Пакеты рекомендаций',
+            },
+        ),
+        migrations.CreateModel(
+            name='StoredRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(verbose_name='Позиция')),
+                ('urgency', models.CharField(choices=[('danger', 'Просрочено'), ('warning', 'Срочно'), ('info', 'Скоро')], max_length=10, verbose_name='Срочность')),
+                ('days_remaining', models.IntegerField(verbose_name='Осталось дней')),
+                ('title', models.CharField(max_length=200, verbose_name='Заголовок')),
+                ('text', models.TextField(verbose_name='Текст рекомендации')),
+                ('icon', models.CharField(max_length=50, verbose_name='Иконка')),
+                ('action_text', models.CharField(blank=True, max_length=100, verbose_name='Текст действия')),
+                ('action_link', models.CharField(blank=True, max_length=500, verbose_name='Ссылка действия')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stored_recommendations', to='app.product', verbose_name='Продукт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stored_recommendations', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Сохранённая рекомендация',
+                'verbose_name_plural': 'Сохранённые рекомендации',
+                'ordering': ['position'],
+                'indexes': [models.Index(fields=['user', 'position'], name='app_storedr_user_id_bee240_idx')],
+            },
+        ),
+    ]
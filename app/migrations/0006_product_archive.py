@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:00
+
+import app.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_product_shards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField(verbose_name='ID продукта')),
+                ('name', models.CharField(max_length=200, verbose_name='Название продукта')),
+                ('expiration_date', models.DateField(verbose_name='Срок годности до')),
+                ('purchase_date', models.DateField(verbose_name='Дата покупки')),
+                ('quantity', models.FloatField(verbose_name='Количество')),
+                ('unit', models.CharField(choices=[('шт', 'шт'), ('кг', 'кг'), ('г', 'г'), ('л', 'л'), ('мл', 'мл'), ('уп', 'уп')], max_length=10, verbose_name='Единица измерения')),
+                ('storage', models.CharField(blank=True, choices=[('fridge', 'Холодильник'), ('freezer', 'Морозилка'), ('pantry', 'Кладовая'), ('room', 'Комнатная температура')], max_length=20, verbose_name='Место хранения')),
+                ('priority', models.CharField(choices=[('low', 'Низкий'), ('medium', 'Средний'), ('high', 'Высокий')], max_length=10, verbose_name='Приоритет использования')),
+                ('estimated_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Примерная стоимость')),
+                ('notes', models.TextField(blank=True, verbose_name='Заметки')),
+                ('status', models.CharField(choices=[('active', 'Активный'), ('used', 'Использован'), ('expired', 'Просрочен'), ('thrown', 'Выброшен')], max_length=10, verbose_name='Статус')),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='app.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_products', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Архивный продукт',
+                'verbose_name_plural': 'Архив продуктов',
+                'ordering': ['expiration_date', 'priority'],
+                'indexes': [models.Index(fields=['user', 'status'], name='app_archive_user_id_6234bf_idx')],
+            },
+            bases=(app.models.ExpirationMixin, models.Model),
+        ),
+    ]
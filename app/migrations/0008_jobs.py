@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:17
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_calendar_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Задача')),
+                ('args', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Аргументы')),
+                ('priority', models.IntegerField(default=0, verbose_name='Приоритет')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('dedup_key', models.CharField(blank=True, max_length=200, null=True, verbose_name='Ключ дедупликации')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name='Максимум попыток')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Запустить не раньше')),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('result', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='Результат')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задача',
+                'verbose_name_plural': 'Задачи',
+                'indexes': [models.Index(fields=['status', 'priority', 'run_at'], name='app_job_status_73b9c2_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('dedup_key',), name='job_pending_dedup')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedproduct',
+            name='notifications',
+            field=models.BooleanField(default=True, verbose_name='Уведомления'),
+        ),
+    ]
@@ -1,8 +1,14 @@
+import secrets
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 
+from .sharding import shard_for
+
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название категории")
     default_shelf_life_days = models.IntegerField(
@@ -25,7 +31,44 @@ class Category(models.Model):
         return self.name
 
 
-class Product(models.Model):
+class UserShardedQuerySet(models.QuerySet):
+    """Строки пользователя из его шарда (см. app.sharding)."""
+
+    def for_user(self, user):
+        user_id = getattr(user, 'pk', user)
+        queryset = self.filter(user_id=user_id)
+        if settings.PRODUCT_SHARDS:
+            queryset = queryset.using(shard_for(user_id))
+        return queryset
+
+    def create(self, **kwargs):
+        if self._db is None and settings.PRODUCT_SHARDS:
+            user = kwargs.get('user')
+            user_id = user.pk if user is not None else kwargs.get('user_id')
+            return self.using(shard_for(user_id)).create(**kwargs)
+        return super().create(**kwargs)
+
+
+class ExpirationMixin:
+    @property
+    def days_remaining(self):
+        delta = self.expiration_date - timezone.now().date()
+        return delta.days
+    
+    @property
+    def status_color(self):
+        days = self.days_remaining
+        if days < 0:
+            return 'danger'
+        elif days <= 2:
+            return 'warning'
+        elif days <= 7:
+            return 'info'
+        else:
+            return 'success'
+
+
+class Product(ExpirationMixin, models.Model):
     """Продукт пользователя"""
     STATUS_CHOICES = [
         ('active', 'Активный'),
@@ -60,7 +103,9 @@ class Product(models.Model):
         User, 
         on_delete=models.CASCADE, 
         related_name='products',
-        verbose_name="Пользователь"
+        verbose_name="Пользователь",
+        # Пользователи живут в основной БД, продукты - возможно, в шарде
+        db_constraint=False,
     )
     name = models.CharField(max_length=200, verbose_name="Название продукта")
     category = models.ForeignKey(
@@ -118,6 +163,9 @@ class Product(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserShardedQuerySet.as_manager()
+    is_archived = False
     
     class Meta:
         verbose_name = "Продукт"
@@ -126,23 +174,77 @@ class Product(models.Model):
     
     def __str__(self):
         return f"{self.name} ({self.user.username})"
-    
-    @property
-    def days_remaining(self):
-        delta = self.expiration_date - timezone.now().date()
-        return delta.days
-    
-    @property
-    def status_color(self):
-        days = self.days_remaining
-        if days < 0:
-            return 'danger'
-        elif days <= 2:
-            return 'warning'
-        elif days <= 7:
-            return 'info'
-        else:
-            return 'success'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Статус на момент загрузки: по нему сигналы видят смену статуса
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+
+class ArchivedProduct(ExpirationMixin, models.Model):
+    """
+    Использованный, выброшенный или просроченный продукт, перенесённый из
+    Product командой archive_products. Хранится в том же шарде, что и
+    продукты пользователя.
+    """
+    ARCHIVED_FIELDS = (
+        'user_id', 'name', 'category_id', 'expiration_date', 'purchase_date',
+        'quantity', 'unit', 'storage', 'priority', 'estimated_price', 'notes',
+        'status', 'notifications', 'created_at', 'updated_at',
+    )
+
+    product_id = models.BigIntegerField(verbose_name="ID продукта")
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_products',
+        verbose_name="Пользователь",
+        db_constraint=False,
+    )
+    name = models.CharField(max_length=200, verbose_name="Название продукта")
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Категория"
+    )
+    expiration_date = models.DateField(verbose_name="Срок годности до")
+    purchase_date = models.DateField(verbose_name="Дата покупки")
+    quantity = models.FloatField(verbose_name="Количество")
+    unit = models.CharField(max_length=10, choices=Product.UNIT_CHOICES, verbose_name="Единица измерения")
+    storage = models.CharField(max_length=20, choices=Product.STORAGE_CHOICES, blank=True, verbose_name="Место хранения")
+    priority = models.CharField(max_length=10, choices=Product.PRIORITY_CHOICES, verbose_name="Приоритет использования")
+    estimated_price = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Примерная стоимость"
+    )
+    notes = models.TextField(blank=True, verbose_name="Заметки")
+    status = models.CharField(max_length=10, choices=Product.STATUS_CHOICES, verbose_name="Статус")
+    notifications = models.BooleanField(default=True, verbose_name="Уведомления")
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = UserShardedQuerySet.as_manager()
+    is_archived = True
+
+    class Meta:
+        verbose_name = "Архивный продукт"
+        verbose_name_plural = "Архив продуктов"
+        ordering = ['expiration_date', 'priority']
+        indexes = [models.Index(fields=['user', 'status'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.user.username})"
+
+    @classmethod
+    def from_product(cls, product):
+        return cls(
+            product_id=product.pk,
+            **{field: getattr(product, field) for field in cls.ARCHIVED_FIELDS},
+        )
 
 
 class RecommendationTemplate(models.Model):
@@ -177,3 +279,270 @@ class RecommendationTemplate(models.Model):
     
     def __str__(self):
         return f"{self.title} ({self.days_before_expiry} дней)"
+
+
+class ProductEvent(models.Model):
+    """Событие жизненного цикла продукта. Журнал только пополняется."""
+    EVENT_CHOICES = [
+        ('created', 'Добавлен'),
+        ('used', 'Использован'),
+        ('expired', 'Просрочен'),
+        ('thrown', 'Выброшен'),
+        ('deleted', 'Удалён'),
+    ]
+    WASTE_EVENTS = ('expired', 'thrown')
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='product_events',
+        verbose_name="Пользователь"
+    )
+    # Не ForeignKey: история должна пережить удаление продукта
+    product_id = models.BigIntegerField(verbose_name="ID продукта")
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Категория"
+    )
+    event = models.CharField(max_length=10, choices=EVENT_CHOICES, verbose_name="Событие")
+    quantity = models.FloatField(default=1, verbose_name="Количество")
+    price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name="Стоимость"
+    )
+    date = models.DateField(default=timezone.now, verbose_name="Дата")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Событие продукта"
+        verbose_name_plural = "События продуктов"
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'date'])]
+
+    def __str__(self):
+        return f"{self.get_event_display()} #{self.product_id} ({self.date})"
+
+
+class DailyProductStats(models.Model):
+    """Дневной агрегат событий по пользователю и категории."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='daily_product_stats',
+        verbose_name="Пользователь"
+    )
+    date = models.DateField(verbose_name="Дата")
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Категория"
+    )
+    event = models.CharField(
+        max_length=10,
+        choices=ProductEvent.EVENT_CHOICES,
+        verbose_name="Событие"
+    )
+    count = models.PositiveIntegerField(default=0, verbose_name="Количество событий")
+    quantity = models.FloatField(default=0, verbose_name="Суммарное количество")
+    price = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Суммарная стоимость"
+    )
+
+    class Meta:
+        verbose_name = "Дневная статистика"
+        verbose_name_plural = "Дневная статистика"
+        ordering = ['-date']
+        unique_together = ('user', 'date', 'category', 'event')
+        indexes = [models.Index(fields=['user', 'date', 'event'])]
+
+    def __str__(self):
+        return f"{self.user.username} {self.date} {self.event}: {self.count}"
+
+
+class ConsumptionForecast(models.Model):
+    """Скорость потребления и доля отходов по категории для пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='consumption_forecasts',
+        verbose_name="Пользователь"
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name="Категория"
+    )
+    used_count = models.PositiveIntegerField(default=0, verbose_name="Использовано")
+    wasted_count = models.PositiveIntegerField(default=0, verbose_name="Выброшено и просрочено")
+    avg_days_to_use = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="Среднее число дней от покупки до использования"
+    )
+    waste_rate = models.FloatField(default=0, verbose_name="Доля отходов")
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Прогноз потребления"
+        verbose_name_plural = "Прогнозы потребления"
+        unique_together = ('user', 'category')
+
+    def __str__(self):
+        return f"{self.user.username}: {self.category or 'Без категории'}"
+
+
+class RecommendationBatch(models.Model):
+    """Состояние сохранённых рекомендаций пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recommendation_batch',
+        verbose_name="Пользователь"
+    )
+    # Увеличивается при каждом изменении, влияющем на рекомендации
+    version = models.PositiveIntegerField(default=0)
+    computed_version = models.PositiveIntegerField(null=True, blank=True)
+    computed_on = models.DateField(null=True, blank=True, verbose_name="Рассчитано на дату")
+
+    class Meta:
+        verbose_name = "Пакет рекомендаций"
+        verbose_name_plural = "Пакеты рекомендаций"
+
+    def __str__(self):
+        return f"{self.user.username} ({self.computed_on})"
+
+
+class StoredRecommendation(models.Model):
+    """Готовая рекомендация; строки пользователя хранятся уже отсортированными."""
+    URGENCY_CHOICES = [
+        ('danger', 'Просрочено'),
+        ('warning', 'Срочно'),
+        ('info', 'Скоро'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stored_recommendations',
+        verbose_name="Пользователь",
+        db_constraint=False,
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='stored_recommendations',
+        verbose_name="Продукт"
+    )
+    position = models.PositiveIntegerField(verbose_name="Позиция")
+    urgency = models.CharField(max_length=10, choices=URGENCY_CHOICES, verbose_name="Срочность")
+    days_remaining = models.IntegerField(verbose_name="Осталось дней")
+    title = models.CharField(max_length=200, verbose_name="Заголовок")
+    text = models.TextField(verbose_name="Текст рекомендации")
+    icon = models.CharField(max_length=50, verbose_name="Иконка")
+    action_text = models.CharField(max_length=100, blank=True, verbose_name="Текст действия")
+    action_link = models.CharField(max_length=500, blank=True, verbose_name="Ссылка действия")
+
+    objects = UserShardedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Сохранённая рекомендация"
+        verbose_name_plural = "Сохранённые рекомендации"
+        ordering = ['position']
+        indexes = [models.Index(fields=['user', 'position'])]
+
+    def __str__(self):
+        return f"{self.title} ({self.user.username})"
+
+    @property
+    def template(self):
+        # Шаблоны обращаются к rec.template.title и т.п., как к словарям
+        # рекомендаций, которые строились на лету
+        return self
+
+
+class CalendarFeed(models.Model):
+    """Секретная ссылка на календарь сроков годности пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='calendar_feed',
+        verbose_name="Пользователь"
+    )
+    token = models.CharField(max_length=64, unique=True, verbose_name="Токен")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Календарь"
+        verbose_name_plural = "Календари"
+
+    def __str__(self):
+        return f"Календарь {self.user.username}"
+
+    @staticmethod
+    def new_token():
+        return secrets.token_urlsafe(32)
+
+
+class Job(models.Model):
+    """Отложенная задача для воркера run_jobs (см. app.jobs)."""
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=100, verbose_name="Задача")
+    args = models.JSONField(default=list, encoder=DjangoJSONEncoder, verbose_name="Аргументы")
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='jobs',
+        verbose_name="Пользователь"
+    )
+    priority = models.IntegerField(default=0, verbose_name="Приоритет")
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name="Статус"
+    )
+    dedup_key = models.CharField(max_length=200, null=True, blank=True, verbose_name="Ключ дедупликации")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name="Максимум попыток")
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Запустить не раньше")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder, verbose_name="Результат")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Задача"
+        verbose_name_plural = "Задачи"
+        indexes = [models.Index(fields=['status', 'priority', 'run_at'])]
+        constraints = [
+            # В очереди не бывает двух одинаковых задач; выполняющаяся не
+            # мешает поставить новую - она могла прочитать старые данные
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=models.Q(status='pending'),
+                name='job_pending_dedup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
@@ -0,0 +1,195 @@
+"""
+Подбор рецептов по продуктам, которые скоро испортятся.
+
+Корпус рецептов (название, ингредиенты) читается из TSV-файла RECIPES_PATH
+один раз на процесс - при старте сервера, см. FoodProject/wsgi.py и asgi.py.
+Для него строится обратный индекс: основа слова -> ингредиенты,
+ингредиент -> массив номеров рецептов. Продукт подходит ингредиенту, если
+в его названии есть все слова ингредиента ("Масло сливочное 82,5%" подходит
+к "масло сливочное" и "масло"). Ранжирование складывает веса продуктов
+в numpy-массиве по всем рецептам сразу, без перебора рецептов в Python,
+поэтому ответ для сотен продуктов занимает миллисекунды.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+
+from .catalog import normalize
+
+Recipe = namedtuple('Recipe', 'title ingredients')
+# used - продукты пользователя, которые идут в рецепт; missing - ингредиенты, которых нет
+RecipeMatch = namedtuple('RecipeMatch', 'recipe score used missing')
+
+# Продукты, которые испортятся позже, в подбор не попадают
+HORIZON_DAYS = 7
+PRIORITY_WEIGHTS = {'high': 1.5, 'medium': 1.0, 'low': 0.7}
+# Сколько названий продуктов помнит кэш совпадений
+MAX_CACHED_NAMES = 50_000
+
+WORD = re.compile(r'[а-яa-z]+')
+ENDINGS = sorted(
+    ('ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ых', 'их', 'ой', 'ей',
+     'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях',
+     'ом', 'ем', 'ы', 'и', 'а', 'я', 'о', 'е', 'у', 'ю', 'ь', 'й'),
+    key=len, reverse=True,
+)
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    """Отбрасывает падежное окончание: "помидоры" и "помидор" дают одну основу."""
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def stems(text):
+    return frozenset(stem(word) for word in WORD.findall(normalize(text)) if len(word) > 1)
+
+
+def product_weight(days_remaining, priority):
+    """Вес продукта в подборе: чем раньше испортится и выше приоритет, тем больше."""
+    if days_remaining < 0 or days_remaining > HORIZON_DAYS:
+        return 0.0
+    urgency = (HORIZON_DAYS + 1 - days_remaining) / (HORIZON_DAYS + 1)
+    return urgency * PRIORITY_WEIGHTS.get(priority, 1.0)
+
+
+class RecipeIndex:
+    def __init__(self, recipes):
+        self.recipes = list(recipes)
+        vocabulary = {}
+        postings = []
+        # Номера ингредиентов каждого рецепта, в порядке recipe.ingredients
+        self._recipe_ingredients = []
+        for number, recipe in enumerate(self.recipes):
+            ingredient_ids = []
+            for ingredient in recipe.ingredients:
+                key = stems(ingredient)
+                if key not in vocabulary:
+                    vocabulary[key] = len(postings)
+                    postings.append([])
+                ingredient_ids.append(vocabulary[key])
+                # Один ингредиент дважды в рецепте считается один раз
+                if not postings[vocabulary[key]] or postings[vocabulary[key]][-1] != number:
+                    postings[vocabulary[key]].append(number)
+            self._recipe_ingredients.append(tuple(ingredient_ids))
+        self._ingredients = list(vocabulary)
+        self._postings = [np.array(p, dtype=np.int32) for p in postings]
+        self._by_stem = {}
+        for ingredient_id, key in enumerate(self._ingredients):
+            for word in key:
+                self._by_stem.setdefault(word, []).append(ingredient_id)
+        self._sizes = np.array([len(r.ingredients) or 1 for r in self.recipes], dtype=np.float64)
+        self._matches = {}
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def _match(self, name):
+        """(номера подходящих ингредиентов, отсортированные номера рецептов с ними)."""
+        key = normalize(name)
+        match = self._matches.get(key)
+        if match is None:
+            words = stems(key)
+            candidates = {i for word in words for i in self._by_stem.get(word, ())}
+            ingredient_ids = frozenset(i for i in candidates if self._ingredients[i] <= words)
+            lists = [self._postings[i] for i in ingredient_ids]
+            found = np.unique(np.concatenate(lists)) if lists else np.empty(0, dtype=np.int32)
+            if len(self._matches) >= MAX_CACHED_NAMES:
+                self._matches.clear()
+            match = self._matches[key] = (ingredient_ids, found)
+        return match
+
+    def recipes_for(self, name):
+        """Отсортированные номера рецептов, в которые годится продукт name."""
+        return self._match(name)[1]
+
+    def rank(self, products, limit=10, required=None):
+        """
+        products - пары (название, вес). Рецепты по убыванию суммы весов
+        подходящих продуктов, при равенстве - с большей долей имеющихся
+        ингредиентов. required - продукт, который обязан войти в рецепт.
+        """
+        have = set()
+        # Продукты с одними и теми же ингредиентами дают одни рецепты - веса складываются
+        grouped = {}
+        for name, weight in products:
+            ingredient_ids, found = self._match(name)
+            # Недостающие ингредиенты считаются по всем продуктам, не только срочным
+            have.update(ingredient_ids)
+            if weight > 0 and len(found):
+                group = grouped.setdefault(ingredient_ids, [found, 0.0, []])
+                group[1] += weight
+                if name not in group[2]:
+                    group[2].append(name)
+        if not grouped:
+            return []
+        postings = [found for found, _, _ in grouped.values()]
+        weights = [weight for _, weight, _ in grouped.values()]
+        matched = [(names, ingredient_ids) for ingredient_ids, (_, _, names) in grouped.items()]
+        # Один проход bincount вместо сложения по продуктам
+        found = np.concatenate(postings)
+        size = len(self.recipes)
+        scores = np.bincount(found, np.repeat(weights, [len(p) for p in postings]), size)
+        counts = np.bincount(found, minlength=size)
+        if required is not None:
+            allowed = np.zeros(size, dtype=bool)
+            allowed[self.recipes_for(required)] = True
+            scores[~allowed] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > limit:
+            # Полностью сортируются только рецепты не хуже limit-го (вместе с равными)
+            threshold = np.partition(scores[candidates], -limit)[-limit]
+            candidates = candidates[scores[candidates] >= threshold]
+        coverage = np.minimum(counts[candidates], self._sizes[candidates]) / self._sizes[candidates]
+        order = candidates[np.lexsort((-coverage, -scores[candidates]))][:limit]
+        results = []
+        for number in order:
+            recipe = self.recipes[number]
+            ingredient_ids = self._recipe_ingredients[number]
+            results.append(RecipeMatch(
+                recipe,
+                round(float(scores[number]), 2),
+                [name for names, ids in matched if not ids.isdisjoint(ingredient_ids) for name in names],
+                [i for i, ingredient_id in zip(recipe.ingredients, ingredient_ids)
+                 if ingredient_id not in have],
+            ))
+        return results
+
+
+def read_recipes(path):
+    """Строки файла: название<TAB>ингредиенты через запятую."""
+    recipes = []
+    with open(path, encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            title, _, ingredients = line.partition('\t')
+            ingredients = tuple(i.strip() for i in ingredients.split(',') if i.strip())
+            if title.strip() and ingredients:
+                recipes.append(Recipe(title.strip(), ingredients))
+    return RecipeIndex(recipes)
+
+
+@lru_cache(maxsize=4)
+def _load(path):
+    return read_recipes(path)
+
+
+def get_recipe_index():
+    return _load(str(settings.RECIPES_PATH))
+
+
+def recipes_for_products(products, today, limit=10, required=None):
+    """Рецепты для продуктов пользователя (экземпляров Product)."""
+    weighted = [
+        (p.name, product_weight((p.expiration_date - today).days, p.priority))
+        for p in products
+    ]
+    return get_recipe_index().rank(weighted, limit, required)
@@ -0,0 +1,213 @@
+"""
+Сохранённые рекомендации.
+
+Рекомендации пользователя рассчитываются один раз и хранятся в
+StoredRecommendation уже отсортированными; страницы только читают строки.
+Любая запись Product пользователя или правка RecommendationTemplate его
+категорий увеличивает RecommendationBatch.version, а смена даты делает
+пакет устаревшим. Устаревший пакет пересчитывает задача очереди, которую
+ставит сама запись, или команда refresh_recommendations. Пока пересчёт не
+выполнен, чтение рассчитывает рекомендации в памяти и ничего не пишет:
+страницы читают с реплик.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .forecasting import forecasts_for, rank_key
+from .models import (
+    Product, RecommendationBatch, RecommendationTemplate, StoredRecommendation,
+)
+from .sharding import product_databases, shard_for
+from .snapshot import snapshot_for
+
+
+def _builtin_recommendation(product, days_remaining):
+    if days_remaining <= 0:
+        return {
+            'title': 'Продукт просрочен!',
+            'text': f'Продукт "{product.name}" уже просрочен. Рекомендуем проверить его состояние и выбросить, если испорчен.',
+            'icon': 'fas fa-skull-crossbones',
+            'action_text': 'Удалить продукт',
+            'action_link': f'/products/{product.id}/delete/',
+            'urgency': 'danger',
+        }
+    elif days_remaining <= 2:
+        return {
+            'title': 'Срочно используйте!',
+            'text': f'Продукт "{product.name}" истекает через {days_remaining} дня. '
+                   f'Рекомендуем использовать сегодня.',
+            'icon': 'fas fa-exclamation-triangle',
+            'action_text': 'Отметить использованным',
+            'action_link': f'/products/{product.id}/mark_used/',
+            'urgency': 'warning',
+        }
+    elif days_remaining <= 7:
+        return _plan_recommendation(product, days_remaining)
+    return None
+
+
+def _plan_recommendation(product, days_remaining):
+    return {
+        'title': 'Запланируйте использование',
+        'text': f'Продукт "{product.name}" истекает через {days_remaining} дней. '
+               f'Рекомендуем запланировать его использование на этой неделе.',
+        'icon': 'fas fa-calendar-check',
+        'action_text': 'Посмотреть рецепты',
+        'action_link': f'/recipes/?product={product.id}',
+        'urgency': 'info',
+    }
+
+
+def _active_templates():
+    """{category_id: [шаблоны по возрастанию days_before_expiry]}"""
+    templates = {}
+    for template in RecommendationTemplate.objects.filter(is_active=True).order_by('days_before_expiry'):
+        templates.setdefault(template.category_id, []).append(template)
+    return templates
+
+
+def _matching_template(templates, category_id, days_remaining):
+    for template in templates.get(category_id, ()):
+        if days_remaining <= template.days_before_expiry:
+            return template
+    return None
+
+
+def build_recommendations(user, today):
+    """Несохранённые StoredRecommendation пользователя в порядке показа."""
+    forecasts = forecasts_for(user)
+    templates = _active_templates()
+    ranked = []
+    snapshot = snapshot_for(user.pk)
+    if snapshot is not None:
+        # Продукты дальше всех порогов рекомендаций не получат; шаблонам и
+        # встроенным советам хватает полей снимка
+        horizon = max([7] + [t.days_before_expiry for ts in templates.values() for t in ts])
+        products = snapshot.products(snapshot.select(today, within_days=horizon), {})
+    else:
+        products = Product.objects.for_user(user).filter(status='active').select_related('category')
+    for product in products:
+        days_remaining = (product.expiration_date - today).days
+        fields = _builtin_recommendation(product, days_remaining)
+        template = _matching_template(templates, product.category_id, days_remaining)
+        if template is not None:
+            fields = fields or _plan_recommendation(product, days_remaining)
+            fields.update(
+                title=template.title,
+                text=template.text,
+                icon=template.icon,
+                action_text=template.action_text or fields['action_text'],
+            )
+        if fields is None:
+            continue
+        ranked.append((
+            rank_key(product, days_remaining, forecasts, today),
+            StoredRecommendation(
+                user=user, product_id=product.id, days_remaining=days_remaining, **fields
+            ),
+        ))
+    ranked.sort(key=lambda item: item[0])
+    recommendations = []
+    for position, (_, rec) in enumerate(ranked):
+        rec.position = position
+        recommendations.append(rec)
+    return recommendations
+
+
+def refresh_user_recommendations(user):
+    batch, _ = RecommendationBatch.objects.get_or_create(user=user)
+    version = batch.version
+    today = timezone.now().date()
+    recommendations = build_recommendations(user, today)
+    stored = StoredRecommendation.objects.for_user(user)
+    # Рекомендации лежат в шарде пользователя, пакет - в основной БД
+    with transaction.atomic(), transaction.atomic(using=shard_for(user.pk)):
+        stored.delete()
+        stored.bulk_create(recommendations)
+        # Если за время расчёта данные изменились, пакет останется устаревшим
+        RecommendationBatch.objects.filter(pk=batch.pk, version=version).update(
+            computed_on=today, computed_version=version
+        )
+    return recommendations
+
+
+def mark_stale(users):
+    """users - id пользователей или queryset с ними."""
+    RecommendationBatch.objects.filter(user__in=users).update(version=F('version') + 1)
+
+
+def mark_stale_for_categories(category_ids):
+    if not settings.PRODUCT_SHARDS:
+        users = Product.objects.filter(
+            category_id__in=category_ids, status='active'
+        ).values('user_id')
+        mark_stale(users)
+        return
+    # Подзапрос в основную БД с шарда не выполнить - собираем id
+    users = set()
+    for database in product_databases():
+        users.update(
+            Product.objects.using(database)
+            .filter(category_id__in=category_ids, status='active')
+            .values_list('user_id', flat=True)
+        )
+    mark_stale(list(users))
+
+
+def stale_batches(today):
+    return RecommendationBatch.objects.exclude(
+        computed_on=today, computed_version=F('version')
+    )
+
+
+def _is_fresh(batch, today):
+    return (
+        batch is not None
+        and batch.computed_on == today
+        and batch.computed_version == batch.version
+    )
+
+
+def refresh_stale(today):
+    """Пересчитывает устаревшие пакеты; возвращает число пользователей."""
+    refreshed = 0
+    for batch in stale_batches(today).select_related('user').iterator():
+        refresh_user_recommendations(batch.user)
+        refreshed += 1
+    return refreshed
+
+
+def _stored(user, limit):
+    rows = StoredRecommendation.objects.for_user(user).select_related('product__category')
+    return rows[:limit] if limit else rows
+
+
+def _computed(user, today, limit):
+    """Рекомендации устаревшего пакета без записи: с продуктами, как у сохранённых."""
+    recommendations = build_recommendations(user, today)[:limit]
+    products = (
+        Product.objects.for_user(user).select_related('category')
+        .in_bulk([rec.product_id for rec in recommendations])
+    )
+    for rec in recommendations:
+        rec.product = products.get(rec.product_id)
+    return [rec for rec in recommendations if rec.product is not None]
+
+
+def get_recommendations(user, limit=None):
+    today = timezone.now().date()
+    batch = RecommendationBatch.objects.filter(user=user).first()
+    if not _is_fresh(batch, today):
+        return _computed(user, today, limit)
+    return list(_stored(user, limit))
+
+
+async def aget_recommendations(user, limit=None):
+    today = timezone.now().date()
+    batch = await RecommendationBatch.objects.filter(user=user).afirst()
+    if not _is_fresh(batch, today):
+        return await sync_to_async(_computed)(user, today, limit)
+    return [rec async for rec in _stored(user, limit)]
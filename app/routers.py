@@ -0,0 +1,119 @@
+"""
+Чтение из реплик БД.
+
+Представления, помеченные read_from_replica, читают из одной из реплик
+DATABASE_REPLICAS - она выбирается один раз на запрос. Записи, auth,
+сессии и все остальные представления работают с основной БД. После первой
+записи запрос до конца читает из основной БД, а ReplicaPinMiddleware ещё
+REPLICA_LAG секунд направляет туда же следующие запросы клиента, чтобы он
+видел свои изменения, пока реплики догоняют.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+from .sharding import PRIMARY, shard_for
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Эти приложения всегда читают основную БД: вход и сессии не ждут реплику
+PRIMARY_APPS = {'auth', 'sessions', 'contenttypes', 'admin'}
+
+
+class _Routing:
+    def __init__(self, replica):
+        # None - читать из основной БД
+        self.replica = replica
+
+
+_routing = ContextVar('db_routing', default=None)
+
+
+def _start(request):
+    replicas = settings.DATABASE_REPLICAS
+    pinned = PIN_COOKIE in request.COOKIES or request.method not in SAFE_METHODS
+    replica = random.choice(replicas) if replicas and not pinned else None
+    return _routing.set(_Routing(replica))
+
+
+def read_from_replica(view):
+    """Разрешает представлению только для чтения ходить в реплику."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            token = _start(request)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _routing.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = _start(request)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _routing.reset(token)
+    return wrapper
+
+
+def pin_to_primary():
+    """Остаток текущего запроса читает из основной БД."""
+    routing = _routing.get()
+    if routing is not None:
+        routing.replica = None
+
+
+def _known_databases():
+    return {PRIMARY, *settings.DATABASE_REPLICAS, *settings.PRODUCT_SHARDS}
+
+
+class ShardRouter:
+    """Продукты, их архив и рекомендации - в шард владельца, см. app.sharding."""
+
+    sharded_models = {'product', 'storedrecommendation', 'archivedproduct'}
+
+    def _shard(self, model, hints):
+        if not settings.PRODUCT_SHARDS or model._meta.app_label != 'app':
+            return None
+        if model._meta.model_name not in self.sharded_models:
+            return None
+        # Запросы без экземпляра маршрутизируются явно: Product.objects.for_user()
+        user_id = getattr(hints.get('instance'), 'user_id', None)
+        return shard_for(user_id) if user_id is not None else None
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = _known_databases()
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or routing.replica is None or model._meta.app_label in PRIMARY_APPS:
+            return PRIMARY
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            # Дальше этот запрос должен видеть собственную запись
+            routing.replica = None
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
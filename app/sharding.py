@@ -0,0 +1,27 @@
+"""
+Шардирование продуктов по пользователям.
+
+Если задан PRODUCT_SHARDS, строки Product и StoredRecommendation лежат в
+одной из этих БД, выбранной по хэшу user_id; пользователи, категории и
+остальные таблицы остаются в основной БД. Категории копируются на каждый
+шард, чтобы JOIN по category работал внутри шарда. Без PRODUCT_SHARDS всё
+хранится в основной БД, как раньше.
+"""
+import zlib
+
+from django.conf import settings
+
+PRIMARY = 'default'
+
+
+def product_databases():
+    """БД, в которых могут лежать продукты."""
+    return list(settings.PRODUCT_SHARDS) or [PRIMARY]
+
+
+def shard_for(user_id):
+    shards = settings.PRODUCT_SHARDS
+    if not shards:
+        return PRIMARY
+    # crc32, а не hash(): номер шарда не должен зависеть от процесса
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_generation, bump_inventory_generation
+from .events import STATUS_EVENTS, is_muted, muted, record_event
+from .models import ArchivedProduct, Category, Product, RecommendationTemplate, StoredRecommendation
+from .recommendations import mark_stale, mark_stale_for_categories
+from .sharding import PRIMARY
+from .snapshot import invalidate as invalidate_snapshot
+from .tasks import schedule_recommendations, schedule_stale_recommendations
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    if is_muted():
+        return
+    # Другие процессы увидят новое поколение после коммита
+    invalidate_snapshot(instance.user_id)
+    bump_inventory_generation(instance.user_id)
+    mark_stale([instance.user_id])
+    schedule_recommendations(instance.user_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=RecommendationTemplate)
+@receiver(post_delete, sender=RecommendationTemplate)
+def catalog_changed(sender, instance, **kwargs):
+    bump_catalog_generation()
+
+
+@receiver(post_save, sender=Product)
+def log_product_status(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        record_event(instance, 'created')
+    elif instance.status != getattr(instance, '_loaded_status', None) and instance.status in STATUS_EVENTS:
+        record_event(instance, instance.status)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Product)
+def log_product_delete(sender, instance, origin=None, **kwargs):
+    # При удалении пользователя его журнал удаляется каскадом - не пишем в него
+    if isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        record_event(instance, 'deleted')
+
+
+@receiver(pre_save, sender=RecommendationTemplate)
+def remember_template_category(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        instance._previous_category_id = None
+        return
+    instance._previous_category_id = (
+        RecommendationTemplate.objects.filter(pk=instance.pk)
+        .values_list('category_id', flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=RecommendationTemplate)
+@receiver(post_delete, sender=RecommendationTemplate)
+def template_changed(sender, instance, **kwargs):
+    # Пересчитываются только пользователи с активными продуктами этих категорий
+    category_ids = {instance.category_id, getattr(instance, '_previous_category_id', None)}
+    mark_stale_for_categories(category_ids - {None})
+    schedule_stale_recommendations()
+
+
+@receiver(post_save, sender=Category)
+def replicate_category(sender, instance, using=PRIMARY, **kwargs):
+    # Копия справочника на шардах нужна для JOIN продуктов с категориями
+    if using != PRIMARY:
+        return
+    for shard in settings.PRODUCT_SHARDS:
+        Category.objects.using(shard).update_or_create(
+            pk=instance.pk,
+            defaults={
+                field.attname: getattr(instance, field.attname)
+                for field in Category._meta.concrete_fields
+                if not field.primary_key
+            },
+        )
+
+
+@receiver(post_delete, sender=Category)
+def drop_replicated_category(sender, instance, using=PRIMARY, **kwargs):
+    if using != PRIMARY:
+        return
+    for shard in settings.PRODUCT_SHARDS:
+        Category.objects.using(shard).filter(pk=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_products(sender, instance, **kwargs):
+    # Каскад из основной БД не видит строки на шарде - удаляем их сами
+    if not settings.PRODUCT_SHARDS:
+        return
+    with muted():
+        StoredRecommendation.objects.for_user(instance).delete()
+        Product.objects.for_user(instance).delete()
+        ArchivedProduct.objects.for_user(instance).delete()
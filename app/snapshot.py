@@ -0,0 +1,269 @@
+"""
+Снимок активных продуктов пользователя в памяти процесса.
+
+Страницы активного пользователя раз за разом читают одни и те же сотни
+строк Product. Снимок хранит их по столбцам в массивах numpy (id, категория,
+ординалы дат, коды приоритета и места хранения, количество) и списках строк,
+так что фильтры, сортировка и группировка по срокам для списка продуктов,
+главной страницы и рекомендаций выполняются без запроса к БД.
+
+Снимок помечен поколением инвентаря (см. app.cache), при котором он
+прочитан: запись продукта в любом процессе меняет поколение, и устаревший
+снимок перечитывается при следующем обращении. Сигнал записи в своём
+процессе сбрасывает снимок сразу. Снимки вытесняются по LRU, когда их
+общий размер превышает INVENTORY_SNAPSHOT_MB; 0 отключает снимки.
+"""
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cache import inventory_generation, read_primary_after_write
+from .models import ExpirationMixin, Product
+
+logger = logging.getLogger(__name__)
+
+# Коды по возрастанию значений: сортировка по коду совпадает с ORDER BY в БД
+PRIORITIES = sorted(value for value, _ in Product.PRIORITY_CHOICES)
+STORAGES = sorted([''] + [value for value, _ in Product.STORAGE_CHOICES])
+NO_CATEGORY = -1
+FIELDS = (
+    'id', 'name', 'notes', 'category_id', 'expiration_date', 'purchase_date',
+    'priority', 'storage', 'quantity',
+)
+# Сортировки списка продуктов, которые снимок умеет воспроизвести
+SORTS = ('expiration_date', '-expiration_date', 'name', 'priority', '-created_at')
+# Раз в столько обращений статистика снимков пишется в лог
+STATS_EVERY = 1000
+
+_ACTIVE_DISPLAY = dict(Product.STATUS_CHOICES)['active']
+
+
+class SnapshotProduct(ExpirationMixin):
+    """Продукт из снимка с полями, которые нужны спискам и рекомендациям."""
+
+    status = 'active'
+    is_archived = False
+
+    def __init__(self, id, name, notes, category_id, category, expiration_date,
+                 purchase_date, priority, storage, quantity):
+        self.id = id
+        self.name = name
+        self.notes = notes
+        self.category_id = category_id
+        self.category = category
+        self.expiration_date = expiration_date
+        self.purchase_date = purchase_date
+        self.priority = priority
+        self.storage = storage
+        self.quantity = quantity
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_status_display(self):
+        return _ACTIVE_DISPLAY
+
+
+class InventorySnapshot:
+    """Активные продукты одного пользователя по столбцам."""
+
+    __slots__ = (
+        'generation', 'ids', 'names', 'notes', 'category_ids', 'expiration',
+        'purchase', 'priority', 'storage', 'quantity', 'nbytes',
+    )
+
+    def __init__(self, generation, rows):
+        self.generation = generation
+        columns = list(zip(*rows)) or [()] * len(FIELDS)
+        ids, names, notes, category_ids, expiration, purchase, priority, storage, quantity = columns
+        self.ids = np.array(ids, dtype=np.int64)
+        self.names = list(names)
+        self.notes = list(notes)
+        self.category_ids = np.array(
+            [NO_CATEGORY if c is None else c for c in category_ids], dtype=np.int64
+        )
+        self.expiration = np.array([d.toordinal() for d in expiration], dtype=np.int32)
+        self.purchase = np.array([d.toordinal() for d in purchase], dtype=np.int32)
+        self.priority = np.array([PRIORITIES.index(p) for p in priority], dtype=np.int8)
+        self.storage = np.array([STORAGES.index(s) for s in storage], dtype=np.int8)
+        self.quantity = np.array(quantity, dtype=np.float64)
+        self.nbytes = (
+            sum(getattr(self, name).nbytes for name in (
+                'ids', 'category_ids', 'expiration', 'purchase', 'priority', 'storage', 'quantity'
+            ))
+            + sum(sys.getsizeof(s) for s in self.names)
+            + sum(sys.getsizeof(s) for s in self.notes if s)
+            + sys.getsizeof(self.names) + sys.getsizeof(self.notes)
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def days_left(self, today):
+        return self.expiration - today.toordinal()
+
+    def select(self, today, bucket=None, category_id=None, within_days=None,
+               storage=None, priority=None):
+        """
+        Позиции продуктов: bucket 'warning' - истекают в ближайшие два дня,
+        'danger' - просрочены, None - все активные. within_days оставляет
+        продукты, которым до истечения срока не больше стольких дней.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        days = self.days_left(today)
+        if bucket == 'warning':
+            mask &= (days >= 0) & (days <= 2)
+        elif bucket == 'danger':
+            mask &= days < 0
+        if within_days is not None:
+            mask &= days <= within_days
+        if category_id is not None:
+            mask &= self.category_ids == category_id
+        if storage is not None:
+            mask &= self.storage == STORAGES.index(storage)
+        if priority is not None:
+            mask &= self.priority == PRIORITIES.index(priority)
+        return np.flatnonzero(mask)
+
+    def order(self, positions, sort):
+        """positions в порядке сортировки sort из SORTS."""
+        if sort == 'name':
+            names = self.names
+            return np.array(sorted(positions, key=names.__getitem__), dtype=np.intp)
+        key = {
+            'expiration_date': self.expiration,
+            '-expiration_date': -self.expiration.astype(np.int64),
+            'priority': self.priority,
+            # id растут в порядке создания
+            '-created_at': -self.ids,
+        }[sort]
+        return positions[np.argsort(key[positions], kind='stable')]
+
+    def products(self, positions, categories):
+        """SnapshotProduct для позиций; categories - {id: Category}."""
+        result = []
+        for i in positions:
+            category_id = int(self.category_ids[i])
+            category_id = None if category_id == NO_CATEGORY else category_id
+            result.append(SnapshotProduct(
+                int(self.ids[i]), self.names[i], self.notes[i], category_id,
+                categories.get(category_id), date.fromordinal(int(self.expiration[i])),
+                date.fromordinal(int(self.purchase[i])), PRIORITIES[self.priority[i]],
+                STORAGES[self.storage[i]], float(self.quantity[i]),
+            ))
+        return result
+
+
+class SnapshotStore:
+    """LRU снимков пользователей с ограничением по памяти."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, user_id):
+        # Поколение читается до продуктов: запись во время чтения сменит его
+        generation = inventory_generation(user_id)
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+            if snapshot is not None and snapshot.generation == generation:
+                self._snapshots.move_to_end(user_id)
+                self.hits += 1
+                self._log_stats()
+                return snapshot
+            self.misses += 1
+            self._log_stats()
+        read_primary_after_write(user_id)
+        rows = Product.objects.for_user(user_id).filter(status='active').order_by().values_list(*FIELDS)
+        snapshot = InventorySnapshot(generation, list(rows))
+        self._put(user_id, snapshot)
+        return snapshot
+
+    def _put(self, user_id, snapshot):
+        with self._lock:
+            self._drop(user_id)
+            # Снимок больше всего бюджета не хранится, но в этот раз используется
+            if snapshot.nbytes > self.max_bytes:
+                return
+            self._snapshots[user_id] = snapshot
+            self.nbytes += snapshot.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._snapshots.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def _drop(self, user_id):
+        snapshot = self._snapshots.pop(user_id, None)
+        if snapshot is not None:
+            self.nbytes -= snapshot.nbytes
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._drop(user_id)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'users': len(self._snapshots),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _log_stats(self):
+        if (self.hits + self.misses) % STATS_EVERY == 0:
+            lookups = self.hits + self.misses
+            logger.info(
+                'Снимки продуктов: %d пользователей, %.1f из %.1f МБ, попаданий %.1f%%, вытеснено %d',
+                len(self._snapshots), self.nbytes / 2**20, self.max_bytes / 2**20,
+                100 * self.hits / lookups, self.evictions,
+            )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Хранилище снимков процесса или None, если снимки выключены."""
+    global _store
+    max_bytes = int(settings.INVENTORY_SNAPSHOT_MB * 2**20)
+    if max_bytes <= 0:
+        return None
+    with _store_lock:
+        if _store is None or _store.max_bytes != max_bytes:
+            _store = SnapshotStore(max_bytes)
+        return _store
+
+
+def snapshot_for(user_id):
+    """Снимок активных продуктов пользователя или None, если снимки выключены."""
+    store = get_store()
+    return store.get(user_id) if store is not None else None
+
+
+asnapshot_for = sync_to_async(snapshot_for)
+
+
+def invalidate(user_id):
+    if _store is not None:
+        _store.invalidate(user_id)
+
+
+def snapshot_stats():
+    store = get_store()
+    return store.stats() if store is not None else None
@@ -31,7 +31,7 @@ function getCSRFToken() {
     return cookieValue;
 }
 
-function makeRequest(url, method = 'GET', data = null) {
+function makeRequest(url, method = 'GET', data = null, signal = null) {
     const headers = {
         'X-CSRFToken': getCSRFToken()
     };
@@ -50,6 +50,9 @@ function makeRequest(url, method = 'GET', data = null) {
     if (data) {
         options.body = data;
     }
+    if (signal) {
+        options.signal = signal;
+    }
     
     return fetch(url, options)
         .then(response => {
@@ -60,7 +63,17 @@ function makeRequest(url, method = 'GET', data = null) {
         });
 }
 
+// Вызывает func не чаще, чем раз в wait мс после последнего обращения
+function debounce(func, wait) {
+    let timer = null;
+    return function(...args) {
+        clearTimeout(timer);
+        timer = setTimeout(() => func.apply(this, args), wait);
+    };
+}
+
 window.FreshTracker = {
     makeRequest,
-    getCSRFToken
+    getCSRFToken,
+    debounce
 };
\ No newline at end of file
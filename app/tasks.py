@@ -0,0 +1,82 @@
+"""
+Задачи для очереди app.jobs.
+
+Модуль импортируется при старте приложения (см. apps.py), поэтому задачи
+зарегистрированы и в веб-процессах, которые их ставят, и в воркере.
+"""
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import cached_for_user
+from .charts import CATEGORY_COLORS, URGENCY_COLORS, bar_chart
+from .events import period_summary, totals_by_category
+from .forecasting import refresh_forecasts
+from .jobs import enqueue, task
+from .models import ProductEvent
+from .recommendations import refresh_stale, refresh_user_recommendations
+
+
+def waste_report_context(user, start, end):
+    """Отходы и потребление за период по дневным агрегатам."""
+    used = totals_by_category(user, start, end, ('used',))
+    wasted = totals_by_category(user, start, end, ProductEvent.WASTE_EVENTS)
+    report = {
+        'period_start': start,
+        'period_end': end,
+        'period_summary': period_summary(user, start, end),
+    }
+    if used:
+        report['used_chart'] = bar_chart(
+            [name for name, _ in used], [total for _, total in used],
+            CATEGORY_COLORS, 'Использовано по категориям'
+        )
+    if wasted:
+        report['waste_chart'] = bar_chart(
+            [name for name, _ in wasted], [total for _, total in wasted],
+            URGENCY_COLORS, 'Выброшено и просрочено по категориям'
+        )
+    return report
+
+
+@task(priority=10)
+def waste_report(user_id, start, end):
+    """
+    Строит отчёт в кэш страницы статистики - её следующий показ не рисует
+    графики. В результат задачи идёт только период: сам отчёт с SVG лежит в кэше.
+    """
+    user = User.objects.get(pk=user_id)
+    period = date.fromisoformat(start), date.fromisoformat(end)
+    cached_for_user(user_id, 'waste_report', lambda: waste_report_context(user, *period), *period)
+    return {'start': start, 'end': end}
+
+
+@task(priority=5)
+def refresh_recommendations(user_id):
+    return len(refresh_user_recommendations(User.objects.get(pk=user_id)))
+
+
+@task(priority=5)
+def refresh_stale_recommendations():
+    return refresh_stale(timezone.now().date())
+
+
+def schedule_recommendations(user_id):
+    """После коммита ставит пересчёт рекомендаций пользователя; ждущий не дублируется."""
+    transaction.on_commit(lambda: enqueue(
+        refresh_recommendations, user_id, dedup_key=f'recommendations:{user_id}'
+    ))
+
+
+def schedule_stale_recommendations():
+    """После коммита ставит пересчёт всех устаревших пакетов."""
+    transaction.on_commit(lambda: enqueue(
+        refresh_stale_recommendations, dedup_key='recommendations:stale'
+    ))
+
+
+@task()
+def forecasts():
+    return refresh_forecasts()
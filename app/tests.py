@@ -3,11 +3,60 @@ This file demonstrates writing tests using the unittest module. These will pass
 when you run "manage.py test".
 """
 
+import gzip
+import os
+import re
+import tempfile
+import time
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+from xml.etree import ElementTree
+
 import django
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import charts
+from .analytics import products_frame
+from .cache import cached_for_user, catalog_generation, inventory_generation
+from .compression import minify_html, process_response
+from .catalog import CatalogEntry, ProductCatalog
+from .events import period_summary, rebuild_rollups
+from .forecasting import refresh_forecasts
+from . import jobs
+from .ical import fold, get_feed
+from .middleware import clear_expired_sessions
+from .models import (
+    ArchivedProduct, CalendarFeed, Category, ConsumptionForecast, DailyProductStats, Job, Product,
+    ProductEvent,
+    RecommendationBatch, RecommendationTemplate,
+)
+from .recipes import Recipe, RecipeIndex, product_weight
+from .recommendations import get_recommendations, refresh_user_recommendations, stale_batches
+from .routers import PIN_COOKIE
+from .sharding import shard_for
+from .snapshot import SnapshotStore, snapshot_for
+from .staticfiles import minify_css
 
 # TODO: Configure your database in settings.py and sync before running tests.
 
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-sessions',
+    },
+}
+
 class ViewTest(TestCase):
     """Tests for the application views."""
 
@@ -32,3 +81,1157 @@ class ViewTest(TestCase):
         """Tests the about page."""
         response = self.client.get('/about')
         self.assertContains(response, 'About', 3, 200)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProductViewsTest(TestCase):
+    """Tests for the authenticated product views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password='secret-pass-123')
+        cls.category = Category.objects.create(name='Молочные продукты')
+        today = timezone.now().date()
+        for days, status in ((-1, 'active'), (1, 'active'), (5, 'active'), (10, 'used')):
+            Product.objects.create(
+                user=cls.user,
+                name=f'Молоко {days}',
+                category=cls.category,
+                expiration_date=today + timedelta(days=days),
+                status=status,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_read_views(self):
+        """The async read views render for a user with products."""
+        for name in ('index', 'product_list', 'product_statistics', 'recommendations'):
+            with self.subTest(view=name):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+
+    def test_product_list_filter(self):
+        """Filtering by status narrows the product list."""
+        response = self.client.get(reverse('product_list'), {'status': 'used'})
+        self.assertEqual([p.name for p in response.context['products']], ['Молоко 10'])
+
+    def test_product_list_fragment(self):
+        """Fragment mode returns only the results table as JSON."""
+        response = self.client.get(reverse('product_list'), {'status': 'used', 'fragment': '1'})
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertIn('Молоко 10', data['html'])
+        self.assertNotIn('<nav', data['html'])
+        self.assertNotIn('product-filters', data['html'])
+
+    def test_conditional_get(self):
+        """Repeat visits get 304 until the user's products change."""
+        for name in ('product_list', 'product_statistics', 'recommendations'):
+            with self.subTest(view=name):
+                # The first response sets the CSRF cookie, which is part of the ETag
+                self.client.get(reverse(name))
+                etag = self.client.get(reverse(name))['ETag']
+                # The session user and one aggregate over their products
+                with self.assertNumQueries(2):
+                    response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+        etag = self.client.get(reverse('product_list'))['ETag']
+        Product.objects.filter(name='Молоко 5').first().delete()
+        response = self.client.get(reverse('product_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_advances_last_modified(self):
+        """A client sending only If-Modified-Since sees a deleted product."""
+        yesterday = timezone.now() - timedelta(days=1)
+        Product.objects.filter(user=self.user).update(updated_at=yesterday)
+        # Back-date the generations: Last-Modified has one-second resolution
+        with mock.patch.object(time, 'time_ns', return_value=int(yesterday.timestamp() * 1e9)):
+            inventory_generation(self.user.pk)
+            catalog_generation()
+        self.client.get(reverse('product_list'))
+        last_modified = self.client.get(reverse('product_list'))['Last-Modified']
+        response = self.client.get(reverse('product_list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(name='Молоко -1').delete()
+        response = self.client.get(reverse('product_list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_recommendations_sorted(self):
+        """Recommendations are ordered by days remaining."""
+        recs = get_recommendations(self.user)
+        self.assertEqual([r.days_remaining for r in recs], [-1, 1, 5])
+        self.assertEqual(recs[0].urgency, 'danger')
+
+    def test_login_required(self):
+        """Anonymous users are redirected to the login page."""
+        self.client.logout()
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_login_without_remember_me_over_another_user(self):
+        """A session that replaces another user's still expires when the browser closes."""
+        User.objects.create_user('other', password='pass')
+        response = self.client.post(reverse('login'), {'username': 'other', 'password': 'pass'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(int(self.client.session['_auth_user_id']), User.objects.get(username='other').pk)
+        self.assertTrue(self.client.session.get_expire_at_browser_close())
+
+    def test_product_write_invalidates_cached_list(self):
+        """A product write bumps the user's generation, so cached pages are not stale."""
+        self.client.get(reverse('product_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                user=self.user,
+                name='Кефир',
+                expiration_date=timezone.now().date() + timedelta(days=3),
+            )
+        response = self.client.get(reverse('product_list'))
+        self.assertIn('Кефир', [p.name for p in response.context['products']])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class UserCacheTest(TestCase):
+    """Tests for the per-user versioned cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def factory(self):
+        self.calls += 1
+        return self.calls
+
+    def test_cached_until_generation_bump(self):
+        """Values are reused per user until that user's products change."""
+        user = User.objects.create_user('owner')
+        other = User.objects.create_user('other')
+        self.assertEqual(cached_for_user(user.pk, 'page', self.factory), 1)
+        self.assertEqual(cached_for_user(user.pk, 'page', self.factory), 1)
+        self.assertEqual(cached_for_user(other.pk, 'page', self.factory), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                user=user, name='Сыр', expiration_date=timezone.now().date()
+            )
+        self.assertEqual(cached_for_user(user.pk, 'page', self.factory), 3)
+        self.assertEqual(cached_for_user(other.pk, 'page', self.factory), 2)
+
+
+class SessionCleanupTest(TestCase):
+    """Tests for the background session cleanup."""
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_clear_expired_sessions(self):
+        """Expired sessions are removed, live ones are kept."""
+        now = timezone.now()
+        Session.objects.create(session_key='expired', session_data='', expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+        clear_expired_sessions()
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+
+class ChartsTest(TestCase):
+    """Tests for the inline SVG charts."""
+
+    def test_svg_is_well_formed(self):
+        """Charts are valid XML and escape user-provided labels."""
+        for svg in (
+            charts.category_bar_chart(['<Овощи>', 'Фрукты'], [3, 1]),
+            charts.category_pie_chart(['<Овощи>', 'Фрукты'], [3, 1]),
+            charts.category_pie_chart(['Овощи'], [5]),
+            charts.urgency_bar_chart([0, 0, 0, 0]),
+        ):
+            root = ElementTree.fromstring(svg)
+            self.assertTrue(root.tag.endswith('svg'))
+            self.assertNotIn('<Овощи>', svg)
+
+
+class AnalyticsTest(TestCase):
+    """Tests for the columnar analytics loader."""
+
+    def test_products_frame(self):
+        """Rows come back as columns with vectorized days_left."""
+        user = User.objects.create_user('analyst')
+        category = Category.objects.create(name='Овощи')
+        today = timezone.now().date()
+        Product.objects.create(user=user, name='Морковь', category=category,
+                               expiration_date=today + timedelta(days=4))
+        Product.objects.create(user=user, name='Соль', expiration_date=today - timedelta(days=2))
+        df = products_frame(Product.objects.filter(user=user).order_by('name'), ('name', 'category'))
+        self.assertEqual(
+            sorted(zip(df['name'], df['category'], df['days_left'])),
+            [('Морковь', 'Овощи', 4), ('Соль', 'Без категории', -2)],
+        )
+        self.assertTrue(products_frame(Product.objects.none()).empty)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProductEventTest(TestCase):
+    """Tests for the product event log and daily rollups."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('eventful', password='secret-pass-123')
+        self.category = Category.objects.create(name='Фрукты')
+
+    def make_product(self, **kwargs):
+        return Product.objects.create(
+            user=self.user, name='Яблоко', category=self.category,
+            expiration_date=timezone.now().date() + timedelta(days=3),
+            estimated_price=50, **kwargs
+        )
+
+    def test_status_changes_are_logged_and_rolled_up(self):
+        """Creating, using, throwing out and deleting products update the rollups."""
+        used = self.make_product()
+        used.status = 'used'
+        used.save()
+        used.save()  # повторное сохранение без смены статуса не логируется
+        thrown = Product.objects.get(pk=self.make_product().pk)
+        thrown.status = 'thrown'
+        thrown.save()
+        thrown.delete()
+
+        events = list(ProductEvent.objects.order_by('id').values_list('event', flat=True))
+        self.assertEqual(events, ['created', 'used', 'created', 'thrown', 'deleted'])
+        rollups = dict(DailyProductStats.objects.values_list('event', 'count'))
+        self.assertEqual(rollups, {'created': 2, 'used': 1, 'thrown': 1, 'deleted': 1})
+
+        today = timezone.now().date()
+        summary = period_summary(self.user, today, today)
+        self.assertEqual((summary['used'], summary['wasted'], summary['wasted_price']), (1, 1, 50))
+
+    def test_rebuild_matches_incremental(self):
+        """Rebuilding from the event log reproduces the incremental rollups."""
+        product = self.make_product()
+        product.status = 'used'
+        product.save()
+        before = sorted(DailyProductStats.objects.values_list('event', 'count', 'price'))
+        rebuild_rollups()
+        after = sorted(DailyProductStats.objects.values_list('event', 'count', 'price'))
+        self.assertEqual(before, after)
+
+    def test_user_delete_cascades(self):
+        """Deleting a user does not write new events for their products."""
+        self.make_product()
+        self.user.delete()
+        self.assertFalse(ProductEvent.objects.exists())
+
+    def test_statistics_period(self):
+        """The statistics page reports waste for the requested period."""
+        product = self.make_product()
+        product.status = 'thrown'
+        product.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('product_statistics'))
+        self.assertEqual(response.context['period_summary']['wasted'], 1)
+        self.assertIn('waste_chart', response.context)
+
+
+class ForecastTest(TestCase):
+    """Tests for the consumption forecasts."""
+
+    def test_forecasts_rank_wasted_categories_first(self):
+        """A category the user tends to throw away is recommended first."""
+        user = User.objects.create_user('forecaster')
+        dairy = Category.objects.create(name='Молочные продукты')
+        bread = Category.objects.create(name='Хлеб')
+        today = timezone.now().date()
+        for category, status in ((dairy, 'used'), (bread, 'thrown'), (bread, 'thrown')):
+            Product.objects.create(
+                user=user, name='История', category=category,
+                expiration_date=today, status=status,
+            )
+        refresh_forecasts()
+        forecast = ConsumptionForecast.objects.get(user=user, category=bread)
+        self.assertEqual((forecast.wasted_count, forecast.waste_rate), (2, 1.0))
+        self.assertEqual(ConsumptionForecast.objects.get(user=user, category=dairy).waste_rate, 0)
+
+        for category in (dairy, bread):
+            Product.objects.create(
+                user=user, name=category.name, category=category,
+                expiration_date=today + timedelta(days=3),
+            )
+        recs = get_recommendations(user)
+        self.assertEqual([r.product.name for r in recs], ['Хлеб', 'Молочные продукты'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProductArchiveTest(TestCase):
+    """Tests for moving long-finished products into the archive."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('archivist')
+        self.category = Category.objects.create(name='Хлеб')
+        today = timezone.now().date()
+        for name, status in (('Старый', 'used'), ('Выброшенный', 'thrown'),
+                             ('Свежий', 'used'), ('Активный', 'active')):
+            Product.objects.create(
+                user=self.user, name=name, category=self.category,
+                expiration_date=today, status=status,
+            )
+        Product.objects.filter(name__in=['Старый', 'Выброшенный', 'Активный']).update(
+            updated_at=timezone.now() - timedelta(days=60)
+        )
+
+    def test_archive_moves_only_long_finished_products(self):
+        """Finished products older than --days move to the archive without new events."""
+        old_id = Product.objects.get(name='Старый').pk
+        events = ProductEvent.objects.count()
+        call_command('archive_products', days=30, batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(Product.objects.values_list('name', flat=True)), ['Активный', 'Свежий']
+        )
+        archived = ArchivedProduct.objects.get(name='Старый')
+        self.assertEqual((archived.product_id, archived.category, archived.status),
+                         (old_id, self.category, 'used'))
+        self.assertEqual(ArchivedProduct.objects.count(), 2)
+        self.assertEqual(ProductEvent.objects.count(), events)
+
+    def test_used_filter_reads_the_archive(self):
+        """The "used" filter of the product list shows archived products too."""
+        call_command('archive_products', days=30, stdout=StringIO())
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('product_list'), {'status': 'used', 'sort': 'name'})
+        self.assertEqual([p.name for p in response.context['products']], ['Свежий', 'Старый'])
+        self.assertEqual(response.context['product_stats']['total_quantity'], 2)
+        self.assertContains(response, 'В архиве', 1)
+
+        response = self.client.get(reverse('product_list'), {'sort': 'name'})
+        self.assertEqual([p.name for p in response.context['products']], ['Активный', 'Свежий'])
+
+    def test_forecasts_include_archived_history(self):
+        """Archived products still count towards the consumption forecasts."""
+        call_command('archive_products', days=30, stdout=StringIO())
+        refresh_forecasts()
+        forecast = ConsumptionForecast.objects.get(user=self.user, category=self.category)
+        self.assertEqual((forecast.used_count, forecast.wasted_count), (2, 1))
+
+
+class StoredRecommendationTest(TestCase):
+    """Tests for the materialized recommendations."""
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.fruit = Category.objects.create(name='Фрукты')
+        self.meat = Category.objects.create(name='Мясо')
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.apple = Product.objects.create(
+            user=self.alice, name='Яблоко', category=self.fruit,
+            expiration_date=self.today + timedelta(days=5),
+        )
+        Product.objects.create(
+            user=self.bob, name='Фарш', category=self.meat,
+            expiration_date=self.today + timedelta(days=1),
+        )
+
+    def test_reads_stored_rows_until_product_changes(self):
+        """Fresh stored rows are read as-is; a product write queues the recompute."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.apple.save()
+        self.assertEqual(jobs.run_pending(), 1)
+        with self.assertNumQueries(2):
+            recs = get_recommendations(self.alice)
+        self.assertEqual([r.product.name for r in recs], ['Яблоко'])
+
+        self.apple.expiration_date = self.today + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.apple.save()
+        # Until the job runs, reads compute in memory and write nothing
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.assertEqual(get_recommendations(self.alice)[0].urgency, 'warning')
+        self.assertTrue(all(q['sql'].startswith('SELECT') for q in queries.captured_queries))
+        self.assertEqual(list(stale_batches(self.today).values_list('user__username', flat=True)), ['alice'])
+        jobs.run_pending()
+        self.assertFalse(stale_batches(self.today).exists())
+        self.assertEqual(get_recommendations(self.alice)[0].urgency, 'warning')
+
+    def test_template_edit_marks_only_affected_users(self):
+        """Editing a category template refreshes users with products in that category."""
+        refresh_user_recommendations(self.alice)
+        refresh_user_recommendations(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            RecommendationTemplate.objects.create(
+                category=self.fruit, days_before_expiry=10,
+                title='Сделайте смузи', text='Фрукты отлично подойдут для смузи.',
+            )
+        self.assertEqual(
+            list(stale_batches(self.today).values_list('user__username', flat=True)),
+            ['alice'],
+        )
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertFalse(stale_batches(self.today).exists())
+        self.assertEqual(get_recommendations(self.alice)[0].title, 'Сделайте смузи')
+
+    def test_date_rollover_makes_batches_stale(self):
+        """Batches computed on an earlier date are refreshed."""
+        refresh_user_recommendations(self.alice)
+        RecommendationBatch.objects.update(computed_on=self.today - timedelta(days=1))
+        call_command('refresh_recommendations', stdout=StringIO())
+        self.assertFalse(stale_batches(self.today).exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProductCatalogTest(TestCase):
+    """Tests for the local product catalog and autocomplete endpoint."""
+
+    def test_prefix_search(self):
+        """Name prefixes rank before word prefixes; case and ё are ignored."""
+        catalog = ProductCatalog([
+            CatalogEntry('Сыр Российский', 'Молочные продукты', None),
+            CatalogEntry('Свёкла', 'Овощи', None),
+            CatalogEntry('Российский хлеб', 'Хлеб', None),
+            CatalogEntry('сыр российский', 'Молочные продукты', None),
+        ])
+        self.assertEqual(len(catalog), 3)
+        self.assertEqual(
+            [e.name for e in catalog.search('РОСС')],
+            ['Российский хлеб', 'Сыр Российский'],
+        )
+        self.assertEqual([e.name for e in catalog.search('свек')], ['Свёкла'])
+        self.assertEqual(len(catalog.search('с', limit=1)), 1)
+        self.assertEqual(catalog.search('  '), [])
+
+    def test_autocomplete_prefills_category_and_expiration(self):
+        """The endpoint maps catalog categories to Category rows and shelf life."""
+        dairy = Category.objects.create(name='Молочные продукты', default_shelf_life_days=5)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'catalog.tsv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('# комментарий\nКефир\tмолочные продукты\nКешью\tОрехи\t90\n')
+            user = User.objects.create_user('shopper')
+            self.client.force_login(user)
+            with override_settings(PRODUCT_CATALOG_PATH=path):
+                data = self.client.get(reverse('product_autocomplete'), {'q': 'ке'}).json()
+        today = timezone.now().date()
+        self.assertEqual(data['results'], [
+            {
+                'name': 'Кефир', 'category': 'молочные продукты', 'category_id': dairy.id,
+                'shelf_life_days': 5, 'expiration_date': (today + timedelta(days=5)).isoformat(),
+            },
+            {
+                'name': 'Кешью', 'category': 'Орехи', 'category_id': None,
+                'shelf_life_days': 90, 'expiration_date': (today + timedelta(days=90)).isoformat(),
+            },
+        ])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeIndexTest(TestCase):
+    """Tests for ranking local recipes by soon-expiring products."""
+
+    def setUp(self):
+        cache.clear()
+        self.index = RecipeIndex([
+            Recipe('Омлет', ('яйца', 'молоко', 'масло сливочное')),
+            Recipe('Салат', ('помидоры', 'огурцы', 'сметана')),
+            Recipe('Блины', ('молоко', 'яйца', 'мука пшеничная', 'сахар')),
+            Recipe('Пюре', ('картофель', 'молоко', 'масло сливочное')),
+        ])
+
+    def test_rank_by_weighted_products(self):
+        """Word forms match, weights add up and fuller recipes win ties."""
+        matches = self.index.rank([
+            ('Молоко 2,5%', 1.0), ('Яйцо куриное', 0.5), ('Помидор черри', 0.2),
+            ('Масло сливочное 82%', 0.0),
+        ])
+        self.assertEqual([m.recipe.title for m in matches], ['Омлет', 'Блины', 'Пюре', 'Салат'])
+        self.assertEqual(matches[0].score, 1.5)
+        self.assertEqual(matches[0].used, ['Молоко 2,5%', 'Яйцо куриное'])
+        self.assertEqual(matches[0].missing, [])
+        self.assertEqual(matches[2].missing, ['картофель'])
+        self.assertEqual(
+            [m.recipe.title for m in self.index.rank([('Молоко', 1.0)], required='Картофель')],
+            ['Пюре'],
+        )
+
+    def test_product_weight(self):
+        """Sooner expiry and higher priority weigh more; far-off products do not count."""
+        self.assertGreater(product_weight(0, 'medium'), product_weight(5, 'medium'))
+        self.assertGreater(product_weight(3, 'high'), product_weight(3, 'low'))
+        self.assertEqual(product_weight(30, 'high'), 0)
+        self.assertEqual(product_weight(-1, 'high'), 0)
+
+    def test_recipes_page(self):
+        """The page ranks bundled-format recipes for the user's inventory."""
+        user = User.objects.create_user('cook')
+        today = timezone.now().date()
+        milk = Product.objects.create(user=user, name='Молоко', expiration_date=today + timedelta(days=1))
+        Product.objects.create(user=user, name='Картофель', expiration_date=today + timedelta(days=3))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'recipes.tsv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('# комментарий\nПюре\tкартофель, молоко\nКаша\tмолоко, крупа\n')
+            self.client.force_login(user)
+            with override_settings(RECIPES_PATH=path):
+                response = self.client.get(reverse('recipes'))
+                self.assertEqual([m.recipe.title for m in response.context['recipes']], ['Пюре', 'Каша'])
+                self.assertContains(response, 'Понадобится ещё: крупа')
+                response = self.client.get(reverse('recipes'), {'product': milk.pk})
+                self.assertEqual(response.context['product'], milk)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CalendarFeedTest(TestCase):
+    """Tests for the token-authenticated iCalendar expiry feed."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('planner')
+        self.today = timezone.now().date()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk = Product.objects.create(
+                user=self.user, name='Молоко', expiration_date=self.today + timedelta(days=2)
+            )
+            Product.objects.create(
+                user=self.user, name='Хлеб, ржаной', expiration_date=self.today,
+                notifications=False,
+            )
+        self.feed = CalendarFeed.objects.create(user=self.user, token=CalendarFeed.new_token())
+        self.url = reverse('calendar_feed', args=[self.feed.token])
+
+    def test_feed_content_and_conditional_get(self):
+        """Events carry all-day dates and alarms; an unchanged feed answers 304."""
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = response.content.decode('utf-8')
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertEqual(body.count('BEGIN:VALARM'), 1)
+        self.assertIn(f'DTSTART;VALUE=DATE:{self.milk.expiration_date:%Y%m%d}', body)
+        self.assertIn('SUMMARY:Истекает срок: Хлеб\\, ржаной', body)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(reverse('calendar_feed', args=['wrong'])).status_code, 404)
+
+    def test_deleted_product_advances_last_modified(self):
+        """A poll with only If-Modified-Since sees a product that left the feed."""
+        Product.objects.filter(user=self.user).update(updated_at=timezone.now() - timedelta(days=1))
+        cache.clear()
+        first = self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk.delete()
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode('utf-8').count('BEGIN:VEVENT'), 1)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_incremental_refresh(self):
+        """Repeat polls skip the database; edits re-render and used products drop out."""
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url)['ETag'], first['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk.expiration_date = self.today + timedelta(days=5)
+            self.milk.save()
+        body = get_feed(self.user.pk)['body']
+        self.assertIn(f'DTSTART;VALUE=DATE:{self.milk.expiration_date:%Y%m%d}', body)
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk.status = 'used'
+            self.milk.save()
+        self.assertNotIn('Молоко', get_feed(self.user.pk)['body'])
+
+    def test_fold_and_token_reset(self):
+        """Long lines fold at 75 octets; a new token disables the old link."""
+        line = 'SUMMARY:' + 'Молоко' * 20
+        folded = fold(line)
+        self.assertTrue(all(len(part.encode('utf-8')) <= 75 for part in folded.split('\r\n')))
+        self.assertEqual(folded.replace('\r\n ', ''), line)
+        self.client.get(self.url)
+        self.client.force_login(self.user)
+        self.client.post(reverse('calendar'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.feed.refresh_from_db()
+        self.assertContains(self.client.get(reverse('calendar')), self.feed.token)
+
+
+@override_settings(CACHES=TEST_CACHES, INVENTORY_SNAPSHOT_MB=1)
+class InventorySnapshotTest(TestCase):
+    """Tests for the per-process columnar snapshot of active products."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('snap')
+        self.dairy = Category.objects.create(name='Молочные продукты')
+        today = timezone.now().date()
+        for name, days, priority, category in [
+            ('Кефир', 1, 'high', self.dairy), ('Сыр', 10, 'low', self.dairy),
+            ('Хлеб', -2, 'medium', None), ('Яблоки', 0, 'low', None),
+        ]:
+            Product.objects.create(
+                user=self.user, name=name, expiration_date=today + timedelta(days=days),
+                priority=priority, category=category,
+            )
+        Product.objects.create(user=self.user, name='Старое', expiration_date=today, status='used')
+        self.client.force_login(self.user)
+
+    def names(self, **params):
+        cache.clear()
+        response = self.client.get(reverse('product_list'), params)
+        return [p.name for p in response.context['products']]
+
+    def test_product_list_matches_database(self):
+        """Filters and sorts served from the snapshot give the database results."""
+        cases = [
+            {'status': 'active', 'sort': sort} for sort in ('name', 'priority', '-expiration_date')
+        ] + [
+            {'status': 'warning'}, {'status': 'danger'},
+            {'status': 'active', 'category': self.dairy.pk, 'sort': 'name'},
+            {'status': 'active', 'priority': 'high', 'sort': 'name'},
+        ]
+        with_snapshot = [self.names(**params) for params in cases]
+        with override_settings(INVENTORY_SNAPSHOT_MB=0):
+            self.assertEqual(with_snapshot, [self.names(**params) for params in cases])
+        self.assertEqual(with_snapshot[0], ['Кефир', 'Сыр', 'Хлеб', 'Яблоки'])
+        self.assertEqual(with_snapshot[3], ['Яблоки', 'Кефир'])
+
+    def test_invalidated_by_writes(self):
+        """A product save drops the snapshot; other lookups are hits."""
+        first = snapshot_for(self.user.pk)
+        self.assertIs(snapshot_for(self.user.pk), first)
+        product = Product.objects.get(name='Сыр')
+        product.status = 'used'
+        product.save()
+        self.assertEqual(len(snapshot_for(self.user.pk)), 3)
+        response = self.client.get(reverse('index'))
+        self.assertEqual((response.context['expiring'], response.context['expired']), (2, 1))
+        self.assertEqual(response.context['recent_products'][0].name, 'Яблоки')
+
+    def test_lru_eviction_under_memory_cap(self):
+        """Least recently used snapshots go first once the byte budget is spent."""
+        other = User.objects.create_user('other')
+        Product.objects.create(user=other, name='Сок', expiration_date=timezone.now().date())
+        probe = SnapshotStore(10**6)
+        size = probe.get(self.user.pk).nbytes + probe.get(other.pk).nbytes
+        store = SnapshotStore(size)
+        store.get(self.user.pk)
+        store.get(other.pk)
+        store.get(self.user.pk)
+        third = User.objects.create_user('third')
+        Product.objects.create(user=third, name='Чай', expiration_date=timezone.now().date())
+        store.get(third.pk)
+        stats = store.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 3, 1))
+        self.assertLessEqual(stats['bytes'], size)
+        self.assertIn(self.user.pk, store._snapshots)
+        self.assertNotIn(other.pk, store._snapshots)
+
+
+@jobs.task(name='tests.flaky', max_attempts=2)
+def flaky_task(value):
+    if value < 0:
+        raise ValueError('negative')
+    return value * 2
+
+
+@override_settings(CACHES=TEST_CACHES, JOB_RETRY_DELAY=0)
+class JobQueueTest(TestCase):
+    """Tests for the database-backed job queue."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_dedup_and_priority(self):
+        """Pending duplicates collapse; higher priority runs first."""
+        low = jobs.enqueue(flaky_task, 1, dedup_key='low')
+        self.assertEqual(jobs.enqueue(flaky_task, 1, dedup_key='low').pk, low.pk)
+        high = jobs.enqueue(flaky_task, 2, priority=5)
+        later = jobs.enqueue(flaky_task, 3, priority=9, delay=3600)
+        self.assertEqual(jobs.claim(5, 'test'), [high.pk, low.pk])
+        # A running job does not block a fresh one with the same key
+        self.assertNotEqual(jobs.enqueue(flaky_task, 1, dedup_key='low').pk, low.pk)
+        jobs.run(high.pk)
+        high.refresh_from_db()
+        self.assertEqual((high.status, high.result), ('done', 4))
+        self.assertEqual(Job.objects.get(pk=later.pk).status, 'pending')
+
+    def test_retries_then_fails(self):
+        """A failing job is retried until its attempts run out."""
+        job = jobs.enqueue(flaky_task, -1)
+        with self.assertLogs('app.jobs', 'WARNING'):
+            self.assertEqual(jobs.run_pending(), 2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIn('ValueError: negative', job.error)
+        self.assertEqual(jobs.job_state(job)['error'], 'ValueError: negative')
+
+    def test_enqueue_report_and_poll(self):
+        """The statistics report is built by a job and polled as JSON by its owner only."""
+        user = User.objects.create_user('reporter')
+        product = Product.objects.create(user=user, name='Сыр', expiration_date=timezone.now().date())
+        product.status = 'thrown'
+        product.save()
+        self.client.force_login(user)
+        response = self.client.post(reverse('waste_report_job'))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.post(reverse('waste_report_job')).json()['id'], response.json()['id'])
+        self.assertEqual(self.client.get(response.json()['url']).json()['status'], 'pending')
+        jobs.run_pending()
+        state = self.client.get(response.json()['url']).json()
+        self.assertEqual(state['status'], 'done')
+        self.assertEqual(set(state['result']), {'start', 'end'})
+        # The report itself is in the page cache, not in the job row
+        period = [date.fromisoformat(state['result'][key]) for key in ('start', 'end')]
+        report = cached_for_user(user.pk, 'waste_report', dict, *period)
+        self.assertEqual(report['period_summary']['wasted'], 1)
+        self.client.force_login(User.objects.create_user('stranger'))
+        self.assertEqual(self.client.get(response.json()['url']).status_code, 404)
+
+
+@jobs.task(name='tests.outlives_timeout')
+def outlives_timeout_task():
+    time.sleep(0.5)
+    return jobs.requeue_stale()
+
+
+@override_settings(JOB_TIMEOUT=0.3)
+class JobHeartbeatTest(TransactionTestCase):
+    """Tests for the heartbeat of running jobs (the heartbeat writes from its own thread)."""
+
+    def test_running_job_is_not_requeued(self):
+        """A job running longer than JOB_TIMEOUT keeps its lock while it is alive."""
+        job = jobs.enqueue(outlives_timeout_task)
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.attempts), ('done', 0, 1))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FragmentCacheTest(TestCase):
+    """Tests for the cached template fragments."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('fragments')
+        self.category = Category.objects.create(name='Соусы')
+        RecommendationTemplate.objects.create(
+            category=self.category, days_before_expiry=3, title='Используйте соус',
+            text='Скоро истекает',
+        )
+        self.product = Product.objects.create(
+            user=self.user, name='Кетчуп', category=self.category,
+            expiration_date=timezone.now().date() + timedelta(days=1),
+        )
+        self.client.force_login(self.user)
+
+    def test_category_options_skip_the_query(self):
+        """Warm category option lists are served without reading categories."""
+        self.client.get(reverse('product_add'))
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(reverse('product_add'))
+        self.assertContains(response, 'Соусы')
+        self.assertFalse([q for q in queries if 'app_category' in q['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Соусы и специи'
+            self.category.save()
+        self.assertContains(self.client.get(reverse('product_add')), 'Соусы и специи')
+
+    def test_category_filter_is_keyed_on_the_rendered_selection(self):
+        """An invalid filter elsewhere does not leak a preselected category to others."""
+        selected = f'<option value="{self.category.pk}" selected>'
+        response = self.client.get(
+            reverse('product_list'), {'category': self.category.pk, 'status': 'bogus'}
+        )
+        self.assertContains(response, selected)
+        self.client.force_login(User.objects.create_user('neighbour'))
+        self.assertNotContains(self.client.get(reverse('product_list')), selected)
+
+    def test_user_fragments_follow_the_data_version(self):
+        """Nav and recommendation cards are per user and re-render after a write."""
+        self.assertContains(self.client.get(reverse('index')), 'Кетчуп (1 дней)')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Горчица'
+            self.product.save()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Горчица (1 дней)')
+        self.assertContains(response, 'Привет, fragments!')
+
+        self.client.force_login(User.objects.create_user('neighbour'))
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Привет, neighbour!')
+        self.assertNotContains(response, 'Горчица')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProductApiTest(TestCase):
+    """Tests for the JSON product API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('api-user')
+        cls.category = Category.objects.create(name='Овощи')
+        today = timezone.now().date()
+        # Equal expiration dates make the pages depend on the id tie-breaker
+        for i in range(7):
+            Product.objects.create(
+                user=cls.user, name=f'Морковь {i}', category=cls.category,
+                expiration_date=today + timedelta(days=i // 3),
+                status='used' if i == 6 else 'active',
+            )
+        Product.objects.create(
+            user=User.objects.create_user('other'), name='Чужой',
+            expiration_date=today,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def fetch_all(self, **params):
+        rows, cursor = [], None
+        while True:
+            query = {**params, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(reverse('api_products'), query).json()
+            rows += data['results']
+            cursor = data['next']
+            if cursor is None:
+                return rows
+
+    def test_keyset_pages_match_the_html_list(self):
+        """Pages follow the filter form and sort of the HTML list without gaps or repeats."""
+        for params in ({'sort': 'expiration_date'}, {'sort': '-expiration_date', 'status': 'active'},
+                       {'sort': 'name', 'search': 'Морковь 1'}, {'status': 'used'}):
+            with self.subTest(**params):
+                html = self.client.get(reverse('product_list'), params).context['products']
+                rows = self.fetch_all(limit=2, fields='id,name', **params)
+                self.assertEqual(sorted(rows[0]), ['id', 'name'])
+                self.assertCountEqual([row['id'] for row in rows], [p.pk for p in html])
+        rows = self.fetch_all(limit=2, sort='-expiration_date')
+        self.assertEqual([row['name'] for row in rows], [f'Морковь {i}' for i in range(6, -1, -1)])
+
+        response = self.client.get(reverse('api_products'), {'fields': 'id,owner'})
+        self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_products')).status_code, 401)
+
+    def test_used_products_include_the_archive(self):
+        """status=used merges archived products into the same keyset order."""
+        Product.objects.filter(user=self.user, name__in=['Морковь 1', 'Морковь 4']).update(
+            status='used', notifications=False, updated_at=timezone.now() - timedelta(days=60)
+        )
+        call_command('archive_products', days=30, stdout=StringIO())
+        rows = self.fetch_all(limit=1, status='used', sort='name', fields='name,notifications')
+        self.assertEqual([row['name'] for row in rows], ['Морковь 1', 'Морковь 4', 'Морковь 6'])
+        self.assertFalse(rows[0]['notifications'])
+
+    def test_batch_is_validated_and_atomic(self):
+        """A batch applies every operation or, if one is invalid, none of them."""
+        products = list(Product.objects.for_user(self.user).filter(status='active').order_by('pk'))
+        url = reverse('api_product_batch')
+        tomorrow = (timezone.now().date() + timedelta(days=1)).isoformat()
+        operations = [
+            {'op': 'create', 'data': {'name': 'Свёкла', 'expiration_date': tomorrow,
+                                      'category': self.category.pk}},
+            {'op': 'update', 'id': products[0].pk, 'data': {'quantity': 3}},
+            {'op': 'mark_used', 'id': products[1].pk},
+            {'op': 'delete', 'id': products[2].pk},
+        ]
+        invalid = operations + [
+            {'op': 'update', 'id': products[3].pk, 'data': {'quantity': 0}},
+            {'op': 'delete', 'id': Product.objects.get(name='Чужой').pk},
+        ]
+        response = self.client.post(url, {'operations': invalid}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [4, 5])
+        self.assertIn('quantity', response.json()['errors'][0]['errors'])
+        self.assertFalse(Product.objects.filter(name='Свёкла').exists())
+        self.assertEqual(Product.objects.for_user(self.user).count(), 7)
+
+        response = self.client.post(url, {'operations': operations}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        created = Product.objects.get(name='Свёкла')
+        self.assertEqual(response.json()['results'][0], {'op': 'create', 'id': created.pk})
+        self.assertTrue(created.notifications)
+        self.assertEqual(Product.objects.get(pk=products[0].pk).quantity, 3)
+        self.assertEqual(Product.objects.get(pk=products[1].pk).status, 'used')
+        self.assertFalse(Product.objects.filter(pk=products[2].pk).exists())
+        self.assertTrue(ProductEvent.objects.filter(product_id=products[1].pk, event='used').exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CompressionTest(TestCase):
+    """Tests for HTML minification and response compression."""
+
+    def test_minify_html(self):
+        """Indentation collapses; pre, script, inline spaces and nbsp survive."""
+        html = (
+            '<div>\n    <b>a</b> <i>b</i>\n\n    \xa0c  \n</div>\n'
+            '<pre>\n  keep\n</pre>\n  <script>\n  const s = `x\n  y`;\n</script>'
+        )
+        expected = (
+            '<div>\n<b>a</b> <i>b</i>\n\xa0c\n</div>\n'
+            '<pre>\n  keep\n</pre>\n<script>\n  const s = `x\n  y`;\n</script>'
+        )
+        self.assertEqual(minify_html(html), expected)
+        self.assertEqual(minify_html(html.encode()), expected.encode())
+
+    def test_compressed_page_revalidates(self):
+        """Large pages are gzipped with a weak ETag that still yields 304."""
+        user = User.objects.create_user('gz')
+        for i in range(30):
+            Product.objects.create(user=user, name=f'Продукт {i}', expiration_date=timezone.now().date())
+        self.client.force_login(user)
+        plain = self.client.get(reverse('product_list'))
+        response = self.client.get(reverse('product_list'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        # Masked CSRF tokens differ per response but keep their length
+        self.assertEqual(len(gzip.decompress(response.content)), len(plain.content))
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertNotIn('\n    <td>', plain.content.decode())
+        response = self.client.get(
+            reverse('product_list'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('product_list'), HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streaming_and_small_responses(self):
+        """Streams are compressed chunk by chunk; small bodies stay as they are."""
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        chunks = [b'{"rows": [', b'1, ' * 2000, b'2]}']
+        response = process_response(
+            request, StreamingHttpResponse(iter(chunks), content_type='application/json')
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b''.join(chunks))
+        small = process_response(request, HttpResponse('{}', content_type='application/json'))
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+
+class StaticFilesTest(TestCase):
+    """Tests for the hashed, precompressed static pipeline."""
+
+    def test_minify_css(self):
+        """Comments and whitespace go, descendant pseudo-class spaces stay."""
+        self.assertEqual(
+            minify_css('/* c */\n.a :hover ,\n.b > .c {\n    color: red;\n}\n'),
+            '.a :hover,.b>.c{color:red}',
+        )
+
+    def test_collected_files_are_served(self):
+        """Hashed files are served precompressed with far-future caching."""
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            client = Client()
+            page = client.get(reverse('login')).content.decode()
+            url = re.search(r'src="(/static/app/js/app\.[0-9a-f]{12}\.js)"', page).group(1)
+            response = client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertIn('FreshTracker', gzip.decompress(response.content).decode())
+            response = client.get('/static/app/js/app.js')
+            self.assertNotIn('Content-Encoding', response)
+            self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+            self.assertFalse(os.path.exists(os.path.join(root, 'app', 'js', 'jquery-1.10.2.js')))
+
+
+REPLICAS = ('replica1', 'replica2')
+
+
+@override_settings(CACHES=TEST_CACHES, DATABASE_REPLICAS=list(REPLICAS))
+class ReplicaRoutingTest(TestCase):
+    """Tests for read-replica routing, with separate SQLite files as replicas."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Replicas are registered after the test runner's system checks have run
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        for alias in REPLICAS:
+            name = os.path.join(cls.replica_dir.name, f'{alias}.sqlite3')
+            connections.settings[alias] = connections.configure_settings({
+                'default': {},
+                alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name},
+            })[alias]
+            call_command('migrate', database=alias, verbosity=0)
+        cls.databases = {'default', *REPLICAS}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in REPLICAS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.replica_dir.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.now().date()
+        cls.user = User.objects.create_user('reader')
+        cls.own = Product.objects.create(
+            user=cls.user, name='Основная', expiration_date=today + timedelta(days=3)
+        )
+        for alias in REPLICAS:
+            User.objects.using(alias).create(id=cls.user.id, username='reader')
+            Product(user_id=cls.user.id, name='Реплика', expiration_date=today).save(using=alias)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def names(self, **params):
+        response = self.client.get(reverse('product_list'), params)
+        return [p.name for p in response.context['products']]
+
+    def test_read_views_use_a_replica(self):
+        """Read-only views read from a replica, writes land on the primary."""
+        self.assertEqual(self.names(), ['Реплика'])
+        self.client.post(reverse('product_mark_used', args=[self.own.pk]))
+        self.own.refresh_from_db()
+        self.assertEqual(self.own.status, 'used')
+        for alias in REPLICAS:
+            self.assertFalse(Product.objects.using(alias).filter(status='used').exists())
+
+    def test_client_reads_its_own_writes(self):
+        """After a write the client is pinned to the primary for REPLICA_LAG seconds."""
+        response = self.client.post(reverse('product_mark_used', args=[self.own.pk]))
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+        self.assertEqual(self.names(status='used'), ['Основная'])
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(self.names(), ['Реплика'])
+
+    def test_caches_are_filled_from_the_primary_after_a_write(self):
+        """Other clients of the user do not cache replica rows under the new generation."""
+        self.names(status='used')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('product_mark_used', args=[self.own.pk]))
+        # Another device of the same user has no pin cookie
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(self.names(status='used'), ['Основная'])
+        cache.delete_many([f'inventory-gen:{self.user.pk}:written', 'catalog-gen:written'])
+        self.assertEqual(self.names(status='used'), ['Основная'])
+
+
+SHARDS = ('shard1', 'shard2')
+
+
+@override_settings(CACHES=TEST_CACHES, PRODUCT_SHARDS=list(SHARDS))
+class ShardingTest(TestCase):
+    """Tests for per-user product shards, with separate SQLite files as shards."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shard_dir = tempfile.TemporaryDirectory()
+        for alias in SHARDS:
+            name = os.path.join(cls.shard_dir.name, f'{alias}.sqlite3')
+            connections.settings[alias] = connections.configure_settings({
+                'default': {},
+                alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name},
+            })[alias]
+            call_command('migrate', database=alias, verbosity=0)
+        cls.databases = {'default', *SHARDS}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in SHARDS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.shard_dir.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Овощи')
+        # One owner per shard
+        cls.owners = {}
+        number = 0
+        while len(cls.owners) < len(SHARDS):
+            user = User.objects.create_user(f'owner{number}')
+            cls.owners.setdefault(shard_for(user.pk), user)
+            number += 1
+
+    def setUp(self):
+        cache.clear()
+
+    def add_product(self, user, name):
+        return Product.objects.create(
+            user=user, name=name, category=self.category,
+            expiration_date=timezone.now().date() + timedelta(days=3),
+        )
+
+    def test_products_live_on_the_owner_shard(self):
+        """Each user's products are written to, and read from, their own shard."""
+        for shard, user in self.owners.items():
+            product = self.add_product(user, f'Морковь {shard}')
+            self.assertEqual(product._state.db, shard)
+            self.assertTrue(Category.objects.using(shard).filter(pk=self.category.pk).exists())
+            self.assertFalse(Product.objects.using('default').exists())
+
+            self.client.force_login(user)
+            response = self.client.get(reverse('product_list'))
+            self.assertEqual([p.name for p in response.context['products']], [product.name])
+            self.assertEqual(response.context['products'][0].category.name, 'Овощи')
+            self.client.post(reverse('product_mark_used', args=[product.pk]))
+            self.assertEqual(Product.objects.using(shard).get(pk=product.pk).status, 'used')
+
+    def test_deleting_a_user_removes_sharded_products(self):
+        """The cascade from the primary database reaches products on the shard."""
+        shard, user = next(iter(self.owners.items()))
+        self.add_product(user, 'Морковь')
+        user.delete()
+        self.assertFalse(Product.objects.using(shard).exists())
+
+    def test_rebalance_moves_products_from_the_primary(self):
+        """rebalance_shards moves pre-sharding rows and keeps the event log pointing at them."""
+        shard, user = next(iter(self.owners.items()))
+        with self.settings(PRODUCT_SHARDS=[]):
+            product = self.add_product(user, 'Старая морковь')
+        self.assertEqual(product._state.db, 'default')
+
+        call_command('rebalance_shards', stdout=StringIO())
+        self.assertFalse(Product.objects.using('default').exists())
+        moved = Product.objects.using(shard).get(user=user)
+        self.assertEqual(moved.name, 'Старая морковь')
+        self.assertEqual(moved.created_at, product.created_at)
+        event = ProductEvent.objects.get(user=user)
+        self.assertEqual(event.product_id, moved.pk)
+
+    def test_rebalance_remaps_overlapping_ids_once(self):
+        """Old and new ids overlap: each event is remapped once and history never aliases a moved product."""
+        shard, user = next(iter(self.owners.items()))
+        neighbour = next(
+            candidate for candidate in (User.objects.create_user(f'neighbour{i}') for i in range(100))
+            if shard_for(candidate.pk) == shard
+        )
+        with self.settings(PRODUCT_SHARDS=[]):
+            products = [self.add_product(user, f'Морковь {i}') for i in range(5)]
+            products[2].delete()
+            products[4].status = 'used'
+            products[4].save()
+            Product.objects.filter(pk=products[4].pk).update(
+                updated_at=timezone.now() - timedelta(days=60)
+            )
+            call_command('archive_products', days=30, stdout=StringIO())
+        # A row of another user on the shard shifts the new ids onto the old ones
+        self.add_product(neighbour, 'Соседская морковь')
+
+        call_command('rebalance_shards', stdout=StringIO())
+        moved = {p.name: p.pk for p in Product.objects.using(shard).filter(user=user)}
+        old_ids = {products[i].pk for i in (0, 1, 3)}
+        self.assertTrue(old_ids & set(moved.values()))
+        for name, pk in moved.items():
+            self.assertEqual(
+                list(ProductEvent.objects.filter(user=user, product_id=pk).values_list('event', flat=True)),
+                ['created'], name,
+            )
+        deleted = ProductEvent.objects.get(user=user, event='deleted').product_id
+        archived = ArchivedProduct.objects.using(shard).get(user=user).product_id
+        self.assertLess(deleted, 0)
+        self.assertLess(archived, 0)
+        self.assertEqual(ProductEvent.objects.filter(user=user, product_id=deleted).count(), 2)
+        self.assertEqual(
+            sorted(ProductEvent.objects.filter(user=user, product_id=archived).values_list('event', flat=True)),
+            ['created', 'used'],
+        )
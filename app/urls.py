@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -11,10 +11,20 @@ urlpatterns = [
     
     path('products/', views.product_list, name='product_list'),
     path('products/add/', views.product_add, name='product_add'),
+    path('products/autocomplete/', views.product_autocomplete, name='product_autocomplete'),
     path('products/<int:pk>/edit/', views.product_edit, name='product_edit'),
     path('products/<int:pk>/delete/', views.product_delete, name='product_delete'),
     path('products/<int:pk>/mark_used/', views.product_mark_used, name='product_mark_used'),
     path('products/statistics/', views.product_statistics, name='product_statistics'),
+    path('products/statistics/report/', views.waste_report_job, name='waste_report_job'),
     
     path('recommendations/', views.recommendations, name='recommendations'),
+    path('recipes/', views.recipes, name='recipes'),
+    path('calendar/', views.calendar_settings, name='calendar'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
+    path('jobs/<int:pk>/', views.job_status, name='job_status'),
+
+    path('api/products/', api.products, name='api_products'),
+    path('api/products/batch/', api.product_batch, name='api_product_batch'),
+    path('api/categories/', api.categories, name='api_categories'),
 ]
\ No newline at end of file
@@ -1,87 +1,115 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, JsonResponse
+from django.template.loader import render_to_string
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Count, Q, F
-from datetime import timedelta, datetime
-import pandas as pd
-import matplotlib
-matplotlib.use('Agg') 
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.db.models import Count, F
+from datetime import date, timedelta, datetime
+from operator import attrgetter
+from types import SimpleNamespace
+from asgiref.sync import sync_to_async
 import numpy as np
 
-from .models import Product, Category, RecommendationTemplate
+from .analytics import NO_CATEGORY, aproducts_frame
+from .cache import acached_for_user
+from .catalog import suggestions
+from .compression import minify_html
+from .conditional import user_page_condition
+from .charts import category_bar_chart, category_pie_chart, urgency_bar_chart
+from .ical import feed_for_user, feed_user_id, get_feed, reset_token
+from .jobs import enqueue, job_state
+from .models import Product, Category, Job, RecommendationTemplate
+from .recipes import recipes_for_products
+from .recommendations import aget_recommendations
+from .routers import read_from_replica
+from .snapshot import SORTS as SNAPSHOT_SORTS, asnapshot_for
+from .tasks import waste_report, waste_report_context
 from .forms import ProductForm, ProductFilterForm, UserRegisterForm, UserLoginForm
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 
-def index(request):
+# Шаблоны рендерятся в потоке: контекстные процессоры обращаются к
+# request.user синхронно, а это запрос к БД.
+arender = sync_to_async(render)
+arender_to_string = sync_to_async(render_to_string)
+
+
+@read_from_replica
+async def index(request):
     context = {}
-    if request.user.is_authenticated:
-        products = Product.objects.filter(user=request.user)
-        
-        total = products.count()
-        expiring = products.filter(
-            expiration_date__lte=timezone.now().date() + timedelta(days=2),
-            expiration_date__gte=timezone.now().date(),
+    user = await request.auser()
+    if user.is_authenticated:
+        context.update(
+            await acached_for_user(user.pk, 'index', lambda: _index_context(user))
+        )
+    
+    return await arender(request, 'index.html', context)
+
+
+async def _index_context(user):
+    context = {}
+    products = Product.objects.for_user(user)
+    today = timezone.now().date()
+
+    total = await products.acount()
+    snapshot = await asnapshot_for(user.pk)
+    if snapshot is not None:
+        expiring = len(snapshot.select(today, 'warning'))
+        expired = len(snapshot.select(today, 'danger'))
+        categories = await _category_map()
+        if len(snapshot):
+            category_ids, counts = np.unique(snapshot.category_ids, return_counts=True)
+            top = np.argsort(-counts, kind='stable')[:5]
+            context['category_chart'] = category_bar_chart(
+                [getattr(categories.get(category_ids[i]), 'name', NO_CATEGORY) for i in top],
+                counts[top].tolist(),
+            )
+        recent_products = snapshot.products(
+            snapshot.order(snapshot.select(today), '-created_at')[:5], categories
+        )
+    else:
+        expiring = await products.filter(
+            expiration_date__lte=today + timedelta(days=2),
+            expiration_date__gte=today,
             status='active'
-        ).count()
-        expired = products.filter(
-            expiration_date__lt=timezone.now().date(),
+        ).acount()
+        expired = await products.filter(
+            expiration_date__lt=today,
             status='active'
-        ).count()
+        ).acount()
 
-        if products.exists():
-
-            data = []
-            for p in products.filter(status='active'):
-                data.append({
-                    'name': p.name,
-                    'category': p.category.name if p.category else 'Без категории',
-                    'days_left': p.days_remaining,
-                    'expiration_date': p.expiration_date,
-                })
-            
-            if data:
-                df = pd.DataFrame(data)
-                category_stats = df.groupby('category').agg({
-                    'name': 'count',
-                    'days_left': ['mean', 'min']
-                }).round(1)
-
-                plt.figure(figsize=(10, 5))
+        if total:
+            df = await aproducts_frame(products.filter(status='active'), ('category',))
+            if not df.empty:
                 categories = df['category'].value_counts().head(5)
-                plt.bar(categories.index, categories.values, color=['#28a745', '#17a2b8', '#ffc107', '#dc3545', '#6c757d'])
-                plt.title('Топ-5 категорий продуктов')
-                plt.xlabel('Категория')
-                plt.ylabel('Количество')
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                buffer = BytesIO()
-                plt.savefig(buffer, format='png', dpi=100)
-                buffer.seek(0)
-                image_png = buffer.getvalue()
-                buffer.close()
-                plt.close()
-                
-                graphic = base64.b64encode(image_png).decode('utf-8')
-                context['graphic'] = graphic
-
-        recent_products = products.filter(status='active').order_by('-created_at')[:5]
-
-        recommendations = get_recommendations(request.user)
-        
-        context.update({
-            'total': total,
-            'expiring': expiring,
-            'expired': expired,
-            'recent_products': recent_products,
-            'recommendations': recommendations[:3],
-        })
+                context['category_chart'] = category_bar_chart(
+                    categories.index.tolist(), categories.tolist()
+                )
+
+        recent_products = [
+            p async for p in products.filter(status='active').order_by('-created_at')[:5]
+        ]
+
+    recommendations = await aget_recommendations(user, limit=3)
     
-    return render(request, 'index.html', context)
+    context.update({
+        'total': total,
+        'expiring': expiring,
+        'expired': expired,
+        'recent_products': recent_products,
+        'recommendations': recommendations,
+    })
+    return context
+
+
+async def _category_map():
+    return {category.pk: category async for category in Category.objects.all()}
 
 
 def about(request):
@@ -89,57 +117,89 @@ def about(request):
 
 
 @login_required
-def product_list(request):
-    products = Product.objects.filter(user=request.user)
+@read_from_replica
+@user_page_condition
+async def product_list(request):
+    user = await request.auser()
+    products = Product.objects.for_user(user)
+    archived = None
+    sort = 'expiration_date'
+    category = status = search_term = storage = priority = None
     
     form = ProductFilterForm(request.GET)
-    if form.is_valid():
-        if form.cleaned_data['category']:
-            products = products.filter(category=form.cleaned_data['category'])
-        
+    if await sync_to_async(form.is_valid)():
+        products, archived = form.filter_products(user)
+        category = form.cleaned_data['category']
         status = form.cleaned_data['status']
-        if status == 'warning':
-            products = products.filter(
-                expiration_date__lte=timezone.now().date() + timedelta(days=2),
-                expiration_date__gte=timezone.now().date(),
-                status='active'
-            )
-        elif status == 'danger':
-            products = products.filter(
-                expiration_date__lt=timezone.now().date(),
-                status='active'
-            )
-        elif status == 'used':
-            products = products.filter(status='used')
-        elif status == 'active':
-            products = products.filter(status='active')
-        
-        if form.cleaned_data['search']:
-            search_term = form.cleaned_data['search']
-            products = products.filter(
-                Q(name__icontains=search_term) | 
-                Q(notes__icontains=search_term)
-            )
-        
+        storage = form.cleaned_data['storage']
+        priority = form.cleaned_data['priority']
+        search_term = form.cleaned_data['search']
         if form.cleaned_data['sort']:
-            products = products.order_by(form.cleaned_data['sort'])
-        else:
-            products = products.order_by('expiration_date')
-    else:
-        products = products.order_by('expiration_date')
-
-    product_stats = products.aggregate(
-        total_quantity=Count('id'),
-        avg_days_left=Count('expiration_date')
+            sort = form.cleaned_data['sort']
+    products = products.order_by(sort)
+    # Активные продукты без поиска по тексту фильтруются и сортируются в снимке
+    from_snapshot = (
+        status in ('active', 'warning', 'danger') and not search_term and sort in SNAPSHOT_SORTS
     )
-    
-    context = {
-        'products': products,
+
+    async def load_snapshot_page():
+        snapshot = await asnapshot_for(user.pk)
+        if snapshot is None:
+            return None
+        positions = snapshot.select(
+            timezone.now().date(),
+            bucket=None if status == 'active' else status,
+            category_id=category and category.pk,
+            storage=storage or None,
+            priority=priority or None,
+        )
+        rows = snapshot.products(snapshot.order(positions, sort), await _category_map())
+        stats = {'total_quantity': len(rows), 'avg_days_left': len(rows)}
+        return {'products': rows, 'product_stats': stats}
+
+    async def load_page():
+        if from_snapshot:
+            page = await load_snapshot_page()
+            if page is not None:
+                return page
+        rows = [p async for p in products.select_related('category')]
+        stats = await products.aaggregate(
+            total_quantity=Count('id'),
+            avg_days_left=Count('expiration_date')
+        )
+        if archived is not None:
+            rows += [p async for p in archived.select_related('category')]
+            rows.sort(key=attrgetter(sort.lstrip('-')), reverse=sort.startswith('-'))
+            archived_stats = await archived.aaggregate(
+                total_quantity=Count('id'),
+                avg_days_left=Count('expiration_date')
+            )
+            stats = {key: value + archived_stats[key] for key, value in stats.items()}
+        return {'products': rows, 'product_stats': stats}
+
+    filters = tuple(sorted(
+        (key, tuple(values)) for key, values in request.GET.lists() if key != 'fragment'
+    ))
+    context = await acached_for_user(user.pk, 'product_list', load_page, filters)
+    if request.GET.get('fragment'):
+        # Смена фильтра на странице: только таблица, без макета и формы
+        html = await arender_to_string('product_list_results.html', context, request)
+        if settings.HTML_MINIFY:
+            html = minify_html(html)
+        return JsonResponse(
+            {'html': html, 'count': len(context['products'])},
+            json_dumps_params={'ensure_ascii': False},
+        )
+    context.update({
         'form': form,
+        # Queryset читается при рендеринге, и только если список категорий
+        # не взят из кэша фрагментов
         'categories': Category.objects.all(),
-        'product_stats': product_stats,
-    }
-    return render(request, 'product_list.html', context)
+        # Проверенное значение, даже если другие поля фильтра с ошибкой:
+        # по нему кэшируется список категорий с отмеченной
+        'selected_category': getattr(form.cleaned_data.get('category'), 'pk', None),
+    })
+    return await arender(request, 'product_list.html', context)
 
 
 @login_required
@@ -152,8 +212,7 @@ def product_add(request):
             product.save()
             messages.success(request, f'Продукт "{product.name}" успешно добавлен!')
             
-            similar_products = Product.objects.filter(
-                user=request.user,
+            similar_products = Product.objects.for_user(request.user).filter(
                 name__icontains=product.name,
                 status='active'
             ).exclude(id=product.id)[:3]
@@ -181,9 +240,18 @@ def product_add(request):
     return render(request, 'product_add.html', context)
 
 
+@login_required
+@read_from_replica
+def product_autocomplete(request):
+    """Подсказки названий из локального справочника продуктов."""
+    query = request.GET.get('q', '')[:100]
+    results = suggestions(query, timezone.now().date()) if query.strip() else []
+    return JsonResponse({'results': results})
+
+
 @login_required
 def product_edit(request, pk):
-    product = get_object_or_404(Product, pk=pk, user=request.user)
+    product = get_object_or_404(Product.objects.for_user(request.user), pk=pk)
     
     if request.method == 'POST':
         form = ProductForm(request.POST, instance=product)
@@ -203,7 +271,7 @@ def product_edit(request, pk):
 
 @login_required
 def product_delete(request, pk):
-    product = get_object_or_404(Product, pk=pk, user=request.user)
+    product = get_object_or_404(Product.objects.for_user(request.user), pk=pk)
     if request.method == 'POST':
         product_name = product.name
         product.delete()
@@ -215,12 +283,11 @@ def product_delete(request, pk):
 
 @login_required
 def product_mark_used(request, pk):
-    product = get_object_or_404(Product, pk=pk, user=request.user)
+    product = get_object_or_404(Product.objects.for_user(request.user), pk=pk)
     if request.method == 'POST':
         product.status = 'used'
         product.save()
-        used_today = Product.objects.filter(
-            user=request.user,
+        used_today = Product.objects.for_user(request.user).filter(
             status='used',
             updated_at__date=timezone.now().date()
         ).count()
@@ -234,26 +301,68 @@ def product_mark_used(request, pk):
 
 
 @login_required
-def product_statistics(request):
-    products = Product.objects.filter(user=request.user, status='active')
+@read_from_replica
+@user_page_condition
+async def product_statistics(request):
+    user = await request.auser()
+    start, end = _report_period(request)
+    context = await acached_for_user(
+        user.pk, 'statistics', lambda: _statistics_context(user)
+    )
+    context.update(await acached_for_user(
+        user.pk, 'waste_report',
+        sync_to_async(lambda: waste_report_context(user, start, end)),
+        start, end,
+    ))
+    return await arender(request, 'product_statistics.html', context)
+
+
+@login_required
+def waste_report_job(request):
+    """Ставит отчёт за период в очередь; ответ - задача для опроса через job_status."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Нужен POST'}, status=405)
+    start, end = _report_period(request)
+    job = enqueue(
+        waste_report, request.user.pk, start, end, user=request.user,
+        dedup_key=f'waste-report:{request.user.pk}:{start}:{end}',
+    )
+    return JsonResponse(
+        {**job_state(job), 'url': reverse('job_status', args=[job.pk])}, status=202
+    )
+
+
+@login_required
+def job_status(request, pk):
+    job = get_object_or_404(Job, pk=pk, user=request.user)
+    return JsonResponse(job_state(job), encoder=DjangoJSONEncoder)
+
+
+def _report_period(request):
+    today = timezone.now().date()
+    params = request.POST if request.method == 'POST' else request.GET
+    try:
+        end = date.fromisoformat(params.get('end', ''))
+    except ValueError:
+        end = today
+    try:
+        start = date.fromisoformat(params.get('start', ''))
+    except ValueError:
+        start = end - timedelta(days=29)
+    return min(start, end), end
+
+
+async def _statistics_context(user):
+    products = Product.objects.for_user(user).filter(status='active')
     
-    if not products.exists():
-        return render(request, 'product_statistics.html', {
+    if not await products.aexists():
+        return {
             'message': 'У вас пока нет активных продуктов для анализа.'
-        })
-
-    data = []
-    for p in products:
-        data.append({
-            'name': p.name,
-            'category': p.category.name if p.category else 'Без категории',
-            'days_left': p.days_remaining,
-            'expiration_date': p.expiration_date,
-            'priority': p.priority,
-            'quantity': p.quantity,
-        })
-    
-    df = pd.DataFrame(data)
+        }
+
+    df = await aproducts_frame(
+        products, ('name', 'category', 'priority', 'quantity')
+    )
 
     category_stats = df.groupby('category').agg({
         'name': 'count',
@@ -268,65 +377,48 @@ def product_statistics(request):
         'safe': len(df[df['days_left'] > 7]),
     }
 
-    plt.figure(figsize=(12, 6))
-    plt.subplot(1, 2, 1)
     category_counts = df['category'].value_counts()
-    plt.pie(category_counts.values, labels=category_counts.index, autopct='%1.1f%%')
-    plt.title('Распределение по категориям')
-
-    plt.subplot(1, 2, 2)
-    urgency_labels = ['Просрочено', 'Скоро истекает', 'На этой неделе', 'В норме']
-    urgency_values = [urgency_stats['danger'], urgency_stats['warning'], 
-                     urgency_stats['info'], urgency_stats['safe']]
-    colors = ['#dc3545', '#ffc107', '#17a2b8', '#28a745']
-    plt.bar(urgency_labels, urgency_values, color=colors)
-    plt.title('Статус продуктов по срочности')
-    plt.ylabel('Количество')
-    plt.xticks(rotation=45)
-    
-    plt.tight_layout()
-    buffer = BytesIO()
-    plt.savefig(buffer, format='png', dpi=100)
-    buffer.seek(0)
-    image_png = buffer.getvalue()
-    buffer.close()
-    plt.close()
-    
-    graphic = base64.b64encode(image_png).decode('utf-8')
+    category_chart = category_pie_chart(
+        category_counts.index.tolist(), category_counts.tolist()
+    )
+    urgency_chart = urgency_bar_chart(
+        [urgency_stats['danger'], urgency_stats['warning'],
+         urgency_stats['info'], urgency_stats['safe']]
+    )
     
     context = {
         'total_products': len(df),
         'category_stats': category_stats.to_dict(),
         'urgency_stats': urgency_stats,
-        'graphic': graphic,
+        'category_chart': category_chart,
+        'urgency_chart': urgency_chart,
         'avg_days_left': df['days_left'].mean(),
         'min_days_left': df['days_left'].min(),
         'max_days_left': df['days_left'].max(),
     }
-    
-    return render(request, 'product_statistics.html', context)
+    return context
 
 
 @login_required
-def recommendations(request):
-    user_products = Product.objects.filter(
-        user=request.user,
+@read_from_replica
+@user_page_condition
+async def recommendations(request):
+    user = await request.auser()
+    context = await acached_for_user(
+        user.pk, 'recommendations', lambda: _recommendations_context(user)
+    )
+    return await arender(request, 'recommendations.html', context)
+
+
+async def _recommendations_context(user):
+    user_products = Product.objects.for_user(user).filter(
         status='active',
         expiration_date__gte=timezone.now().date()
     )
     
-    recommendations_list = get_recommendations(request.user)
-    if user_products.exists():
-        data = []
-        for p in user_products:
-            data.append({
-                'name': p.name,
-                'days_left': p.days_remaining,
-                'category': p.category.name if p.category else 'Без категории',
-            })
-        
-        df = pd.DataFrame(data)
-
+    recommendations_list = await aget_recommendations(user)
+    df = await aproducts_frame(user_products, ('name', 'category'))
+    if not df.empty:
         soon_expiring = df[df['days_left'] <= 3]
         if not soon_expiring.empty:
             category_rec = soon_expiring['category'].mode()
@@ -343,7 +435,7 @@ def recommendations(request):
 
                 recommendations_list.insert(0, {
                     'product': None,
-                    'template': type('obj', (object,), personal_recommendation),
+                    'template': SimpleNamespace(**personal_recommendation),
                     'days_remaining': 0,
                     'urgency': 'urgent'
                 })
@@ -352,71 +444,13 @@ def recommendations(request):
     context = {
         'recommendations': recommendations_list,
         'total_recommendations': len(recommendations_list),
-        'expiring_count': user_products.filter(
+        'expiring_count': await user_products.filter(
             expiration_date__lte=timezone.now().date() + timedelta(days=3)
-        ).count(),
+        ).acount(),
         # 'monthly_savings': money_saved,
         'saved_products': len(recommendations_list),
     }
-    return render(request, 'recommendations.html', context)
-
-
-def get_recommendations(user):
-    recommendations = []
-    today = timezone.now().date()
-    
-    user_products = Product.objects.filter(
-        user=user,
-        status='active'
-    ).select_related('category')
-    
-    for product in user_products:
-        days_remaining = (product.expiration_date - today).days
-        if days_remaining <= 0:
-            recommendations.append({
-                'product': product,
-                'template': type('obj', (object,), {
-                    'title': 'Продукт просрочен!',
-                    'text': f'Продукт "{product.name}" уже просрочен. Рекомендуем проверить его состояние и выбросить, если испорчен.',
-                    'icon': 'fas fa-skull-crossbones',
-                    'action_text': 'Удалить продукт',
-                    'action_link': f'/products/{product.id}/delete/'
-                }),
-                'days_remaining': days_remaining,
-                'urgency': 'danger'
-            })
-        elif days_remaining <= 2:
-            recommendations.append({
-                'product': product,
-                'template': type('obj', (object,), {
-                    'title': 'Срочно используйте!',
-                    'text': f'Продукт "{product.name}" истекает через {days_remaining} дня. '
-                           f'Рекомендуем использовать сегодня.',
-                    'icon': 'fas fa-exclamation-triangle',
-                    'action_text': 'Отметить использованным',
-                    'action_link': f'/products/{product.id}/mark_used/'
-                }),
-                'days_remaining': days_remaining,
-                'urgency': 'warning'
-            })
-        elif days_remaining <= 7:
-            recommendations.append({
-                'product': product,
-                'template': type('obj', (object,), {
-                    'title': 'Запланируйте использование',
-                    'text': f'Продукт "{product.name}" истекает через {days_remaining} дней. '
-                           f'Рекомендуем запланировать его использование на этой неделе.',
-                    'icon': 'fas fa-calendar-check',
-                    'action_text': 'Посмотреть рецепты',
-                    'action_link': f'https://www.russianfood.com/search/?query={product.name}'
-                }),
-                'days_remaining': days_remaining,
-                'urgency': 'info'
-            })
-    
-    recommendations.sort(key=lambda x: x['days_remaining'])
-    
-    return recommendations
+    return context
 
 
 def register(request):
@@ -446,7 +480,8 @@ def user_login(request):
         if form.is_valid():
             user = form.get_user()
             login(request, user)
-            
+            # Срок задаётся после login(): при входе другого пользователя
+            # login() очищает сессию вместе с заданным ранее сроком
             remember_me = request.POST.get('remember_me', False)
             if not remember_me:
                 request.session.set_expiry(0)
@@ -466,4 +501,62 @@ def user_login(request):
 def user_logout(request):
     logout(request)
     messages.info(request, 'Вы успешно вышли из системы.')
-    return redirect('index')
\ No newline at end of file
+    return redirect('index')
+
+@login_required
+@read_from_replica
+@user_page_condition
+async def recipes(request):
+    """Рецепты, в которые уходит больше всего скоро истекающих продуктов."""
+    user = await request.auser()
+    product_id = request.GET.get('product', '')
+    product = None
+    if product_id.isdigit():
+        product = await Product.objects.for_user(user).filter(pk=product_id, status='active').afirst()
+    context = await acached_for_user(
+        user.pk, 'recipes', lambda: _recipes_context(user, product), product and product.pk
+    )
+    return await arender(request, 'recipes.html', context)
+
+
+async def _recipes_context(user, product):
+    today = timezone.now().date()
+    products = [
+        p async for p in Product.objects.for_user(user)
+        .filter(status='active', expiration_date__gte=today)
+        .only('name', 'expiration_date', 'priority')
+    ]
+    matches = await sync_to_async(recipes_for_products)(
+        products, today, limit=20, required=product and product.name
+    )
+    return {'recipes': matches, 'product': product}
+
+
+def calendar_feed(request, token):
+    """Лента .ics для календарных приложений: доступ по секретной ссылке, без входа."""
+    user_id = feed_user_id(token)
+    if user_id is None:
+        raise Http404
+    # Лента читается с основной базы: кэш помечается текущим поколением,
+    # и отставшая реплика закрепила бы в нём устаревшие данные
+    feed = get_feed(user_id)
+    last_modified = feed['modified'] and int(feed['modified'].timestamp())
+    response = get_conditional_response(request, etag=feed['etag'], last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(feed['body'], content_type='text/calendar; charset=utf-8')
+    response.headers.setdefault('ETag', feed['etag'])
+    if last_modified:
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+def calendar_settings(request):
+    feed = feed_for_user(request.user)
+    if request.method == 'POST':
+        reset_token(feed)
+        messages.success(request, 'Ссылка на календарь обновлена. Старая ссылка больше не работает.')
+        return redirect('calendar')
+    feed_url = request.build_absolute_uri(reverse('calendar_feed', args=[feed.token]))
+    return render(request, 'calendar.html', {'feed_url': feed_url})